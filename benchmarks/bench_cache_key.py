@@ -0,0 +1,57 @@
+"""
+Microbenchmark for cache key construction. Compares the previous implementation (module lookup and md5 of the string
+representation of the arguments on every call) with the precomputed prefix and the canonical fingerprint.
+
+Usage: python -m benchmarks.bench_cache_key
+"""
+import hashlib
+import os
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from update_cache.cache.cache import CACHE_KEY_PREFIX  # noqa: E402
+from update_cache.decorators import cache_function  # noqa: E402
+from update_cache.utils import get_func_name  # noqa: E402
+
+
+@cache_function()
+def cached(*args, **kwargs):
+    pass
+
+
+def legacy_make_cache_key(f, calling_args=None):
+    func_name = get_func_name(f)
+    arg_part = hashlib.md5(str(calling_args).encode(), usedforsecurity=False).hexdigest()
+    return ':'.join([CACHE_KEY_PREFIX, func_name, arg_part])
+
+
+CASES = {
+    'no args': ((), {}),
+    'small args': ((1, 'foo'), {'page': 2}),
+    'kwargs': ((), {'page': 1, 'ordering': 'name', 'filters': {'category': 3, 'in_stock': True}}),
+    'list of 10k ints': ((list(range(10000)),), {}),
+    'dict of 1k items': (({f'key{i}': i for i in range(1000)},), {}),
+    'long string': (('x' * 100000,), {}),
+}
+
+
+def measure(func, repeat=5):
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    print(f'{"case":<20}{"legacy (us)":>14}{"current (us)":>14}{"speedup":>10}')
+    for name, calling_args in CASES.items():
+        legacy = measure(lambda: legacy_make_cache_key(cached, calling_args))
+        current = measure(lambda: cached.cache.make_key(calling_args))
+        print(f'{name:<20}{legacy * 1e6:>14.2f}{current * 1e6:>14.2f}{legacy / current:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
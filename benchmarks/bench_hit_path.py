@@ -0,0 +1,60 @@
+"""
+Microbenchmark of the overhead of diagnostics on the hit path of a cached function, on a local cache hit so the
+overhead isn't hidden by the cache backend. Compares tracing turned off, a sampled trace and tracing every call, with
+logging filtered out as in production, and the previous implementation (an f-string and a `logger.info` call per
+lookup).
+
+Usage: python -m benchmarks.bench_hit_path
+"""
+import logging
+import os
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from update_cache.decorators import cache_function  # noqa: E402
+
+
+logger = logging.getLogger('update_cache.cache.update')
+
+
+@cache_function(local_cache=True)
+def cached(*args, **kwargs):
+    return list(range(10))
+
+
+def legacy_hit():
+    # The hit path used to log the lookup before getting the entry
+    key = cached.cache.make_key(((1,), {}))
+    logger.info(f'Retrieving active cache for {key}')
+    return cached(1)
+
+
+def measure(func, repeat=5):
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    cached(1)
+    baseline = measure(lambda: cached(1))
+    print(f'{"case":<28}{"hit (us)":>10}{"overhead (us)":>16}')
+    print(f'{"tracing off":<28}{baseline * 1e6:>10.2f}{0:>16.2f}')
+    legacy = measure(legacy_hit)
+    print(f'{"logger.info per lookup":<28}{legacy * 1e6:>10.2f}{(legacy - baseline) * 1e6:>16.2f}')
+    for rate in (0.01, 1):
+        with override_settings(DUC_TRACE_SAMPLE_RATE=rate):
+            traced = measure(lambda: cached(1))
+        name = f'trace sample rate {rate}'
+        print(f'{name:<28}{traced * 1e6:>10.2f}{(traced - baseline) * 1e6:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
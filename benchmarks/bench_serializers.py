@@ -0,0 +1,84 @@
+"""
+Benchmark of the payload size and the encode/decode latency of cache results per codec, compared to handing the cache
+result to the cache backend as is (pickled with the default protocol by the backend). Codecs whose dependencies are not
+installed are skipped.
+
+Usage: python -m benchmarks.bench_serializers
+"""
+import datetime
+import os
+import pickle
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from update_cache.cache.cache import CacheResult  # noqa: E402
+from update_cache.cache.serializers import COMPRESSORS, SERIALIZERS, Codec, loads  # noqa: E402
+
+
+def make_result(result):
+    return CacheResult(
+        result=result,
+        expires=datetime.datetime(2023, 12, 1, 10, 5, tzinfo=datetime.timezone.utc),
+        calling_args=[[1], {'page': 2}],
+        delta=0.25
+    )
+
+
+CASES = {
+    'small list': make_result(['Lorem', 'Ipsum', 'Dolor']),
+    'list of 10k ints': make_result(list(range(10000))),
+    'dict of 1k items': make_result({f'key{i}': f'value {i}' for i in range(1000)}),
+    'list of 1k records': make_result([
+        {'id': i, 'name': f'Product {i}', 'price': i * 1.5, 'tags': ['foo', 'bar']} for i in range(1000)
+    ]),
+    'html of 100kb': make_result('<div class="item">Lorem ipsum dolor sit amet</div>\n' * 2000),
+}
+
+
+def get_codecs():
+    codecs = {}
+    for serializer_name, serializer_class in SERIALIZERS.items():
+        try:
+            serializer = serializer_class()
+        except ImportError:
+            continue
+        codecs[serializer_name] = Codec(serializer)
+        for compressor_name, compressor_class in COMPRESSORS.items():
+            try:
+                codecs[f'{serializer_name}+{compressor_name}'] = Codec(serializer, compressor_class(min_size=0))
+            except ImportError:
+                continue
+    return codecs
+
+
+def measure(func, repeat=5):
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main():
+    codecs = get_codecs()
+    print(f'{"case":<20}{"codec":<16}{"size (bytes)":>14}{"encode (us)":>14}{"decode (us)":>14}')
+    for name, result in CASES.items():
+        payload = pickle.dumps(result)
+        encode = measure(lambda: pickle.dumps(result))
+        decode = measure(lambda: pickle.loads(payload))
+        print(f'{name:<20}{"backend pickle":<16}{len(payload):>14}{encode * 1e6:>14.2f}{decode * 1e6:>14.2f}')
+        for codec_name, codec in codecs.items():
+            try:
+                payload = codec.dumps(result)
+            except TypeError:
+                # The result has types the serializer doesn't support
+                continue
+            encode = measure(lambda: codec.dumps(result))
+            decode = measure(lambda: loads(payload))
+            print(f'{"":<20}{codec_name:<16}{len(payload):>14}{encode * 1e6:>14.2f}{decode * 1e6:>14.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Load harness for cached functions under concurrency. Threads in one or more processes call a slow cached function with
+a small set of keys against a cache backend shared by all processes (the file cache or the SQLite database cache), all
+starting at the same moment so the first calls stampede.
+
+Reports how many times the function actually ran (per key, with the number of distinct keys as the ideal), the
+latencies of the calls, errors, and whether the index of the function lists every key that was written.
+
+Usage: python -m benchmarks.load [--backend file|db] [--processes 4] [--threads 8] [--calls 50] [--keys 10]
+                                 [--delay 0.05] [--timeout 300] [--single-flight] [--json results.json]
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+
+from update_cache.decorators import cache_function  # noqa: E402
+
+
+BACKENDS = {
+    'file': 'file',
+    'db': 'db',
+}
+
+# Runs of the function in this process per key
+runs = collections.Counter()
+
+runs_lock = threading.Lock()
+
+
+def make_function(options):
+    def load(key):
+        with runs_lock:
+            runs[key] += 1
+        time.sleep(options['delay'])
+        return [key] * 100
+
+    load.__qualname__ = 'load_single_flight' if options['single_flight'] else 'load'
+    return cache_function(timeout=options['timeout'], backend=BACKENDS[options['backend']],
+                          single_flight=options['single_flight'])(load)
+
+
+def run_process(options, process_id):
+    """
+    Calls the function from `threads` threads, returns the runs per key, the latencies and the errors of the calls.
+    """
+    f = make_function(options)
+    latencies = []
+    errors = collections.Counter()
+    lock = threading.Lock()
+
+    def run_thread(thread_id):
+        rng = random.Random(process_id * 1000 + thread_id)
+        thread_latencies = []
+        # Start all threads of all processes at the same time
+        time.sleep(max(0.0, options['start_at'] - time.time()))
+        for _ in range(options['calls']):
+            key = rng.randrange(options['keys'])
+            started = time.perf_counter()
+            try:
+                f(key)
+            except Exception as e:
+                with lock:
+                    errors[type(e).__name__] += 1
+                continue
+            thread_latencies.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(thread_latencies)
+
+    threads = [threading.Thread(target=run_thread, args=(i,)) for i in range(options['threads'])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(runs), latencies, dict(errors)
+
+
+def percentile(values, percent):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def check_index(options):
+    """
+    The keys that were written but are missing from the index of the function.
+    """
+    f = make_function(options)
+    keys = [f.cache.make_key(((key,), {})) for key in range(options['keys'])]
+    written = [key for key in keys if f.cache.get(key, None) is not None]
+    indexed = set(f.cache)
+    return len(written), [key for key in written if key not in indexed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive a cached function from many threads and processes')
+    parser.add_argument('--backend', choices=list(BACKENDS), default='file')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='threads per process')
+    parser.add_argument('--calls', type=int, default=50, help='calls per thread')
+    parser.add_argument('--keys', type=int, default=10, help='number of distinct arguments')
+    parser.add_argument('--delay', type=float, default=0.05, help='seconds the function takes')
+    parser.add_argument('--timeout', type=int, default=300, help='cache timeout of the function')
+    parser.add_argument('--single-flight', action='store_true')
+    parser.add_argument('--json', help='write the results as JSON to this file')
+    options = vars(parser.parse_args())
+
+    if options['backend'] == 'db':
+        call_command('migrate', verbosity=0)
+        call_command('createcachetable', 'benchmark_cache', verbosity=0)
+    caches[BACKENDS[options['backend']]].clear()
+
+    # The processes share the directory of the file and database caches
+    os.environ['DUC_BENCHMARK_DIR'] = settings.BENCHMARK_DIR
+    # Leave the processes time to start and set up Django
+    options['start_at'] = time.time() + 2
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=options['processes'],
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        results = list(executor.map(run_process, [options] * options['processes'], range(options['processes'])))
+    duration = time.perf_counter() - started
+
+    total_runs = collections.Counter()
+    latencies = []
+    errors = collections.Counter()
+    for process_runs, process_latencies, process_errors in results:
+        total_runs.update(process_runs)
+        latencies.extend(process_latencies)
+        errors.update(process_errors)
+    written, lost = check_index(options)
+
+    report = {
+        'options': options,
+        'duration': duration,
+        'calls': options['processes'] * options['threads'] * options['calls'],
+        'runs': sum(total_runs.values()),
+        'ideal_runs': len(total_runs),
+        'max_runs_per_key': max(total_runs.values(), default=0),
+        'latency': {
+            'mean': statistics.mean(latencies) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies, default=None),
+        },
+        'errors': dict(errors),
+        'written_keys': written,
+        'lost_index_keys': lost,
+    }
+
+    print(f'{report["calls"]} calls in {duration:.2f}s from {options["processes"]} processes x {options["threads"]} '
+          f'threads on the {options["backend"]} cache')
+    print(f'function runs: {report["runs"]} (ideal {report["ideal_runs"]}, at most {report["max_runs_per_key"]} '
+          f'for one key)')
+    if latencies:
+        print('latency (ms): ' + ', '.join(f'{name} {value * 1000:.1f}' for name, value in report['latency'].items()))
+    print(f'errors: {sum(errors.values())}' + (f' {dict(errors)}' if errors else ''))
+    print(f'index: {len(lost)} of {written} written keys missing')
+
+    if options['json']:
+        with open(options['json'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    # Run from the imported module, so the function has the same name in the main process as in the workers
+    from benchmarks.load import main
+
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmark suite for the per-call overhead of `cache_function` and `cache_view` on active hits, stale hits and misses,
+for each cache backend in `benchmarks.settings` (locmem, database, file and, when fakeredis is installed, Redis).
+Cases vary the size of the arguments, the size of the result and the number of keys in the index. Stale hits use a
+broker that does nothing, so only the overhead of serving the expired result is measured.
+
+Results are printed as a table, and written as JSON with `--json`, to compare runs across commits.
+
+Usage: python -m benchmarks.run [--backends locmem db file redis] [--quick] [--json results.json]
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from update_cache.cache.cache import CacheResult  # noqa: E402
+from update_cache.decorators import cache_function, cache_view  # noqa: E402
+
+
+BACKENDS = {
+    'locmem': 'default',
+    'db': 'db',
+    'file': 'file',
+    'redis': 'redis',
+}
+
+ARGS = {
+    'small': (1, 'foo'),
+    'list of 1k ints': (list(range(1000)),),
+}
+
+PAYLOADS = {
+    '100 B': 'x' * 100,
+    '100 kB': 'x' * 100000,
+}
+
+INDEX_SIZES = (0, 10000)
+
+PATHS = ('hit', 'stale', 'miss')
+
+
+def noop_broker(f, timeout, calling_args=None, backend=None):
+    pass
+
+
+def make_function(backend, payload_name, payload, index_size):
+    def f(*args):
+        return payload
+
+    # Every case gets its own cached function
+    f.__qualname__ = f'{backend}_{payload_name.replace(" ", "_")}_{index_size}'
+    return cache_function(timeout=3600, backend=BACKENDS[backend], broker=noop_broker)(f)
+
+
+def make_view(backend, payload_name, payload, index_size):
+    def view(request):
+        return HttpResponse(payload, content_type='text/plain')
+
+    view.__qualname__ = f'{backend}_{payload_name.replace(" ", "_")}_{index_size}_view'
+    return cache_view(timeout=3600, backend=BACKENDS[backend], broker=noop_broker, stale_ttl=3600)(view)
+
+
+def expire(cached_function, key):
+    value = cached_function.get(key)
+    cached_function.set_active(key, CacheResult(value.result, now() - datetime.timedelta(seconds=1),
+                                                value.calling_args, value.delta))
+
+
+def fill_index(cached_function, size):
+    cached_function.index.add_many(f'{cached_function.key_prefix}:filler{i}' for i in range(size))
+
+
+def measure(func, repeat):
+    number, _ = timeit.Timer(func).autorange()
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number, number
+
+
+def bench_function(backend, payload_name, payload, index_size, repeat):
+    f = make_function(backend, payload_name, payload, index_size)
+    fill_index(f.cache, index_size)
+    counter = itertools.count()
+    for args_name, args in ARGS.items():
+        key = f.cache.make_key((args, {}))
+        f(*args)
+        cases = {
+            'hit': lambda: f(*args),
+            'stale': lambda: f(*args),
+            # Every call has new arguments
+            'miss': lambda: f(*args, next(counter)),
+        }
+        for path in PATHS:
+            if path == 'stale':
+                expire(f.cache, key)
+            seconds, number = measure(cases[path], repeat)
+            yield {'target': 'function', 'path': path, 'args': args_name, 'payload': payload_name,
+                   'index_size': index_size, 'us_per_call': seconds * 1e6, 'calls': number}
+
+
+def bench_view(backend, payload_name, payload, index_size, repeat):
+    view = make_view(backend, payload_name, payload, index_size)
+    fill_index(view.cache, index_size)
+    factory = RequestFactory()
+    request = factory.get('/bench/')
+    view(request)
+    counter = itertools.count()
+    cases = {
+        'hit': lambda: view(request),
+        'stale': lambda: view(request),
+        'miss': lambda: view(factory.get(f'/bench/?page={next(counter)}')),
+    }
+    for path in PATHS:
+        if path == 'stale':
+            expire(view.cache, view.cache.update_handler.make_key(request))
+        seconds, number = measure(cases[path], repeat)
+        yield {'target': 'view', 'path': path, 'args': 'request', 'payload': payload_name,
+               'index_size': index_size, 'us_per_call': seconds * 1e6, 'calls': number}
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the hit, stale and miss paths of cached functions and views'
+    )
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--quick', action='store_true', help='one repeat and only the smallest index')
+    parser.add_argument('--json', help='write the results as JSON to this file, - for stdout')
+    options = parser.parse_args()
+
+    repeat = 1 if options.quick else 5
+    index_sizes = INDEX_SIZES[:1] if options.quick else INDEX_SIZES
+    backends = [backend for backend in options.backends if BACKENDS[backend] in settings.CACHES]
+    if 'db' in backends:
+        call_command('migrate', verbosity=0)
+        call_command('createcachetable', 'benchmark_cache', verbosity=0)
+
+    results = []
+    out = sys.stderr if options.json == '-' else sys.stdout
+    print(f'{"backend":<8}{"target":<10}{"path":<7}{"args":<17}{"payload":<9}{"index":>7}{"us/call":>12}', file=out)
+    for backend in backends:
+        caches[BACKENDS[backend]].clear()
+        for (payload_name, payload), index_size in itertools.product(PAYLOADS.items(), index_sizes):
+            for result in itertools.chain(bench_function(backend, payload_name, payload, index_size, repeat),
+                                          bench_view(backend, payload_name, payload, index_size, repeat)):
+                result = {'backend': backend, **result}
+                results.append(result)
+                print(f'{backend:<8}{result["target"]:<10}{result["path"]:<7}{result["args"]:<17}'
+                      f'{result["payload"]:<9}{result["index_size"]:>7}{result["us_per_call"]:>12.2f}', file=out)
+
+    if options.json:
+        report = {
+            'commit': get_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'results': results,
+        }
+        if options.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(options.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
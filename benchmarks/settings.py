@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+SECRET_KEY = 'benchmarks'
+
+INSTALLED_APPS = [
+    "update_cache.apps.UpdateCacheConfig",
+]
+
+USE_TZ = True
+
+# Views are benchmarked with requests of the test client
+ALLOWED_HOSTS = ['testserver']
+
+# The database and file caches are kept in a temporary directory, unless one is given
+BENCHMARK_DIR = os.environ.get('DUC_BENCHMARK_DIR') or tempfile.mkdtemp(prefix='duc-benchmarks-')
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.path.join(BENCHMARK_DIR, 'db.sqlite3'),
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "db": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "benchmark_cache",
+        # Culling would drop index shards along with entries
+        "OPTIONS": {"MAX_ENTRIES": 1000000},
+    },
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BENCHMARK_DIR, 'file_cache'),
+        "OPTIONS": {"MAX_ENTRIES": 1000000},
+    },
+}
+
+if fakeredis is not None:
+    CACHES["redis"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+        "OPTIONS": {
+            "connection_class": fakeredis.FakeRedisConnection
+        }
+    }
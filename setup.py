@@ -14,6 +14,8 @@ setup(name='django-update-cache',
          include=[
              'update_cache',
              'update_cache.cache',
+             'update_cache.management',
+             'update_cache.management.commands',
              'update_cache.migrations'
          ]
      ),
@@ -1,8 +1,10 @@
+import os
 import random
 from string import ascii_uppercase
 
 from django.utils.crypto import get_random_string
 from update_cache.brokers import async_broker
+from update_cache.cache.local import LocalCache
 from update_cache.decorators import cache_function
 
 
@@ -38,3 +40,78 @@ def create_random_words(num: int):
     for i in range(num):
         result.append(random.choice(words))
     return result
+
+
+@cache_function(backend='locmem', single_flight=True)
+def create_random_sentences(num: int):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append(' '.join(random.choice(words) for _ in range(5)))
+    return result
+
+
+@cache_function(backend='locmem', local_cache=LocalCache(max_entries=2))
+def create_random_paragraphs(num: int):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append(' '.join(random.choice(words) for _ in range(25)))
+    return result
+
+
+@cache_function(backend='locmem', key_func=lambda num, trace_id=None: num)
+def create_random_titles(num: int, trace_id: str = None):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append(' '.join(random.choice(words) for _ in range(3)).title())
+    return result
+
+
+@cache_function(backend='locmem')
+async def create_random_quotes(num: int):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append(' '.join(random.choice(words) for _ in range(10)))
+    return result
+
+
+@cache_function(backend='locmem', broker=async_broker, early_refresh=True, jitter=0.1)
+def create_random_names(num: int):
+    result = []
+    for i in range(num):
+        result.append(random.choice(ascii_uppercase) + get_random_string(7).lower())
+    return result
+
+
+@cache_function(backend='locmem', serializer='json', compressor='zlib')
+def create_random_labels(num: int):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append('-'.join(random.choice(words) for _ in range(2)).lower())
+    return result
+
+
+@cache_function(backend='locmem', tags=('catalog',))
+def create_random_products(num: int):
+    words = ('Lorem', 'Ipsum', 'Dolor')
+    result = []
+    for i in range(num):
+        result.append(random.choice(words))
+    return result
+
+
+@cache_function(backend='locmem', tags=lambda num: ['catalog', f'prices:{num}'])
+def create_random_prices(num: int):
+    result = []
+    for i in range(num):
+        result.append(random.randint(1, 100))
+    return result
+
+
+@cache_function(backend='file')
+def get_process_id():
+    return os.getpid()
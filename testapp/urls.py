@@ -12,6 +12,14 @@ urlpatterns = [
     path('low_numbers/', views.low_numbers),
     path('lowercase_letters/', views.LowerCaseLetters.as_view()),
     path('lorem_words/', views.lorem_words),
+    path('async_strings/', views.async_strings),
+    path('compressed_strings/', views.compressed_strings),
+    path('gzipped_strings/', views.gzipped_strings),
+    path('stale_strings/', views.stale_strings),
+    path('stale_user_strings/', views.stale_user_strings),
+    path('stale_numbers/', views.stale_numbers),
+    path('variant_strings/', views.variant_strings),
+    path('paged_strings/', views.paged_strings),
     path('error/', views.error),
     path('with_cookie/', views.with_cookie),
     path('private_cache/', views.private_cache),
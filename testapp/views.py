@@ -1,9 +1,13 @@
+import gzip
+
 from django.http.response import HttpResponse, StreamingHttpResponse
 from django.template.response import TemplateResponse
 from django.utils.decorators import method_decorator
+from django.views.decorators.vary import vary_on_cookie
 from rest_framework import renderers
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from update_cache.brokers import async_view_broker
 from update_cache.decorators import cache_view
 
 from testapp import cached_functions
@@ -61,6 +65,62 @@ def lorem_words(request):
     return StreamingHttpResponse(_stream())
 
 
+@cache_view(backend='locmem')
+async def async_strings(request):
+    content = utils.create_random_strings(100)
+    return HttpResponse('\n'.join(content), content_type='text/plain')
+
+
+@cache_view(backend='locmem', encodings=('gzip',))
+def compressed_strings(request):
+    content = utils.create_random_strings(100)
+    response = HttpResponse('\n'.join(content), content_type='text/plain')
+    response['ETag'] = '"strings"'
+    return response
+
+
+@cache_view(backend='locmem')
+def gzipped_strings(request):
+    content = utils.create_random_strings(100)
+    response = HttpResponse(gzip.compress('\n'.join(content).encode()), content_type='text/plain')
+    response['Content-Encoding'] = 'gzip'
+    response['X-Custom'] = 'foo'
+    return response
+
+
+@cache_view(timeout=60, backend='locmem', stale_ttl=60)
+def stale_strings(request):
+    content = utils.create_random_strings(100)
+    return HttpResponse('\n'.join(content), content_type='text/plain')
+
+
+@cache_view(timeout=60, backend='locmem', stale_ttl=60)
+@vary_on_cookie
+def stale_user_strings(request):
+    content = utils.create_random_strings(100)
+    return HttpResponse('\n'.join(content), content_type='text/plain')
+
+
+@cache_view(timeout=60, backend='locmem', broker=async_view_broker, stale_ttl=60)
+def stale_numbers(request):
+    content = utils.create_random_numbers(100)
+    return TemplateResponse(request, 'numbers.txt', context={'content': '\n'.join(content)}, content_type='text/plain')
+
+
+@cache_view(backend='locmem')
+def variant_strings(request):
+    content = utils.create_random_strings(100)
+    response = HttpResponse('\n'.join(content), content_type='text/plain')
+    response['Vary'] = 'X-Variant'
+    return response
+
+
+@cache_view(backend='locmem', key_headers=('X-Tenant',), key_params=('page',))
+def paged_strings(request):
+    content = utils.create_random_strings(100)
+    return HttpResponse('\n'.join(content), content_type='text/plain')
+
+
 @cache_view()
 def error(request):
     content = utils.create_random_strings(100)
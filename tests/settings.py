@@ -1,4 +1,7 @@
 import os
+import tempfile
+
+import fakeredis
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -68,6 +71,21 @@ CACHES = {
     },
     "dummy": {
         "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+    },
+    "locmem": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+    },
+    # Shared with worker processes
+    "file": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(tempfile.gettempdir(), "duc-tests-cache")
+    },
+    "redis": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": "redis://127.0.0.1:6379/1",
+        "OPTIONS": {
+            "connection_class": fakeredis.FakeRedisConnection
+        }
     }
 }
 
@@ -3,11 +3,11 @@ from unittest import mock
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth.models import User
 from django.http import Http404
-from django.test import RequestFactory
+from django.test import RequestFactory, override_settings
 from django.test.testcases import TestCase
 from update_cache import admin
-from update_cache.cache.cache import make_cache_key, missing
-from update_cache.models import CacheEntry
+from update_cache.cache.cache import ENTRY_VERSION, make_cache_key, missing
+from update_cache.models import CacheEntry, CacheEntryIterable
 from pyquery import PyQuery
 
 from testapp import cached_functions
@@ -50,15 +50,19 @@ class TestCacheEntryAdmin(TestCase):
                 ((1,), {})
             )
         ]
+        # Sorted by function, then in the order of the index
+        strings_keys = cached_functions.create_random_strings.cache.get_keys()
+        self.assertEqual(sorted(strings_keys), sorted(cache_keys[:2]))
+        expected_keys = [cache_keys[2]] + strings_keys
         row = PyQuery(rows[0])
         cache_key_cell = PyQuery(PyQuery(row.find("th"))[0])
-        self.assertEqual(cache_key_cell.text(), cache_keys[2])
+        self.assertEqual(cache_key_cell.text(), expected_keys[0])
         row = PyQuery(rows[1])
         cache_key_cell = PyQuery(PyQuery(row.find("th"))[0])
-        self.assertEqual(cache_key_cell.text(), cache_keys[1])
+        self.assertEqual(cache_key_cell.text(), expected_keys[1])
         row = PyQuery(rows[2])
         cache_key_cell = PyQuery(PyQuery(row.find("th"))[0])
-        self.assertEqual(cache_key_cell.text(), cache_keys[0])
+        self.assertEqual(cache_key_cell.text(), expected_keys[2])
 
     def test_changeview(self):
         request = self.request_factory.get('/')
@@ -92,8 +96,10 @@ class TestCacheEntryAdmin(TestCase):
         request = self.request_factory.post('/', data)
         request.user = self.user
         ma = admin.CacheEntryAdmin(CacheEntry, self.site)
-        with mock.patch.object(ma, 'message_user'):
+        with mock.patch.object(ma, 'message_user'), mock.patch.object(CacheEntryIterable, '__iter__') as mock_iter:
             ma.invalidate(request, CacheEntry.objects.all())
+        # Only the selected entries are loaded
+        mock_iter.assert_not_called()
         cache = cached_functions.create_random_strings.cache
         value = cache.get_active(cache_key, missing)
         self.assertEqual(value, missing)
@@ -120,3 +126,111 @@ class TestCacheEntryAdmin(TestCase):
         value = cache.get_expired(cache_key, missing)
         self.assertEqual(value, missing)
         self.assertEqual(CacheEntry.objects.count(), 0)
+
+    def test_changelist_paginated(self):
+        for i in range(5):
+            cached_functions.create_random_strings(i)
+        ma = admin.CacheEntryAdmin(CacheEntry, self.site)
+        ma.list_per_page = 2
+        cache_keys = cached_functions.create_random_strings.cache.get_keys()
+        self.assertEqual(len(cache_keys), 5)
+        request = self.request_factory.get('/', {'p': 3})
+        request.user = self.user
+        response = ma.changelist_view(request)
+        response.render()
+        self.assertEqual(response.status_code, 200)
+
+        doc = PyQuery(response.content)
+        rows = PyQuery(doc.find("#result_list tbody tr"))
+        self.assertEqual([PyQuery(PyQuery(row).find("th")[0]).text() for row in rows], cache_keys[4:])
+
+
+class TestCacheEntryQuerySet(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            cached_functions.create_random_strings(i)
+            cached_functions.create_random_numbers(i)
+        # In the order of their index
+        self.strings_keys = cached_functions.create_random_strings.cache.get_keys()
+        self.numbers_keys = cached_functions.create_random_numbers.cache.get_keys()
+        self.assertEqual(
+            sorted(self.strings_keys),
+            sorted(make_cache_key(cached_functions.create_random_strings, ((i,), {})) for i in range(3))
+        )
+
+    @staticmethod
+    def get_entry(f, num):
+        cache_key = make_cache_key(f, ((num,), {}))
+        return next(entry for entry in CacheEntry.objects.all() if entry.cache_key == cache_key)
+
+    def test_slice(self):
+        entries = CacheEntry.objects.all()[2:4]
+        self.assertEqual([entry.cache_key for entry in entries], self.numbers_keys[2:] + self.strings_keys[:1])
+        self.assertEqual(entries[0].cache_key, self.numbers_keys[2])
+
+    def test_slice_loads_visible_entries(self):
+        numbers_cache = cached_functions.create_random_numbers.cache
+        strings_cache = cached_functions.create_random_strings.cache
+        with mock.patch.object(numbers_cache, 'get_many_meta', wraps=numbers_cache.get_many_meta) as numbers_meta, \
+                mock.patch.object(strings_cache, 'get_many_meta', wraps=strings_cache.get_many_meta) as strings_meta, \
+                mock.patch.object(strings_cache, 'get_many') as strings_get_many, \
+                mock.patch.object(strings_cache.index, 'slice', wraps=strings_cache.index.slice) as strings_slice:
+            entries = list(CacheEntry.objects.all()[4:5])
+        self.assertEqual([entry.cache_key for entry in entries], self.strings_keys[1:2])
+        # Only the listed part of the index is read
+        strings_slice.assert_called_once_with(1, 2)
+        numbers_meta.assert_not_called()
+        strings_meta.assert_called_once_with(self.strings_keys[1:2])
+        # The payloads are not loaded
+        strings_get_many.assert_not_called()
+
+    def test_metadata(self):
+        entry = self.get_entry(cached_functions.create_random_strings, 2)
+        self.assertEqual(entry.result_type, 'builtins.list')
+        # Previews are not made by default
+        self.assertEqual((entry.calling_args, entry.value), ('', ''))
+        self.assertIsNone(entry.size)
+
+    @override_settings(DUC_ENTRY_PREVIEWS=True)
+    def test_metadata_with_previews(self):
+        cached_functions.create_random_strings.cache.delete(
+            make_cache_key(cached_functions.create_random_strings, ((2,), {}))
+        )
+        result = cached_functions.create_random_strings(2)
+        entry = self.get_entry(cached_functions.create_random_strings, 2)
+        self.assertEqual(entry.calling_args, '((2,), {})')
+        self.assertEqual(entry.value[:10], repr(result)[:10])
+        self.assertLessEqual(len(entry.value), 100)
+
+    def test_without_metadata(self):
+        cache = cached_functions.create_random_strings.cache
+        result = cached_functions.create_random_strings(2)
+        cache.cache.delete(cache._make_meta_key(make_cache_key(cached_functions.create_random_strings, ((2,), {}))),
+                           version=ENTRY_VERSION)
+        entry = self.get_entry(cached_functions.create_random_strings, 2)
+        self.assertEqual(entry.result_type, 'builtins.list')
+        self.assertEqual(entry.value[:10], repr(result)[:10])
+
+    def test_load_value(self):
+        result = cached_functions.create_random_strings(2)
+        entry = self.get_entry(cached_functions.create_random_strings, 2)
+        entry.load_value()
+        self.assertEqual(entry.value, str(result))
+        self.assertEqual(entry.calling_args, '((2,), {})')
+
+    def test_count(self):
+        with mock.patch.object(CacheEntryIterable, '__iter__') as mock_iter:
+            self.assertEqual(CacheEntry.objects.count(), 6)
+            self.assertEqual(CacheEntry.objects.all()[4:10].count(), 2)
+            self.assertEqual(CacheEntry.objects.all()[1:3].count(), 2)
+        mock_iter.assert_not_called()
+
+    def test_get_entries(self):
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
+        with mock.patch.object(CacheEntryIterable, '__iter__') as mock_iter:
+            entries = CacheEntry.objects.get_entries([cache_key, cache_key, 'duc:testapp.cached_functions.unknown:foo'])
+        mock_iter.assert_not_called()
+        self.assertEqual([entry.cache_key for entry in entries], [cache_key])
+        self.assertIs(entries[0].cached_function, cached_functions.create_random_strings.cache)
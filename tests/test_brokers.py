@@ -0,0 +1,141 @@
+import os
+import threading
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from django.utils.module_loading import import_string
+from freezegun import freeze_time
+from update_cache import brokers
+from update_cache.cache.cache import make_cache_key, missing
+
+from testapp import cached_functions
+from testapp.cached_functions import random
+
+
+class TestAsyncBroker(TestCase):
+
+    @mock.patch.object(brokers, 'enqueue')
+    @mock.patch.object(random, 'choice')
+    def test_enqueue_once_per_key(self, get_choice, mock_enqueue):
+        get_choice.side_effect = ['A', 'B']
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_letters(1)
+        with freeze_time('2023-12-01T10:05:00Z'):
+            cached_functions.create_random_letters(1)
+        with freeze_time('2023-12-01T10:05:01Z'):
+            for _ in range(3):
+                result = cached_functions.create_random_letters(1)
+        self.assertEqual(result, ['A'])
+        # Only one refresh job should have been enqueued
+        self.assertEqual(mock_enqueue.call_count, 1)
+
+        # Running the job clears the pending marker
+        cache = cached_functions.create_random_letters.cache
+        cache_key = make_cache_key(cached_functions.create_random_letters, ((1,), {}))
+        with freeze_time('2023-12-01T10:05:02Z'):
+            self.assertFalse(cache.mark_refresh_pending(cache_key, 60))
+            mock_enqueue.call_args.args[0](*mock_enqueue.call_args.args[1:])
+            self.assertEqual(cache.get_active(cache_key).result, ['B'])
+            self.assertTrue(cache.mark_refresh_pending(cache_key, 60))
+
+    @mock.patch.object(brokers, 'enqueue')
+    def test_enqueue_failure_clears_marker(self, mock_enqueue):
+        mock_enqueue.side_effect = ConnectionError()
+        cache_key = make_cache_key(cached_functions.create_random_letters, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            with self.assertRaises(ConnectionError):
+                brokers.async_broker(cached_functions.create_random_letters, 300, ((1,), {}))
+            self.assertTrue(cached_functions.create_random_letters.cache.mark_refresh_pending(cache_key, 60))
+
+
+class TestThreadPoolBroker(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(random, 'choice')
+    def test_refresh_in_background(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        broker = brokers.ThreadPoolBroker(max_workers=2)
+        cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+
+        broker(cached_functions.create_random_sentences, 60, ((1,), {}), 'locmem')
+        broker.shutdown()
+        self.assertEqual(cached_functions.create_random_sentences.cache.get_active(cache_key).result,
+                         [' '.join(5 * ['Lorem'])])
+        self.assertEqual(broker.in_flight, 0)
+
+    @mock.patch.object(random, 'choice')
+    def test_refresh_once_per_key(self, get_choice):
+        started, release = threading.Event(), threading.Event()
+
+        def _choice(seq):
+            started.set()
+            release.wait(5)
+            return 'Lorem'
+
+        get_choice.side_effect = _choice
+        broker = brokers.ThreadPoolBroker(max_workers=2)
+
+        for _ in range(3):
+            broker(cached_functions.create_random_sentences, 60, ((1,), {}), 'locmem')
+        started.wait(5)
+        self.assertEqual(broker.in_flight, 1)
+        release.set()
+        broker.shutdown()
+        # Only one refresh should have run
+        self.assertEqual(get_choice.call_count, 5)
+
+    @mock.patch.object(random, 'choice')
+    def test_overflow(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_sentences.cache
+        drop_broker = brokers.ThreadPoolBroker(max_workers=1, max_queue=1)
+        inline_broker = brokers.ThreadPoolBroker(max_workers=1, max_queue=1, overflow='inline')
+
+        for broker in (drop_broker, inline_broker):
+            with mock.patch.object(broker, 'get_executor') as get_executor:
+                broker(cached_functions.create_random_sentences, 60, ((1,), {}), 'locmem')
+                broker(cached_functions.create_random_sentences, 60, ((2,), {}), 'locmem')
+            self.assertEqual(get_executor.return_value.submit.call_count, 1)
+
+        # The dropped refresh never ran, the inline refresh ran in the calling thread
+        self.assertEqual(get_choice.call_count, 10)
+        self.assertNotEqual(cache.get_active(make_cache_key(cached_functions.create_random_sentences, ((2,), {}))),
+                            missing)
+
+    def test_unknown_overflow(self):
+        with self.assertRaises(ValueError):
+            brokers.ThreadPoolBroker(overflow='block')
+
+    @override_settings(DUC_DEFAULT_BROKER='update_cache.brokers.ThreadPoolBroker')
+    def test_default_broker_is_shared(self):
+        self.assertIs(brokers.get_broker(), brokers.get_broker())
+
+
+class TestProcessPoolBroker(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['file'].clear()
+
+    def test_refresh_in_worker(self):
+        broker = brokers.ProcessPoolBroker(max_workers=1)
+        cache_key = make_cache_key(cached_functions.get_process_id, ((), {}))
+
+        broker(cached_functions.get_process_id, 60, ((), {}), 'file')
+        broker.shutdown()
+        # The entry was written by the worker, through the shared cache
+        self.assertNotEqual(cached_functions.get_process_id.cache.get_active(cache_key).result, os.getpid())
+        self.assertEqual(broker.in_flight, 0)
+
+    def test_task_function(self):
+        # Workers import the function by name
+        name = brokers.ProcessPoolBroker().get_task_function(cached_functions.get_process_id)
+        self.assertEqual(name, 'testapp.cached_functions.get_process_id')
+        self.assertIs(import_string(name), cached_functions.get_process_id)
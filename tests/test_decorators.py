@@ -1,11 +1,20 @@
+import asyncio
+import datetime
 import json
+import threading
+import time
 from unittest import mock
 
+from django.core.cache import caches
 from django.test import RequestFactory
 from django.test.testcases import TestCase
 from freezegun import freeze_time
 from update_cache import brokers
-from update_cache.cache.cache import make_cache_key, make_view_cache_key, missing
+from update_cache.cache import cache as cache_module, update
+from update_cache.cache.cache import (
+    CacheResult, ENTRY_VERSION, make_cache_key, make_tag_key, make_view_cache_key, missing
+)
+from update_cache.cache.registry import invalidate_tag
 
 from testapp import cached_functions, utils, views
 from testapp.cached_functions import random
@@ -13,6 +22,10 @@ from testapp.cached_functions import random
 
 class TestDecorators(TestCase):
 
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
     @mock.patch.object(cached_functions, 'get_random_string')
     def test_cache_function(self, get_string):
         get_string.side_effect = [
@@ -20,12 +33,11 @@ class TestDecorators(TestCase):
             100 * 'b'
         ]
         cache = cached_functions.create_random_strings.cache
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = cached_functions.create_random_strings(1)
-        self.assertEqual(cache.get_active(make_cache_key(
-            cached_functions.create_random_strings, ((1,), {})
-        )).result, [100 * 'a'])
+            self.assertEqual(cache.get_active(cache_key).result, [100 * 'a'])
         self.assertEqual(get_string.call_count, 1)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = cached_functions.create_random_strings(1)
@@ -34,28 +46,163 @@ class TestDecorators(TestCase):
         self.assertEqual(result1, result2)
 
         with freeze_time('2023-12-01T10:05:00Z'):
+            self.assertEqual(cache.get_expired(cache_key).result, [100 * 'a'])
             result3 = cached_functions.create_random_strings(1)
-        self.assertEqual(cache.get_expired(make_cache_key(
-            cached_functions.create_random_strings, ((1,), {})
-        )).result, [100 * 'a'])
-        self.assertEqual(get_string.call_count, 1)
-        # 5 mins later, cache has expired, results should be still be equal
+            self.assertEqual(cache.get_active(cache_key).result, [100 * 'b'])
+        self.assertEqual(get_string.call_count, 2)
+        # 5 mins later, cache has expired, the expired result is returned while it is refreshed
         self.assertEqual(result1, result3)
 
         with freeze_time('2023-12-01T10:05:01Z'):
             result4 = cached_functions.create_random_strings(1)
-        self.assertEqual(cache.get_active(make_cache_key(
-            cached_functions.create_random_strings, ((1,), {})
-        )).result, [100 * 'b'])
         self.assertEqual(get_string.call_count, 2)
-        # Getting expired result, results should be still be equal
-        self.assertEqual(result1, result4)
+        # Cache should have been updated now
+        self.assertNotEqual(result1, result4)
 
-        with freeze_time('2023-12-01T10:05:02Z'):
-            result5 = cached_functions.create_random_strings(1)
+    @mock.patch.object(cached_functions, 'get_random_string')
+    def test_cache_function_invalidate_all(self, get_string):
+        get_string.side_effect = [
+            100 * 'a',
+            100 * 'b'
+        ]
+        cache = cached_functions.create_random_strings.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = cached_functions.create_random_strings(1)
+            cache.invalidate_all()
+            # The result of the earlier generation is returned while it is refreshed
+            result2 = cached_functions.create_random_strings(1)
+            result3 = cached_functions.create_random_strings(1)
         self.assertEqual(get_string.call_count, 2)
-        # Cache should have been updated now
-        self.assertNotEqual(result1, result5)
+        self.assertEqual(result1, result2)
+        self.assertEqual(result3, [100 * 'b'])
+
+    @mock.patch.object(cached_functions, 'get_random_string')
+    def test_cache_function_invalidate_all_while_computing(self, get_string):
+        cache = cached_functions.create_random_strings.cache
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
+
+        def invalidate_all(length):
+            cache.invalidate_all()
+            return 100 * 'a'
+
+        get_string.side_effect = invalidate_all
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_strings(1)
+            # The result was computed before the invalidation, it is written as stale
+            self.assertTrue(cache.get(cache_key).has_expired)
+
+    @mock.patch.object(cached_functions, 'get_random_string')
+    def test_cache_function_invalidate_all_while_refreshing(self, get_string):
+        cache = cached_functions.create_random_strings.cache
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
+        get_string.return_value = 100 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_strings(1)
+        with freeze_time('2023-12-01T10:05:00Z'):
+            get_string.side_effect = lambda length: cache.invalidate_all() or 100 * 'b'
+            # The expired result is refreshed by the broker
+            cached_functions.create_random_strings(1)
+            self.assertEqual(cache.get(cache_key).result, [100 * 'b'])
+            self.assertTrue(cache.get(cache_key).has_expired)
+
+    @mock.patch.object(cached_functions, 'get_random_string')
+    def test_cache_function_miss_reads_once(self, get_string):
+        get_string.return_value = 100 * 'a'
+        cache = caches['default']
+
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as mock_get_many:
+            cached_functions.create_random_strings(1)
+        # The generation read along with the entry is written with the result
+        entry_reads = [call for call in mock_get_many.call_args_list if call.kwargs.get('version') == ENTRY_VERSION]
+        self.assertEqual(len(entry_reads), 1)
+
+    @mock.patch.object(random, 'randint')
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_invalidate_tag(self, get_choice, get_int):
+        get_choice.side_effect = ['Lorem', 'Ipsum']
+        get_int.side_effect = [1, 2]
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            products1 = cached_functions.create_random_products(1)
+            prices1 = cached_functions.create_random_prices(1)
+            invalidate_tag('catalog')
+            # The results of both functions are returned while they are refreshed
+            self.assertEqual(cached_functions.create_random_products(1), products1)
+            self.assertEqual(cached_functions.create_random_prices(1), prices1)
+            self.assertEqual(cached_functions.create_random_products(1), ['Ipsum'])
+            self.assertEqual(cached_functions.create_random_prices(1), [2])
+
+    @mock.patch.object(random, 'randint')
+    def test_cache_function_invalidate_tag_from_calling_args(self, get_int):
+        get_int.side_effect = [1, 2, 3]
+        cache = cached_functions.create_random_prices.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_prices(1)
+            cached_functions.create_random_prices(2)
+            invalidate_tag('prices:1')
+            self.assertTrue(cache.get(make_cache_key(cached_functions.create_random_prices, ((1,), {}))).has_expired)
+            self.assertFalse(cache.get(make_cache_key(cached_functions.create_random_prices, ((2,), {}))).has_expired)
+            self.assertEqual(cached_functions.create_random_prices(2), [2, 3])
+        self.assertEqual(get_int.call_count, 3)
+
+    @mock.patch.object(random, 'randint')
+    def test_cache_function_invalidate_tag_while_computing(self, get_int):
+        cache = cached_functions.create_random_prices.cache
+        cache_key = make_cache_key(cached_functions.create_random_prices, ((1,), {}))
+
+        def invalidate_prices(a, b):
+            invalidate_tag('prices:1')
+            return 1
+
+        get_int.side_effect = invalidate_prices
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_prices(1)
+            # The result was computed before the invalidation, it is written as stale
+            self.assertTrue(cache.get(cache_key).has_expired)
+
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_invalidate_tag_while_refreshing(self, get_choice):
+        cache = cached_functions.create_random_products.cache
+        cache_key = make_cache_key(cached_functions.create_random_products, ((1,), {}))
+
+        def invalidate_catalog(words):
+            invalidate_tag('catalog')
+            return 'Ipsum'
+
+        get_choice.return_value = 'Lorem'
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_products(1)
+        with freeze_time('2023-12-01T10:05:00Z'):
+            get_choice.side_effect = invalidate_catalog
+            # The expired result is refreshed by the broker
+            cached_functions.create_random_products(1)
+            self.assertEqual(cache.get(cache_key).result, ['Ipsum'])
+            self.assertTrue(cache.get(cache_key).has_expired)
+
+    @mock.patch.object(random, 'randint')
+    def test_cache_function_with_tags_reads_once(self, get_int):
+        get_int.return_value = 1
+        cached_functions.create_random_prices(1)
+
+        with mock.patch.object(caches['locmem'], 'get_many', wraps=caches['locmem'].get_many) as mock_get_many:
+            cached_functions.create_random_prices(1)
+        # The versions of the tags are read along with the entry
+        mock_get_many.assert_called_once()
+
+    @mock.patch.object(random, 'randint')
+    def test_cache_function_with_lost_tag_version(self, get_int):
+        get_int.return_value = 1
+        cache = cached_functions.create_random_prices.cache
+        cache_key = make_cache_key(cached_functions.create_random_prices, ((1,), {}))
+        invalidate_tag('catalog')
+        cached_functions.create_random_prices(1)
+
+        # The version was evicted, the entry can't be trusted
+        caches['locmem'].delete(make_tag_key('catalog'), version=ENTRY_VERSION)
+        self.assertTrue(cache.get(cache_key).has_expired)
 
     @mock.patch.object(random, 'randint')
     def test_cache_function_with_custom_timeout(self, get_int):
@@ -64,12 +211,11 @@ class TestDecorators(TestCase):
             100 * '2'
         ]
         cache = cached_functions.create_random_numbers.cache
+        cache_key = make_cache_key(cached_functions.create_random_numbers, ((1,), {}))
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = cached_functions.create_random_numbers(1)
-        self.assertEqual(cache.get_active(make_cache_key(
-            cached_functions.create_random_numbers, ((1,), {})
-        )).result, [100 * '1'])
+            self.assertEqual(cache.get_active(cache_key).result, [100 * '1'])
         self.assertEqual(get_int.call_count, 1)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = cached_functions.create_random_numbers(1)
@@ -78,40 +224,29 @@ class TestDecorators(TestCase):
         self.assertEqual(result1, result2)
 
         with freeze_time('2023-12-01T10:01:00Z'):
+            self.assertEqual(cache.get_expired(cache_key).result, [100 * '1'])
             result3 = cached_functions.create_random_numbers(1)
-        self.assertEqual(cache.get_expired(make_cache_key(
-            cached_functions.create_random_numbers, ((1,), {})
-        )).result, [100 * '1'])
-        self.assertEqual(get_int.call_count, 1)
-        # 1 min later, cache has expired, results should be still be equal
+            self.assertEqual(cache.get_active(cache_key).result, [100 * '2'])
+        self.assertEqual(get_int.call_count, 2)
+        # 1 min later, cache has expired, the expired result is returned while it is refreshed
         self.assertEqual(result1, result3)
 
         with freeze_time('2023-12-01T10:01:01Z'):
             result4 = cached_functions.create_random_numbers(1)
-        self.assertEqual(cache.get_active(make_cache_key(
-            cached_functions.create_random_numbers, ((1,), {})
-        )).result, [100 * '2'])
-        self.assertEqual(get_int.call_count, 2)
-        # Getting expired result, results should be still be equal
-        self.assertEqual(result1, result4)
-
-        with freeze_time('2023-12-01T10:01:02Z'):
-            result5 = cached_functions.create_random_numbers(1)
         self.assertEqual(get_int.call_count, 2)
         # Cache should have been updated now
-        self.assertNotEqual(result1, result5)
+        self.assertNotEqual(result1, result4)
 
     @mock.patch.object(brokers, 'enqueue')
     @mock.patch.object(random, 'choice')
     def test_cache_function_with_async_broker(self, get_choice, mock_enqueue):
         get_choice.return_value = 'A'
         cache = cached_functions.create_random_letters.cache
+        cache_key = make_cache_key(cached_functions.create_random_letters, ((1,), {}))
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = cached_functions.create_random_letters(1)
-        self.assertEqual(cache.get_active(make_cache_key(
-            cached_functions.create_random_letters, ((1,), {})
-        )).result, ['A'])
+            self.assertEqual(cache.get_active(cache_key).result, ['A'])
         self.assertEqual(get_choice.call_count, 1)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = cached_functions.create_random_letters(1)
@@ -121,19 +256,11 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:05:00Z'):
             result3 = cached_functions.create_random_letters(1)
-        self.assertEqual(cache.get_expired(make_cache_key(
-            cached_functions.create_random_letters, ((1,), {})
-        )).result, ['A'])
-        self.assertEqual(get_choice.call_count, 1)
-        # 5 mins later, cache has expired, results should be still be equal
-        self.assertEqual(result1, result3)
-
-        with freeze_time('2023-12-01T10:05:01Z'):
-            result4 = cached_functions.create_random_letters(1)
+            self.assertEqual(cache.get_expired(cache_key).result, ['A'])
         self.assertEqual(get_choice.call_count, 1)
-        # Getting expired result, results should be still be equal
+        # 5 mins later, cache has expired, the expired result is returned and the refresh is enqueued
         self.assertTrue(mock_enqueue.called)
-        self.assertEqual(result1, result4)
+        self.assertEqual(result1, result3)
 
     @mock.patch.object(random, 'choice')
     def test_cache_function_with_custom_backend(self, get_choice):
@@ -150,6 +277,157 @@ class TestDecorators(TestCase):
         # After caching, results should not be equal, because we use dummy cache
         self.assertNotEqual(result1, result2)
 
+    @mock.patch.object(cached_functions, 'get_random_string')
+    def test_cache_function_many(self, get_string):
+        get_string.side_effect = [100 * 'a', 100 * 'b', 100 * 'c', 100 * 'c']
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = cached_functions.create_random_strings.many([((1,), {}), ((), {'num': 1}), ((2,), {})])
+        self.assertEqual(result1, [[100 * 'a'], [100 * 'b'], [100 * 'c', 100 * 'c']])
+        self.assertEqual(get_string.call_count, 4)
+
+        get_string.side_effect = 3 * [100 * 'd']
+        with freeze_time('2023-12-01T10:00:01Z'):
+            result2 = cached_functions.create_random_strings.many([((2,), {}), ((3,), {}), ((1,), {})])
+        # Only the new arguments should have been computed, results should be in input order
+        self.assertEqual(result2, [[100 * 'c', 100 * 'c'], 3 * [100 * 'd'], [100 * 'a']])
+        self.assertEqual(get_string.call_count, 7)
+        with freeze_time('2023-12-01T10:00:02Z'):
+            self.assertEqual(cached_functions.create_random_strings(3), 3 * [100 * 'd'])
+
+    @mock.patch.object(brokers, 'enqueue')
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_many_with_expired_results(self, get_choice, mock_enqueue):
+        get_choice.return_value = 'A'
+        cache = cached_functions.create_random_letters.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_letters.many([((1,), {}), ((2,), {})], max_workers=2)
+            for num in (1, 2):
+                cache.invalidate(make_cache_key(cached_functions.create_random_letters, ((num,), {})))
+
+        with freeze_time('2023-12-01T10:00:01Z'):
+            result = cached_functions.create_random_letters.many([((1,), {}), ((2,), {})])
+        self.assertEqual(result, [['A'], ['A', 'A']])
+        self.assertEqual(get_choice.call_count, 3)
+        # One refresh job for both expired results
+        self.assertEqual(mock_enqueue.call_count, 1)
+        self.assertEqual(mock_enqueue.call_args.args[0], brokers.sync_broker.many)
+        self.assertEqual(mock_enqueue.call_args.args[3], [((1,), {}), ((2,), {})])
+
+        get_choice.return_value = 'B'
+        with freeze_time('2023-12-01T10:00:02Z'):
+            mock_enqueue.call_args.args[0](*mock_enqueue.call_args.args[1:])
+            result = cached_functions.create_random_letters.many([((1,), {}), ((2,), {})])
+        self.assertEqual(result, [['B'], ['B', 'B']])
+
+    @mock.patch.object(brokers, 'enqueue')
+    @mock.patch.object(cache_module.random, 'random')
+    def test_cache_function_with_early_refresh(self, get_random, mock_enqueue):
+        get_random.return_value = 0.5
+        cache = cached_functions.create_random_names.cache
+        cache_key = make_cache_key(cached_functions.create_random_names, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cache.set_active(cache_key, CacheResult(
+                result=['Foo'],
+                expires=datetime.datetime(2023, 12, 1, 10, 5, tzinfo=datetime.timezone.utc),
+                calling_args=((1,), {}),
+                delta=10
+            ))
+            self.assertEqual(cached_functions.create_random_names(1), ['Foo'])
+        self.assertEqual(mock_enqueue.call_count, 0)
+
+        # Close to the expiry, a refresh is delegated while the active result is still served
+        with freeze_time('2023-12-01T10:04:55Z'):
+            self.assertEqual(cached_functions.create_random_names(1), ['Foo'])
+        self.assertEqual(mock_enqueue.call_count, 1)
+
+    @mock.patch.object(update.random, 'random')
+    def test_cache_function_with_jitter(self, get_random):
+        get_random.return_value = 0.5
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_names(1)
+            result = cached_functions.create_random_names.cache.get_active(
+                make_cache_key(cached_functions.create_random_names, ((1,), {}))
+            )
+        # 5 percent of the timeout is taken off
+        self.assertEqual(result.expires, datetime.datetime(2023, 12, 1, 10, 4, 45, tzinfo=datetime.timezone.utc))
+        self.assertIsNotNone(result.delta)
+
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_with_single_flight(self, get_choice):
+        def _choice(seq):
+            time.sleep(0.1)
+            return 'Lorem'
+
+        get_choice.side_effect = _choice
+        results = []
+
+        def _call():
+            results.append(cached_functions.create_random_sentences(1))
+
+        threads = [threading.Thread(target=_call) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Only one thread should have computed the result
+        self.assertEqual(get_choice.call_count, 5)
+        self.assertEqual(results, 5 * [[' '.join(5 * ['Lorem'])]])
+
+    @mock.patch.object(update.time, 'sleep')
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_with_single_flight_wait_for_lock_holder(self, get_choice, mock_sleep):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_sentences.cache
+        cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+        # Simulate another process computing the result
+        self.assertTrue(cache.lock(cache_key, 30).acquire())
+        mock_sleep.side_effect = lambda delay: cache.set_active(cache_key, CacheResult(
+            result=['Foo'],
+            expires=datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+        ))
+
+        result = cached_functions.create_random_sentences(1)
+        self.assertEqual(result, ['Foo'])
+        self.assertEqual(get_choice.call_count, 0)
+
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_with_single_flight_result_stored_before_lock(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_sentences.cache
+        cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+        lock = cache.lock(cache_key, 30)
+
+        def _acquire():
+            # The previous lock holder stores its result and releases the lock just before we acquire it
+            cache.set_active(cache_key, CacheResult(
+                result=['Foo'],
+                expires=datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+            ))
+            return True
+
+        with mock.patch.object(cache, 'lock', return_value=lock), mock.patch.object(lock, 'acquire', _acquire):
+            result = cached_functions.create_random_sentences(1)
+        self.assertEqual(result, ['Foo'])
+        self.assertEqual(get_choice.call_count, 0)
+
+    @mock.patch.object(update.time, 'sleep')
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_with_single_flight_lock_holder_timeout(self, get_choice, mock_sleep):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_sentences.cache
+        cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+        # Simulate another process that never finishes
+        self.assertTrue(cache.lock(cache_key, 30).acquire())
+
+        result = cached_functions.create_random_sentences(1)
+        self.assertEqual(result, [' '.join(5 * ['Lorem'])])
+        self.assertEqual(get_choice.call_count, 5)
+        self.assertTrue(mock_sleep.called)
+
     @mock.patch.object(utils, 'get_random_string')
     def test_cache_view(self, get_string):
         get_string.side_effect = 100 * [10 * 'a'] + 100 * [10 * 'b'] + 100 * [10 * 'c']
@@ -158,9 +436,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = self._get_response('/testapp/short_strings/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )).result.content.decode(), '\n'.join(100 * [10 * 'a']))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )).result.content.decode(), '\n'.join(100 * [10 * 'a']))
         self.assertEqual(get_string.call_count, 100)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = self._get_response('/testapp/short_strings/')
@@ -170,9 +448,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:05:00Z'):
             result3 = self._get_response('/testapp/short_strings/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )).result.content.decode(), '\n'.join(100 * [10 * 'b']))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )).result.content.decode(), '\n'.join(100 * [10 * 'b']))
         self.assertEqual(get_string.call_count, 200)
         # 5 mins later, cache has expired, we should get a new result
         self.assertNotEqual(result1, result3)
@@ -181,9 +459,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:01Z'):
             other_result = self._get_response('/testapp/short_strings/?foo=bar')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            other_request, 'GET'
-        )).result.content.decode(), '\n'.join(100 * [10 * 'c']))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                other_request, 'GET'
+            )).result.content.decode(), '\n'.join(100 * [10 * 'c']))
         self.assertEqual(get_string.call_count, 300)
         # Get params should give a new live result
         self.assertNotEqual(result1, other_result)
@@ -197,9 +475,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = self._get_response('/testapp/lowercase_letters/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )).result.content.decode(), json.dumps('\n'.join(100 * ['a'])))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )).result.content.decode(), json.dumps('\n'.join(100 * ['a'])))
         self.assertEqual(get_choice.call_count, 100)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = self._get_response('/testapp/lowercase_letters/')
@@ -209,9 +487,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:01:00Z'):
             result3 = self._get_response('/testapp/lowercase_letters/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )).result.content.decode(), json.dumps('\n'.join(100 * ['b'])))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )).result.content.decode(), json.dumps('\n'.join(100 * ['b'])))
         self.assertEqual(get_choice.call_count, 200)
         # 1 min later, cache has expired, we should get a new result
         self.assertNotEqual(result1, result3)
@@ -220,9 +498,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:01Z'):
             other_result = self._get_response('/testapp/lowercase_letters/?foo=bar')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            other_request, 'GET'
-        )).result.content.decode(), json.dumps('\n'.join(100 * ['c'])))
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                other_request, 'GET'
+            )).result.content.decode(), json.dumps('\n'.join(100 * ['c'])))
         self.assertEqual(get_choice.call_count, 300)
         # Get params should give a new live result
         self.assertNotEqual(result1, other_result)
@@ -284,9 +562,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = self._get_response('/testapp/error/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )), missing)
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )), missing)
         self.assertEqual(get_string.call_count, 100)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = self._get_response('/testapp/error/')
@@ -302,9 +580,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = self._get_response('/testapp/with_cookie/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )), missing)
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )), missing)
         self.assertEqual(get_string.call_count, 100)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = self._get_response('/testapp/with_cookie/')
@@ -321,9 +599,9 @@ class TestDecorators(TestCase):
 
         with freeze_time('2023-12-01T10:00:00Z'):
             result1 = self._get_response('/testapp/private_cache/')
-        self.assertEqual(cache.get_active(make_view_cache_key(
-            request, 'GET'
-        )), missing)
+            self.assertEqual(cache.get_active(make_view_cache_key(
+                request, 'GET'
+            )), missing)
         self.assertEqual(get_string.call_count, 100)
         with freeze_time('2023-12-01T10:00:01Z'):
             result2 = self._get_response('/testapp/private_cache/')
@@ -342,3 +620,88 @@ class TestDecorators(TestCase):
     def _get_streaming(self, url):
         response = self.client.get(url)
         return b''.join(response.streaming_content)
+
+
+class TestAsyncDecorators(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(random, 'choice')
+    async def test_cache_async_function(self, get_choice):
+        get_choice.side_effect = 10 * ['Lorem'] + 10 * ['Ipsum']
+        cache = cached_functions.create_random_quotes.cache
+        cache_key = make_cache_key(cached_functions.create_random_quotes, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = await cached_functions.create_random_quotes(1)
+        self.assertEqual(result1, [' '.join(10 * ['Lorem'])])
+        with freeze_time('2023-12-01T10:00:01Z'):
+            result2 = await cached_functions.create_random_quotes(1)
+        self.assertEqual(get_choice.call_count, 10)
+        # After caching, results should be equal
+        self.assertEqual(result1, result2)
+
+        with freeze_time('2023-12-01T10:05:00Z'):
+            self.assertEqual((await cache.aget_expired(cache_key)).result, result1)
+            result3 = await cached_functions.create_random_quotes(1)
+            # The expired result is refreshed in a background task, referenced until it is done
+            refresh_tasks = set(cache.update_handler._refresh_tasks)
+            self.assertEqual(len(refresh_tasks), 1)
+            await asyncio.gather(*refresh_tasks)
+            self.assertFalse(cache.update_handler._refresh_tasks)
+            self.assertEqual((await cache.aget_active(cache_key)).result, [' '.join(10 * ['Ipsum'])])
+        # 5 mins later, cache has expired, the expired result is returned while it is refreshed
+        self.assertEqual(result1, result3)
+        self.assertEqual(get_choice.call_count, 20)
+
+    @mock.patch.object(random, 'choice')
+    async def test_cache_async_function_invalidate_all_while_computing(self, get_choice):
+        cache = cached_functions.create_random_quotes.cache
+        cache_key = make_cache_key(cached_functions.create_random_quotes, ((1,), {}))
+
+        def invalidate_all(words):
+            cache.invalidate_all()
+            return 'Lorem'
+
+        get_choice.side_effect = invalidate_all
+        with freeze_time('2023-12-01T10:00:00Z'):
+            await cached_functions.create_random_quotes(1)
+            # The result was computed before the invalidation, it is written as stale
+            self.assertTrue((await cache.aget(cache_key)).has_expired)
+
+    @mock.patch.object(random, 'choice')
+    async def test_cache_async_function_shares_live_call(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        results = await asyncio.gather(*(cached_functions.create_random_quotes(2) for _ in range(5)))
+        # Only one task should have computed the result
+        self.assertEqual(get_choice.call_count, 20)
+        self.assertEqual(results, 5 * [2 * [' '.join(10 * ['Lorem'])]])
+
+    @mock.patch.object(random, 'choice')
+    def test_sync_broker_with_async_function(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache_key = make_cache_key(cached_functions.create_random_quotes, ((1,), {}))
+
+        brokers.sync_broker(cached_functions.create_random_quotes, 60, ((1,), {}))
+        self.assertEqual(cached_functions.create_random_quotes.cache.get_active(cache_key).result,
+                         [' '.join(10 * ['Lorem'])])
+
+    @mock.patch.object(utils, 'get_random_string')
+    async def test_cache_async_view(self, get_string):
+        get_string.side_effect = 100 * [10 * 'a'] + 100 * [10 * 'b']
+        cache = views.async_strings.cache
+        request = RequestFactory().get('/testapp/async_strings/')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = (await self.async_client.get('/testapp/async_strings/')).content
+            self.assertEqual((await cache.aget_active(make_view_cache_key(
+                request, 'GET'
+            ))).result.content.decode(), '\n'.join(100 * [10 * 'a']))
+        with freeze_time('2023-12-01T10:00:01Z'):
+            result2 = (await self.async_client.get('/testapp/async_strings/')).content
+        self.assertEqual(get_string.call_count, 100)
+        # After caching, results should be equal
+        self.assertEqual(result1, result2)
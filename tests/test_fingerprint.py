@@ -0,0 +1,93 @@
+import datetime
+import decimal
+import uuid
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test.testcases import TestCase
+from update_cache.cache.cache import make_cache_key
+from update_cache.cache.fingerprint import fingerprint
+
+from testapp import cached_functions
+from testapp.cached_functions import random
+
+
+class Unrepresentable:
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TestFingerprint(TestCase):
+
+    def test_dict_ordering(self):
+        self.assertEqual(
+            fingerprint(((), {'a': 1, 'b': [1, 2]})),
+            fingerprint(((), {'b': [1, 2], 'a': 1}))
+        )
+        self.assertEqual(fingerprint({1: 'a', 'b': 2}), fingerprint({'b': 2, 1: 'a'}))
+        self.assertEqual(fingerprint({3, 'a', (1, 2)}), fingerprint({(1, 2), 'a', 3}))
+
+    def test_sorted_keys(self):
+        # Dicts with their keys in sorted order and out of it, before and after the order is known
+        for _ in range(2):
+            self.assertEqual(fingerprint({'a': 1, 'b': 2}), fingerprint({'b': 2, 'a': 1}))
+        self.assertNotEqual(fingerprint({'a': 1, 'b': 2}), fingerprint({'a': 2, 'b': 1}))
+        self.assertNotEqual(fingerprint({'a': 1, 'b': 2}), fingerprint(('a', 'b', 1, 2)))
+
+    def test_types(self):
+        values = [1, '1', 1.0, True, b'1', (1,), [1], {1}, None, decimal.Decimal('1')]
+        self.assertEqual(len(set(map(fingerprint, values))), len(values))
+
+    def test_nested_boundaries(self):
+        self.assertNotEqual(fingerprint(('ab', 'c')), fingerprint(('a', 'bc')))
+        self.assertNotEqual(fingerprint([[1], 2]), fingerprint([1, [2]]))
+
+    def test_stable_values(self):
+        now = datetime.datetime(2023, 12, 1, 10, tzinfo=datetime.timezone.utc)
+        value = uuid.uuid4()
+        self.assertEqual(fingerprint((now, value)), fingerprint((now, uuid.UUID(str(value)))))
+        # Objects without a stable repr are fingerprinted by their state
+        self.assertEqual(fingerprint(Unrepresentable(1)), fingerprint(Unrepresentable(1)))
+        self.assertNotEqual(fingerprint(Unrepresentable(1)), fingerprint(Unrepresentable(2)))
+
+    def test_model_instances(self):
+        user = User.objects.create(username='foo')
+        self.assertEqual(fingerprint(user), fingerprint(User.objects.get(pk=user.pk)))
+        self.assertNotEqual(fingerprint(user), fingerprint(User.objects.create(username='bar')))
+        # Unsaved instances are told apart by their field values
+        now = datetime.datetime(2023, 12, 1, 10, tzinfo=datetime.timezone.utc)
+        self.assertNotEqual(
+            fingerprint(User(username='foo', date_joined=now)), fingerprint(User(username='bar', date_joined=now))
+        )
+        self.assertEqual(
+            fingerprint(User(username='foo', date_joined=now)), fingerprint(User(username='foo', date_joined=now))
+        )
+
+
+class TestCacheKey(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    def test_make_cache_key(self):
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
+        self.assertEqual(
+            cache_key,
+            'duc:testapp.cached_functions.create_random_strings:' + fingerprint(((1,), {}))
+        )
+
+    @mock.patch.object(random, 'choice')
+    def test_key_func(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        result1 = cached_functions.create_random_titles(1, trace_id='foo')
+        result2 = cached_functions.create_random_titles(1, trace_id='bar')
+        self.assertEqual(result1, result2)
+        self.assertEqual(get_choice.call_count, 3)
+        self.assertEqual(
+            make_cache_key(cached_functions.create_random_titles, ((1,), {'trace_id': 'foo'})),
+            'duc:testapp.cached_functions.create_random_titles:' + fingerprint(1)
+        )
@@ -0,0 +1,171 @@
+import threading
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from update_cache.cache.cache import make_cache_key
+from update_cache.cache.index import MAX_WRITE_ATTEMPTS, RedisKeyIndex, ShardedKeyIndex, get_key_index
+from update_cache.cache.locks import CacheLock
+
+from testapp import cached_functions
+
+
+class TestShardedKeyIndex(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        self.index = ShardedKeyIndex(caches['locmem'], 'duc:test', shards=4)
+
+    def test_add_and_delete(self):
+        self.index.add('foo')
+        self.index.add_many(['bar', 'baz'])
+        self.index.add('foo')
+        self.assertEqual(set(self.index), {'foo', 'bar', 'baz'})
+        self.assertEqual(len(self.index), 3)
+        self.assertIn('bar', self.index)
+
+        self.index.delete('bar')
+        self.index.delete('qux')
+        self.assertEqual(set(self.index), {'foo', 'baz'})
+        self.assertNotIn('bar', self.index)
+
+    def test_concurrent_adds(self):
+        def _add(start):
+            for i in range(start, start + 25):
+                self.index.add(f'key{i}')
+
+        threads = [threading.Thread(target=_add, args=(i * 25,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # No updates should have been lost
+        self.assertEqual(set(self.index), {f'key{i}' for i in range(100)})
+
+    @mock.patch('time.sleep')
+    def test_dropped_write(self, mock_sleep):
+        cache = caches['locmem']
+        set_ = cache.set
+        writes = []
+
+        def _set(key, value, *args, **kwargs):
+            # The first write of the shard is dropped, like the database cache does when the database is locked
+            if ':index:' in key and not key.endswith(':size'):
+                writes.append(key)
+                if len(writes) == 1:
+                    return
+            set_(key, value, *args, **kwargs)
+
+        with mock.patch.object(cache, 'set', _set):
+            self.index.add('foo')
+        self.assertEqual(len(writes), 2)
+        self.assertIn('foo', self.index)
+
+    @mock.patch('time.sleep')
+    def test_dropped_writes(self, mock_sleep):
+        cache = caches['locmem']
+        set_ = cache.set
+        writes = []
+
+        def _set(key, value, *args, **kwargs):
+            # Every write of the shard is dropped
+            if ':index:' in key and not key.endswith(':size'):
+                writes.append(key)
+                return
+            set_(key, value, *args, **kwargs)
+
+        with mock.patch.object(cache, 'set', _set), self.assertLogs('update_cache.cache.index', 'ERROR'):
+            self.index.add('foo')
+        # The writes are retried a bounded number of times
+        self.assertEqual(len(writes), MAX_WRITE_ATTEMPTS)
+        self.assertNotIn('foo', self.index)
+        # Without a marker, the next add updates the shard again
+        self.index.add('foo')
+        self.assertIn('foo', self.index)
+
+    def test_slice(self):
+        self.index.add_many([f'key{i}' for i in range(20)])
+        keys = self.index.slice(0)
+        self.assertEqual(sorted(keys), sorted(self.index))
+        self.assertEqual(len(self.index), 20)
+        self.assertEqual(self.index.slice(5, 12), keys[5:12])
+        self.assertEqual(self.index.slice(18, 30), keys[18:])
+        self.assertEqual(self.index.slice(25), [])
+
+    def test_slice_reads_visible_shards(self):
+        self.index.add_many([f'key{i}' for i in range(20)])
+        sizes = self.index._get_sizes()
+        keys = self.index.slice(0)
+        with mock.patch.object(caches['locmem'], 'get_many', wraps=caches['locmem'].get_many) as get_many:
+            self.assertEqual(self.index.slice(sizes[0], sizes[0] + 1), keys[sizes[0]:sizes[0] + 1])
+        # The sizes, then the second shard only
+        self.assertEqual(get_many.call_args_list[-1], mock.call([self.index._make_shard_key(1)]))
+
+    def test_add_indexed_key(self):
+        self.index.add('foo')
+        with mock.patch.object(self.index, '_update') as mock_update:
+            self.index.add('foo')
+        # The marker of the key is enough, its shard isn't read or written
+        mock_update.assert_not_called()
+
+    @mock.patch('time.sleep')
+    @override_settings(DUC_LOCK_WAIT_TIMEOUT=1)
+    def test_lock_not_acquired(self, mock_sleep):
+        lock_key = ':'.join([self.index._make_shard_key(self.index._get_shard('foo')), 'lock'])
+        self.assertTrue(CacheLock(caches['locmem'], lock_key, 30).acquire())
+        with self.assertLogs('update_cache.cache.index', 'WARNING'):
+            self.index.add('foo')
+        # The update is skipped, and the key is added again next time
+        self.assertNotIn('foo', self.index)
+        self.assertIsNone(caches['locmem'].get(self.index._make_marker_key('foo')))
+
+    def test_dummy_cache(self):
+        index = get_key_index(caches['dummy'], 'duc:test')
+        index.add('foo')
+        self.assertNotIn('foo', index)
+        self.assertEqual(len(index), 0)
+
+
+class TestRedisKeyIndex(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['redis'].clear()
+
+    def test_get_key_index(self):
+        self.assertIsInstance(get_key_index(caches['redis'], 'duc:test'), RedisKeyIndex)
+        self.assertIsInstance(get_key_index(caches['locmem'], 'duc:test'), ShardedKeyIndex)
+
+    def test_add_and_delete(self):
+        index = get_key_index(caches['redis'], 'duc:test')
+        index.add('foo')
+        index.add_many(['bar', 'baz'])
+        self.assertEqual(set(index), {'foo', 'bar', 'baz'})
+        self.assertEqual(len(index), 3)
+        self.assertIn('bar', index)
+
+        index.delete('bar')
+        self.assertEqual(set(index), {'foo', 'baz'})
+        self.assertNotIn('bar', index)
+
+    def test_slice(self):
+        index = get_key_index(caches['redis'], 'duc:test')
+        index.add_many([f'key{i}' for i in range(10)])
+        self.assertEqual(index.slice(0), sorted(f'key{i}' for i in range(10)))
+        self.assertEqual(index.slice(2, 4), ['key2', 'key3'])
+        self.assertEqual(index.slice(8, 20), ['key8', 'key9'])
+        self.assertEqual(index.slice(4, 4), [])
+
+
+class TestCachedFunctionIndex(TestCase):
+
+    def test_migrate_legacy_index(self):
+        cached_function = cached_functions.create_random_strings.cache
+        cache_key = make_cache_key(cached_functions.create_random_strings, ((1,), {}))
+        cached_function.cache.set(cached_function._make_key(), {cache_key}, timeout=None)
+
+        self.assertEqual(list(cached_function), [cache_key])
+        self.assertIsNone(cached_function.cache.get(cached_function._make_key()))
+        self.assertEqual(list(cached_function), [cache_key])
@@ -0,0 +1,134 @@
+from unittest import mock
+
+import fakeredis
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.cache import make_cache_key, missing
+from update_cache.cache.invalidation import (
+    CacheInvalidationBroadcaster, INVALIDATE_ALL, MAX_PUBLISH_ATTEMPTS, RedisInvalidationBroadcaster
+)
+from update_cache.cache.registry import function_cache_registry
+
+from testapp import cached_functions
+from testapp.cached_functions import random
+
+
+class TestCacheInvalidationBroadcaster(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    def test_publish_and_poll(self):
+        publisher = CacheInvalidationBroadcaster('locmem')
+        subscriber = CacheInvalidationBroadcaster('locmem')
+        self.assertEqual(subscriber.poll(), [])
+
+        publisher.publish('foo', 'duc:foo:1')
+        publisher.publish('bar')
+        self.assertEqual(subscriber.poll(), [('foo', 'duc:foo:1'), ('bar', None)])
+        self.assertEqual(subscriber.poll(), [])
+
+    def test_publish_same_generation(self):
+        publisher = CacheInvalidationBroadcaster('locmem')
+        subscriber = CacheInvalidationBroadcaster('locmem')
+        subscriber.poll()
+        publisher.publish('foo', 'duc:foo:1')
+
+        # Without atomic increments another publisher may get the same generation; the counter moves on to 2 meanwhile
+        incr = caches['locmem'].incr
+        with mock.patch.object(caches['locmem'], 'incr', side_effect=[1, incr(publisher._make_key())]):
+            publisher.publish('bar')
+        self.assertEqual(subscriber.poll(), [('foo', 'duc:foo:1'), ('bar', None)])
+
+    def test_publish_generations_taken(self):
+        publisher = CacheInvalidationBroadcaster('locmem')
+        subscriber = CacheInvalidationBroadcaster('locmem')
+        subscriber.poll()
+
+        # Other publishers keep taking the generations
+        caches['locmem'].set(publisher._make_key(), 0)
+        caches['locmem'].set_many({publisher._make_key(g): ('bar', None) for g in range(1, MAX_PUBLISH_ATTEMPTS + 1)})
+        publisher.publish('foo', 'duc:foo:1')
+        self.assertEqual(subscriber.poll(), MAX_PUBLISH_ATTEMPTS * [('bar', None)] + [INVALIDATE_ALL])
+
+    def test_poll_too_far_behind(self):
+        publisher = CacheInvalidationBroadcaster('locmem', max_events=2)
+        subscriber = CacheInvalidationBroadcaster('locmem', max_events=2)
+        subscriber.poll()
+
+        for i in range(3):
+            publisher.publish('foo', f'duc:foo:{i}')
+        self.assertEqual(subscriber.poll(), [INVALIDATE_ALL])
+
+    def test_poll_missing_events(self):
+        publisher = CacheInvalidationBroadcaster('locmem')
+        subscriber = CacheInvalidationBroadcaster('locmem')
+        subscriber.poll()
+
+        publisher.publish('foo', 'duc:foo:1')
+        caches['locmem'].delete(publisher._make_key(1))
+        self.assertEqual(subscriber.poll(), [INVALIDATE_ALL])
+
+
+class TestRedisInvalidationBroadcaster(TestCase):
+
+    def test_publish_and_poll(self):
+        server = fakeredis.FakeServer()
+        publisher = RedisInvalidationBroadcaster(client=fakeredis.FakeRedis(server=server))
+        subscriber = RedisInvalidationBroadcaster(client=fakeredis.FakeRedis(server=server))
+        self.assertEqual(subscriber.poll(), [])
+
+        publisher.publish('foo', 'duc:foo:1')
+        publisher.publish('bar')
+        self.assertEqual(subscriber.poll(), [('foo', 'duc:foo:1'), ('bar', None)])
+        self.assertEqual(subscriber.poll(), [])
+
+
+@override_settings(
+    DUC_INVALIDATION_BROADCASTER='update_cache.cache.invalidation.CacheInvalidationBroadcaster',
+    DUC_INVALIDATION_OPTIONS={'backend': 'locmem'},
+    DUC_LOCAL_CACHE_CHECK_INTERVAL=0
+)
+class TestLocalCacheInvalidation(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        cached_functions.create_random_paragraphs.cache.local_cache.clear()
+
+    @mock.patch.object(random, 'choice')
+    def test_invalidate_in_other_process(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_paragraphs.cache
+        cache_key = make_cache_key(cached_functions.create_random_paragraphs, ((1,), {}))
+        other_key = make_cache_key(cached_functions.create_random_paragraphs, ((2,), {}))
+        other_process = CacheInvalidationBroadcaster('locmem')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+            cached_functions.create_random_paragraphs(2)
+            other_process.publish(cache.func_name, cache_key)
+            function_cache_registry.poll_invalidations()
+        self.assertEqual(cache.local_cache.get(cache_key), missing)
+        self.assertNotEqual(cache.local_cache.get(other_key), missing)
+
+        with freeze_time('2023-12-01T10:00:01Z'):
+            other_process.publish(cache.func_name)
+            function_cache_registry.poll_invalidations()
+        self.assertEqual(len(cache.local_cache), 0)
+
+    @mock.patch.object(random, 'choice')
+    def test_invalidate_publishes(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_paragraphs.cache
+        cache_key = make_cache_key(cached_functions.create_random_paragraphs, ((1,), {}))
+        other_process = CacheInvalidationBroadcaster('locmem')
+        other_process.poll()
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+            cache.invalidate(cache_key)
+            self.assertEqual(other_process.poll(), [(cache.func_name, cache_key)])
@@ -0,0 +1,113 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.cache import make_cache_key, missing
+from update_cache.cache.local import LocalCache
+
+from testapp import cached_functions
+from testapp.cached_functions import random
+
+
+class TestLocalCache(TestCase):
+
+    def test_evict_by_entries(self):
+        local_cache = LocalCache(max_entries=2)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+        # Least recently used entry should have been evicted
+        self.assertEqual(local_cache.get('b'), missing)
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertEqual(local_cache.get('c'), 3)
+
+    def test_evict_by_bytes(self):
+        local_cache = LocalCache(max_bytes=1000)
+        local_cache.set('a', 400 * b'a')
+        local_cache.set('b', 400 * b'b')
+        local_cache.set('c', 400 * b'c')
+        self.assertEqual(local_cache.get('a'), missing)
+        self.assertEqual(len(local_cache), 2)
+        # Entries larger than the limit are not stored at all
+        local_cache.set('d', 2000 * b'd')
+        self.assertEqual(local_cache.get('d'), missing)
+        self.assertEqual(len(local_cache), 2)
+
+
+class TestCachedFunctionWithLocalCache(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        cache = cached_functions.create_random_paragraphs.cache
+        cache.local_cache.clear()
+        cache._stamp = cache._stamp_checked = None
+
+    @mock.patch.object(random, 'choice')
+    def test_local_hit(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_paragraphs.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = cached_functions.create_random_paragraphs(1)
+        with freeze_time('2023-12-01T10:00:01Z'):
+            with mock.patch.object(cache.cache, 'get', wraps=cache.cache.get) as mock_get:
+                result2 = cached_functions.create_random_paragraphs(1)
+        self.assertEqual(result1, result2)
+        self.assertEqual(get_choice.call_count, 25)
+        # Served from the local cache, the backend is at most asked for the stamp
+        for call in mock_get.call_args_list:
+            self.assertEqual(call.args[0], cache._make_stamp_key())
+
+    @mock.patch.object(random, 'choice')
+    def test_local_expired(self, get_choice):
+        get_choice.side_effect = 25 * ['Lorem'] + 25 * ['Ipsum']
+        cache = cached_functions.create_random_paragraphs.cache
+        cache_key = make_cache_key(cached_functions.create_random_paragraphs, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+        with freeze_time('2023-12-01T10:05:00Z'):
+            # Expired entries are not served from the local cache
+            self.assertEqual(cache.get_expired(cache_key).result, [' '.join(25 * ['Lorem'])])
+            self.assertEqual(cache.local_cache.get(cache_key), missing)
+            result = cached_functions.create_random_paragraphs(1)
+        self.assertEqual(result, [' '.join(25 * ['Lorem'])])
+        # The refreshed result is kept locally
+        self.assertEqual(cache.local_cache.get(cache_key).result, [' '.join(25 * ['Ipsum'])])
+
+    @mock.patch.object(random, 'choice')
+    def test_invalidate(self, get_choice):
+        get_choice.side_effect = 25 * ['Lorem'] + 25 * ['Ipsum']
+        cache = cached_functions.create_random_paragraphs.cache
+        cache_key = make_cache_key(cached_functions.create_random_paragraphs, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+            cache.invalidate(cache_key)
+        self.assertEqual(cache.local_cache.get(cache_key), missing)
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+            cache.delete(cache_key)
+        self.assertEqual(cache.local_cache.get(cache_key), missing)
+
+    @override_settings(DUC_LOCAL_CACHE_CHECK_INTERVAL=0)
+    @mock.patch.object(random, 'choice')
+    def test_stamp_changed_by_other_process(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache = cached_functions.create_random_paragraphs.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_paragraphs(1)
+            self.assertEqual(len(cache.local_cache), 1)
+            # Simulate an invalidation in another process
+            cache.cache.set(cache._make_stamp_key(), 'other', timeout=None)
+            cached_functions.create_random_paragraphs(1)
+        # The local entry was dropped and refilled from the backend
+        self.assertEqual(len(cache.local_cache), 1)
+        self.assertEqual(cache._stamp, 'other')
+        self.assertEqual(get_choice.call_count, 25)
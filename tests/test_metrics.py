@@ -0,0 +1,103 @@
+import io
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.metrics import (
+    BACKEND_SECONDS, COMPUTE_SECONDS, CacheMetricsSink, HITS, InMemoryMetricsSink, MISSES, PAYLOAD_BYTES, REFRESHES,
+    STALE_HITS, format_metrics, get_metrics_sink, reset_metrics_sink
+)
+
+from testapp import cached_functions
+
+
+SENTENCES = 'testapp.cached_functions.create_random_sentences'
+
+LABELS = 'testapp.cached_functions.create_random_labels'
+
+
+@override_settings(DUC_METRICS_SINK='update_cache.cache.metrics.InMemoryMetricsSink')
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        # Start every test with an empty sink
+        reset_metrics_sink(setting='DUC_METRICS_SINK')
+
+    @mock.patch('random.choice')
+    def test_hits_and_misses(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_sentences(1)
+            cached_functions.create_random_sentences(1)
+        with freeze_time('2023-12-01T10:10:00Z'):
+            cached_functions.create_random_sentences(1)
+
+        counters, histograms = get_metrics_sink().collect()
+        self.assertEqual(counters[MISSES, SENTENCES], 1)
+        self.assertEqual(counters[HITS, SENTENCES], 1)
+        self.assertEqual(counters[STALE_HITS, SENTENCES], 1)
+        self.assertEqual(counters[REFRESHES, SENTENCES], 1)
+        # The live call and the refresh
+        self.assertEqual(sum(histograms[COMPUTE_SECONDS, SENTENCES][0]), 2)
+        self.assertIn((BACKEND_SECONDS, SENTENCES), histograms)
+
+    @mock.patch('random.choice')
+    def test_payload_size(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_labels(1)
+
+        counts, total = get_metrics_sink().collect()[1][PAYLOAD_BYTES, LABELS]
+        self.assertEqual(counts[0], 1)
+        self.assertGreater(total, 0)
+
+    def test_format_metrics(self):
+        sink = InMemoryMetricsSink()
+        sink.increment(HITS, 'foo', 2)
+        sink.observe(COMPUTE_SECONDS, 'foo', 0.2)
+        sink.observe(COMPUTE_SECONDS, 'foo', 20)
+
+        text = format_metrics(*sink.collect())
+        self.assertIn('# TYPE duc_hits_total counter\nduc_hits_total{function="foo"} 2\n', text)
+        self.assertIn('duc_compute_seconds_bucket{function="foo",le="0.1"} 0\n', text)
+        self.assertIn('duc_compute_seconds_bucket{function="foo",le="0.25"} 1\n', text)
+        self.assertIn('duc_compute_seconds_bucket{function="foo",le="+Inf"} 2\n', text)
+        self.assertIn('duc_compute_seconds_sum{function="foo"} 20.2\n', text)
+        self.assertIn('duc_compute_seconds_count{function="foo"} 2\n', text)
+
+    def test_cache_sink(self):
+        sink = CacheMetricsSink('locmem')
+        sink.increment(HITS, SENTENCES)
+        sink.increment(HITS, SENTENCES)
+        sink.observe(COMPUTE_SECONDS, SENTENCES, 0.2)
+
+        counters, histograms = sink.collect()
+        self.assertEqual(counters[HITS, SENTENCES], 2)
+        counts, total = histograms[COMPUTE_SECONDS, SENTENCES]
+        self.assertEqual(counts[8], 1)
+        self.assertEqual(total, 0.2)
+
+    def test_export(self):
+        get_metrics_sink().increment(HITS, SENTENCES)
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'duc_hits_total{{function="{SENTENCES}"}} 1', response.content.decode())
+
+        out = io.StringIO()
+        call_command('export_metrics', stdout=out)
+        self.assertIn(f'duc_hits_total{{function="{SENTENCES}"}} 1', out.getvalue())
+
+    @override_settings(DUC_METRICS_SINK=None)
+    def test_export_without_sink(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 404)
+        with self.assertRaises(CommandError):
+            call_command('export_metrics')
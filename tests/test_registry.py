@@ -0,0 +1,185 @@
+import datetime
+import io
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.cache import (
+    CacheResult, ENTRY_VERSION, LEGACY_ACTIVE_VERSION, LEGACY_EXPIRED_VERSION, make_cache_key, missing
+)
+from update_cache.cache.registry import FunctionCacheRegistry, function_cache_registry
+
+from testapp import cached_functions, views
+from testapp.cached_functions import random
+
+
+class TestCachedFunction(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        self.cache = cached_functions.create_random_sentences.cache
+        self.cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+        self.result = CacheResult(
+            result=['Lorem'],
+            expires=datetime.datetime(2023, 12, 1, 10, 5, tzinfo=datetime.timezone.utc)
+        )
+
+    def test_expire(self):
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.cache.set_active(self.cache_key, self.result)
+            self.assertEqual(self.cache.get_active(self.cache_key).result, ['Lorem'])
+            self.assertEqual(self.cache.get_expired(self.cache_key), missing)
+
+        # Expiring is decided by the expiry time of the entry, without writing it
+        with freeze_time('2023-12-01T10:05:00Z'):
+            self.assertEqual(self.cache.get_active(self.cache_key), missing)
+            self.assertEqual(self.cache.get_expired(self.cache_key).result, ['Lorem'])
+
+    def test_invalidate(self):
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.cache.set_active(self.cache_key, self.result)
+            self.cache.invalidate(self.cache_key)
+            self.assertEqual(self.cache.get_active(self.cache_key), missing)
+            self.assertEqual(self.cache.get_expired(self.cache_key).result, ['Lorem'])
+
+    def test_invalidate_all(self):
+        other_key = make_cache_key(cached_functions.create_random_sentences, ((2,), {}))
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.cache.set_active(self.cache_key, self.result)
+            self.cache.set_active(other_key, CacheResult(['Ipsum'], self.result.expires))
+            self.cache.invalidate_all()
+            self.assertEqual(self.cache.get_active(self.cache_key), missing)
+            self.assertEqual(self.cache.get_expired(self.cache_key).result, ['Lorem'])
+            self.assertEqual(self.cache.get_many_active([self.cache_key, other_key]), {})
+            self.assertTrue(self.cache.get_meta(self.cache_key).has_expired)
+
+            # Entries written after are active
+            self.cache.set_active(self.cache_key, CacheResult(['Dolor'], self.result.expires))
+            self.assertEqual(self.cache.get_active(self.cache_key).result, ['Dolor'])
+            self.assertFalse(self.cache.get_meta(self.cache_key).has_expired)
+
+    def test_invalidate_all_after_lost_generation(self):
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.cache.invalidate_all()
+            self.cache.set_active(self.cache_key, self.result)
+            self.cache.invalidate_all()
+            # The generation is evicted, the next one must not be the generation of the entry again
+            caches['locmem'].delete(self.cache.generation_key, version=ENTRY_VERSION)
+            self.cache.invalidate_all()
+            self.assertEqual(self.cache.get_active(self.cache_key), missing)
+
+    def test_cleanup(self):
+        other_key = make_cache_key(cached_functions.create_random_sentences, ((2,), {}))
+        gone_key = make_cache_key(cached_functions.create_random_sentences, ((3,), {}))
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.cache.set_active(self.cache_key, self.result)
+            self.cache.invalidate_all()
+            self.cache.set_active(other_key, CacheResult(['Ipsum'], self.result.expires))
+        self.cache.index.add(gone_key)
+        stdout = io.StringIO()
+
+        call_command('cleanup_cache_entries', stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Deleted 1 cache entry')
+        self.assertEqual(caches['locmem'].get(self.cache_key, version=ENTRY_VERSION), None)
+        self.assertEqual(caches['locmem'].get(other_key, version=ENTRY_VERSION).result, ['Ipsum'])
+        self.assertEqual(set(self.cache), {other_key})
+
+    @override_settings(DUC_READ_LEGACY_ENTRIES=True)
+    def test_read_legacy_entries(self):
+        other_key = make_cache_key(cached_functions.create_random_sentences, ((2,), {}))
+        caches['locmem'].set(self.cache_key, self.result, version=LEGACY_ACTIVE_VERSION)
+        caches['locmem'].set(other_key, self.result, version=LEGACY_EXPIRED_VERSION)
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.assertEqual(self.cache.get_active(self.cache_key).result, ['Lorem'])
+            self.assertEqual(self.cache.get_expired(other_key).result, ['Lorem'])
+        # The entries are moved to the current layout
+        self.assertEqual(caches['locmem'].get(self.cache_key, version=LEGACY_ACTIVE_VERSION), None)
+        self.assertEqual(caches['locmem'].get(other_key, version=LEGACY_EXPIRED_VERSION), None)
+        self.assertEqual(caches['locmem'].get(self.cache_key, version=ENTRY_VERSION).result, ['Lorem'])
+
+    @override_settings(DUC_READ_LEGACY_ENTRIES=True)
+    @mock.patch.object(random, 'choice')
+    def test_read_legacy_keys(self, get_choice):
+        calling_args = ((1,), {})
+        legacy_key = self.cache._make_legacy_key(calling_args)
+        self.result.calling_args = calling_args
+        caches['locmem'].set(legacy_key, self.result, version=LEGACY_ACTIVE_VERSION)
+        self.cache.index.add(legacy_key)
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.assertEqual(cached_functions.create_random_sentences(1), ['Lorem'])
+        get_choice.assert_not_called()
+        # The entry is moved to the key made from its calling arguments
+        self.assertEqual(caches['locmem'].get(legacy_key, version=LEGACY_ACTIVE_VERSION), None)
+        self.assertEqual(caches['locmem'].get(self.cache_key, version=ENTRY_VERSION).result, ['Lorem'])
+        self.assertEqual(set(self.cache), {self.cache_key})
+
+    def test_read_legacy_entries_disabled(self):
+        caches['locmem'].set(self.cache_key, self.result, version=LEGACY_ACTIVE_VERSION)
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.assertEqual(self.cache.get_active(self.cache_key), missing)
+
+    def test_migrate_cache_entries(self):
+        legacy_key = self.cache._make_legacy_key(((1,), {}))
+        other_legacy_key = self.cache._make_legacy_key(((2,), {}))
+        other_key = make_cache_key(cached_functions.create_random_sentences, ((2,), {}))
+        self.result.calling_args = ((1,), {})
+        caches['locmem'].set(legacy_key, self.result, version=LEGACY_ACTIVE_VERSION)
+        caches['locmem'].set(
+            other_legacy_key, CacheResult(['Ipsum'], self.result.expires, ((2,), {})), version=LEGACY_ACTIVE_VERSION
+        )
+        self.cache.index.add_many([legacy_key, other_legacy_key])
+        # Entries written under the current keys are kept
+        self.cache.set_active(other_key, CacheResult(['Dolor'], self.result.expires, ((2,), {})))
+        stdout = io.StringIO()
+
+        call_command('migrate_cache_entries', stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Migrated 1 cache entry')
+        self.assertEqual(caches['locmem'].get(self.cache_key, version=ENTRY_VERSION).result, ['Lorem'])
+        self.assertEqual(caches['locmem'].get(other_key, version=ENTRY_VERSION).result, ['Dolor'])
+        self.assertEqual(caches['locmem'].get(legacy_key, version=LEGACY_ACTIVE_VERSION), None)
+        self.assertEqual(caches['locmem'].get(other_legacy_key, version=LEGACY_ACTIVE_VERSION), None)
+        # The index holds the current keys only
+        self.assertEqual(set(self.cache), {self.cache_key, other_key})
+
+
+class TestFunctionCacheRegistry(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    def test_add(self):
+        cached_function = function_cache_registry.add(cached_functions.create_random_sentences, caches['locmem'])
+        self.assertIs(cached_function, cached_functions.create_random_sentences.cache)
+        self.assertIs(function_cache_registry.get(cached_function.func_name), cached_function)
+
+    def test_resolve(self):
+        cache_key = make_cache_key(cached_functions.create_random_sentences, ((1,), {}))
+        self.assertIs(function_cache_registry.resolve(cache_key), cached_functions.create_random_sentences.cache)
+
+    def test_resolve_view_key(self):
+        # View keys don't hold the name of the view
+        views.stale_strings.cache.index.add('duc:GET:d41d8cd98f00b204e9800998ecf8427e')
+        self.assertIs(function_cache_registry.resolve('duc:GET:d41d8cd98f00b204e9800998ecf8427e'),
+                      views.stale_strings.cache)
+
+    def test_invalidate_tag(self):
+        # The tagged test functions share one cache backend
+        self.assertEqual(function_cache_registry.invalidate_tag('catalog'), 1)
+
+    def test_invalidate_tag_without_tagged_functions(self):
+        registry = FunctionCacheRegistry()
+        registry.add(cached_functions.create_random_sentences, caches['locmem'])
+        with self.assertLogs('update_cache.cache.registry', 'WARNING'):
+            self.assertEqual(registry.invalidate_tag('catalog'), 0)
+
+    def test_resolve_unknown_key(self):
+        self.assertIsNone(function_cache_registry.resolve('duc:testapp.cached_functions.unknown:foo'))
+        self.assertIsNone(function_cache_registry.resolve('foo'))
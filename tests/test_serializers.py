@@ -0,0 +1,120 @@
+import datetime
+import importlib.util
+import unittest
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.cache import CacheResult, ENTRY_VERSION, make_cache_key
+from update_cache.cache.serializers import (
+    Codec, JSONSerializer, MsgpackSerializer, PickleSerializer, ZlibCompressor, loads
+)
+from update_cache.cache.views import CachedResponse
+
+from testapp import cached_functions
+from testapp.cached_functions import random
+
+
+class TestCodec(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.result = CacheResult(
+            result={'items': list(range(1000))},
+            expires=datetime.datetime(2023, 12, 1, 10, 5, tzinfo=datetime.timezone.utc),
+            calling_args=[[1], {}],
+            delta=0.5
+        )
+
+    def test_pickle(self):
+        payload = Codec(PickleSerializer()).dumps(self.result)
+        self.assertEqual(payload[0], PickleSerializer.id << 4)
+        self.assertEqual(loads(payload), self.result)
+
+    def test_json(self):
+        payload = Codec(JSONSerializer()).dumps(self.result)
+        self.assertEqual(payload[0], JSONSerializer.id << 4)
+        self.assertEqual(loads(payload), self.result)
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_msgpack(self):
+        payload = Codec(MsgpackSerializer()).dumps(self.result)
+        self.assertEqual(loads(payload), self.result)
+
+    def test_compress_above_min_size(self):
+        codec = Codec(JSONSerializer(), ZlibCompressor(min_size=1024))
+        payload = codec.dumps(self.result)
+        self.assertEqual(payload[0], JSONSerializer.id << 4 | ZlibCompressor.id)
+        self.assertLess(len(payload), len(Codec(JSONSerializer()).dumps(self.result)))
+        self.assertEqual(loads(payload), self.result)
+
+        # Small payloads are stored uncompressed
+        self.result.result = 'Lorem'
+        payload = codec.dumps(self.result)
+        self.assertEqual(payload[0], JSONSerializer.id << 4)
+        self.assertEqual(loads(payload), self.result)
+
+    def test_record_with_versions(self):
+        self.result.generation = 2
+        self.result.tags = {'catalog': 1}
+        serializer = JSONSerializer()
+        self.assertEqual(serializer.loads(serializer.dumps(self.result)), self.result)
+
+    def test_response_record(self):
+        self.result.result = CachedResponse(
+            status_code=200,
+            headers=[('Content-Type', 'text/plain')],
+            content=b'Lorem',
+            encoded={'gzip': b'\x1f\x8b'}
+        )
+        serializer = JSONSerializer()
+        result = serializer.loads(serializer.dumps(self.result)).result
+        self.assertEqual(
+            (result.status_code, result.headers, result.content, result.encoded),
+            (200, [('Content-Type', 'text/plain')], b'Lorem', {'gzip': b'\x1f\x8b'})
+        )
+
+    @override_settings(USE_TZ=False)
+    def test_json_without_time_zone_support(self):
+        self.result.expires = datetime.datetime(2023, 12, 1, 10, 5)
+        payload = Codec(JSONSerializer()).dumps(self.result)
+        self.assertEqual(loads(payload), self.result)
+
+    def test_loads_without_codec(self):
+        self.assertIs(loads(self.result), self.result)
+
+
+class TestCachedFunctionWithCodec(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(random, 'choice')
+    def test_cache_function(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        cache_key = make_cache_key(cached_functions.create_random_labels, ((1,), {}))
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            result1 = cached_functions.create_random_labels(1)
+            result2 = cached_functions.create_random_labels(1)
+        self.assertEqual(result1, ['lorem-lorem'])
+        self.assertEqual(result1, result2)
+        self.assertEqual(get_choice.call_count, 2)
+        # The entry is stored encoded
+        self.assertIsInstance(caches['locmem'].get(cache_key, version=ENTRY_VERSION), bytes)
+        # The metadata has the size of the encoded payload
+        meta = cached_functions.create_random_labels.cache.get_meta(cache_key)
+        self.assertEqual(meta.size, len(caches['locmem'].get(cache_key, version=ENTRY_VERSION)))
+
+    @override_settings(USE_TZ=False)
+    @mock.patch.object(random, 'choice')
+    def test_cache_function_without_time_zone_support(self, get_choice):
+        get_choice.return_value = 'Lorem'
+        result1 = cached_functions.create_random_labels(1)
+        # The expiry time of the cached entry is compared with the naive current time
+        result2 = cached_functions.create_random_labels(1)
+        self.assertEqual(result1, result2)
+        self.assertEqual(get_choice.call_count, 2)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import override_settings
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.cache.tracing import TraceEvent, log_event
+
+from testapp import cached_functions
+
+
+events = []
+
+
+def record_event(event):
+    events.append(event)
+
+
+SENTENCES = 'testapp.cached_functions.create_random_sentences'
+
+
+@override_settings(DUC_TRACE_HOOK=f'{__name__}.record_event')
+class TestTracing(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+        events.clear()
+
+    @override_settings(DUC_TRACE_SAMPLE_RATE=1)
+    @mock.patch('random.choice')
+    def test_events(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_sentences(1)
+            cached_functions.create_random_sentences(1)
+        with freeze_time('2023-12-01T10:10:00Z'):
+            cached_functions.create_random_sentences(1)
+
+        key = cached_functions.create_random_sentences.cache.make_key(((1,), {}))
+        self.assertEqual(events, [
+            TraceEvent('miss', SENTENCES, key),
+            TraceEvent('hit', SENTENCES, key),
+            TraceEvent('stale_hit', SENTENCES, key),
+        ])
+
+    @override_settings(DUC_TRACE_SAMPLE_RATE=0.1)
+    @mock.patch('random.random')
+    @mock.patch('random.choice')
+    def test_sample(self, get_choice, get_random):
+        get_choice.return_value = 'Lorem'
+        get_random.side_effect = [0.5, 0.05]
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_sentences(1)
+            cached_functions.create_random_sentences(1)
+        self.assertEqual([event.name for event in events], ['hit'])
+
+    @mock.patch('random.choice')
+    def test_disabled(self, get_choice):
+        get_choice.return_value = 'Lorem'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            cached_functions.create_random_sentences(1)
+            cached_functions.create_random_sentences(1)
+        self.assertEqual(events, [])
+
+    def test_log_event(self):
+        with self.assertLogs('update_cache.cache.tracing', 'INFO') as logs:
+            log_event(TraceEvent('miss', SENTENCES, 'duc:foo'))
+            log_event(TraceEvent('miss', SENTENCES, fields={'count': 3}))
+        self.assertEqual(logs.output, [
+            'INFO:update_cache.cache.tracing:Getting live result for duc:foo',
+            'INFO:update_cache.cache.tracing:Getting live result for 3 keys',
+        ])
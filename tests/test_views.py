@@ -0,0 +1,338 @@
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import unittest
+from unittest import mock
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test.testcases import TestCase
+from freezegun import freeze_time
+from update_cache.brokers import sync_view_broker
+from update_cache.cache.cache import ENTRY_VERSION, make_view_cache_key
+from update_cache.cache.serializers import SERIALIZERS
+from update_cache.cache.views import CachedResponse, ViewRequest
+from update_cache.decorators import cache_view
+
+from testapp import utils, views
+
+
+class TestCachedResponse(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_compact_record(self, get_string):
+        get_string.return_value = 10 * 'a'
+        request = RequestFactory().get('/testapp/compressed_strings/')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/compressed_strings/')
+            result = views.compressed_strings.cache.get_active(make_view_cache_key(request, 'GET')).result
+        self.assertIsInstance(result, CachedResponse)
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(('Content-Type', 'text/plain'), result.headers)
+        self.assertEqual(result.content.decode(), '\n'.join(100 * [10 * 'a']))
+        self.assertEqual(gzip.decompress(result.encoded['gzip']), result.content)
+
+    def test_cached_headers(self):
+        response = HttpResponse('Lorem', content_type='text/plain')
+        response['X-Request-Id'] = 'abc'
+        response['X-Tenant'] = 'foo'
+        response.set_cookie('sessionid', 'secret')
+
+        result = CachedResponse.from_response(response)
+        self.assertEqual(result.headers, [('Content-Type', 'text/plain'), ('X-Tenant', 'foo')])
+        self.assertFalse(result.to_response(RequestFactory().get('/')).cookies)
+        # Other headers can be left out in settings
+        with self.settings(DUC_UNCACHED_HEADERS=['X-Tenant']):
+            result = CachedResponse.from_response(response)
+        self.assertEqual(result.headers, [('Content-Type', 'text/plain')])
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_cached_encoded_response(self, get_string):
+        get_string.return_value = 10 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/gzipped_strings/')
+            response = self.client.get('/testapp/gzipped_strings/')
+        self.assertEqual(get_string.call_count, 100)
+        # The view compressed the response itself
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['X-Custom'], 'foo')
+        self.assertEqual(gzip.decompress(response.content).decode(), '\n'.join(100 * [10 * 'a']))
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_serve_compressed(self, get_string):
+        get_string.return_value = 10 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/compressed_strings/')
+            response = self.client.get('/testapp/compressed_strings/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(get_string.call_count, 100)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"strings"')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content).decode(), '\n'.join(100 * [10 * 'a']))
+
+        with freeze_time('2023-12-01T10:00:01Z'):
+            response = self.client.get('/testapp/compressed_strings/')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response['ETag'], '"strings"')
+        self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'a']))
+
+
+class TestViewSerializers(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    def test_pickle(self):
+        self._test_serializer('pickle')
+
+    def test_json(self):
+        self._test_serializer('json')
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_msgpack(self):
+        self._test_serializer('msgpack')
+
+    @mock.patch.object(utils, 'get_random_string')
+    def _test_serializer(self, serializer, get_string):
+        get_string.return_value = 10 * 'a'
+
+        def view(request):
+            response = HttpResponse('\n'.join(utils.create_random_strings(100)), content_type='text/plain')
+            response['ETag'] = '"strings"'
+            return response
+
+        # Views are registered by name, one per serializer
+        view.__qualname__ = f'{serializer}_strings'
+        view = cache_view(backend='locmem', serializer=serializer, encodings=('gzip',))(view)
+        request = RequestFactory().get('/testapp/strings/')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            view(request)
+            response = view(RequestFactory().get('/testapp/strings/', HTTP_ACCEPT_ENCODING='gzip'))
+            plain_response = view(request)
+        self.assertEqual(get_string.call_count, 100)
+        payload = caches['locmem'].get(make_view_cache_key(request, 'GET'), version=ENTRY_VERSION)
+        self.assertEqual(payload[0] >> 4, SERIALIZERS[serializer].id)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), '\n'.join(100 * [10 * 'a']))
+        self.assertEqual(plain_response['ETag'], '"strings"')
+        self.assertEqual(plain_response['Content-Type'], 'text/plain')
+        self.assertEqual(plain_response.content.decode(), '\n'.join(100 * [10 * 'a']))
+
+
+class TestConditionalRequests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_if_none_match(self, get_string):
+        get_string.return_value = 10 * 'a'
+        cache = views.async_strings.cache
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            response = self.client.get('/testapp/async_strings/')
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(response['Last-Modified'], 'Fri, 01 Dec 2023 10:00:00 GMT')
+
+        with freeze_time('2023-12-01T10:00:01Z'):
+            with mock.patch.object(cache, 'aget') as aget:
+                response = self.client.get('/testapp/async_strings/', HTTP_IF_NONE_MATCH=etag)
+        # The response is not loaded from the cache
+        self.assertFalse(aget.called)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+        with freeze_time('2023-12-01T10:00:02Z'):
+            response = self.client.get('/testapp/async_strings/', HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(get_string.call_count, 100)
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_if_modified_since(self, get_string):
+        get_string.return_value = 10 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/async_strings/')
+            response = self.client.get('/testapp/async_strings/',
+                                       HTTP_IF_MODIFIED_SINCE='Fri, 01 Dec 2023 10:00:00 GMT')
+        self.assertEqual(response.status_code, 304)
+
+        # Expired entries are not validated
+        with freeze_time('2023-12-01T10:05:00Z'):
+            response = self.client.get('/testapp/async_strings/',
+                                       HTTP_IF_MODIFIED_SINCE='Fri, 01 Dec 2023 10:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_string.call_count, 200)
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_invalidated(self, get_string):
+        get_string.return_value = 10 * 'a'
+        cache = views.async_strings.cache
+        request = RequestFactory().get('/testapp/async_strings/')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            etag = self.client.get('/testapp/async_strings/')['ETag']
+            cache.invalidate(make_view_cache_key(request, 'GET'))
+            response = self.client.get('/testapp/async_strings/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestStaleWhileRevalidate(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    async def test_refresh_task_referenced(self):
+        handler = views.stale_strings.cache.update_handler
+        broker = mock.Mock()
+
+        with mock.patch.object(handler, 'get_broker', return_value=broker):
+            handler.dispatch_refresh_task('key', ((), {}))
+            # The task is referenced until it is done
+            refresh_tasks = set(handler._refresh_tasks)
+            self.assertEqual(len(refresh_tasks), 1)
+            await asyncio.gather(*refresh_tasks)
+        self.assertTrue(broker.called)
+        self.assertFalse(handler._refresh_tasks)
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_serve_stale(self, get_string):
+        get_string.side_effect = [10 * 'a'] * 100 + [10 * 'b'] * 100 + [10 * 'c'] * 100
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            response = self.client.get('/testapp/stale_strings/')
+        self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'a']))
+
+        # The expired response is served and refreshed by the broker
+        with freeze_time('2023-12-01T10:01:30Z'):
+            response = self.client.get('/testapp/stale_strings/')
+            self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'a']))
+            response = self.client.get('/testapp/stale_strings/')
+            self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'b']))
+
+        # Past the stale ttl the response is rendered inline
+        with freeze_time('2023-12-01T10:05:00Z'):
+            response = self.client.get('/testapp/stale_strings/')
+        self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'c']))
+        self.assertEqual(get_string.call_count, 300)
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_serve_stale_per_user(self, get_string):
+        get_string.side_effect = [10 * 'a'] * 100 + [10 * 'b'] * 100
+        self.client.cookies['user'] = 'alice'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/stale_user_strings/')
+        # The response varies on the cookie, it is rendered inline for the user instead of refreshed by the broker
+        with freeze_time('2023-12-01T10:01:30Z'), \
+                mock.patch.object(views.stale_user_strings.cache.update_handler, 'get_broker') as mock_get_broker:
+            response = self.client.get('/testapp/stale_user_strings/')
+        self.assertEqual(response.content.decode(), '\n'.join(100 * [10 * 'b']))
+        mock_get_broker.assert_not_called()
+
+    @mock.patch('random.randint')
+    @mock.patch('update_cache.brokers.enqueue')
+    def test_serve_stale_with_async_broker(self, mock_enqueue, get_int):
+        get_int.side_effect = [1] * 100 + [2] * 100
+        request = RequestFactory().get('/testapp/stale_numbers/?page=2')
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/stale_numbers/?page=2')
+
+        with freeze_time('2023-12-01T10:01:30Z'):
+            response = self.client.get('/testapp/stale_numbers/?page=2')
+            self.assertEqual(response.content.decode().strip(), '\n'.join(100 * ['1']))
+            broker, func_name, timeout, calling_args, backend = mock_enqueue.call_args.args
+            self.assertEqual(broker, sync_view_broker)
+            self.assertEqual(func_name, 'testapp.views.stale_numbers')
+            self.assertEqual(calling_args, ((ViewRequest(
+                url='http://testserver/testapp/stale_numbers/?page=2',
+                path_info='/testapp/stale_numbers/',
+                method='GET',
+                language='en-us',
+                timezone='Europe/Amsterdam'
+            ),), {}))
+
+            # The worker renders the view again for the stored request
+            broker(func_name, timeout, calling_args, backend)
+            result = views.stale_numbers.cache.get_active(make_view_cache_key(request, 'GET'))
+        self.assertEqual(result.result.content.decode().strip(), '\n'.join(100 * ['2']))
+
+    def test_view_request(self):
+        request = RequestFactory().get('/testapp/stale_strings/?page=2', secure=True)
+        refresh_request = ViewRequest.from_request(request).to_request()
+
+        self.assertEqual(refresh_request.build_absolute_uri(), 'https://testserver/testapp/stale_strings/?page=2')
+        self.assertEqual(refresh_request.GET['page'], '2')
+        self.assertEqual(make_view_cache_key(refresh_request, 'GET'), make_view_cache_key(request, 'GET'))
+
+
+class TestViewCacheKeys(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        caches['locmem'].clear()
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_vary_headers(self, get_string):
+        get_string.side_effect = [10 * 'a'] * 100 + [10 * 'b'] * 100
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/variant_strings/', HTTP_X_VARIANT='a')
+            self.client.get('/testapp/variant_strings/', HTTP_X_VARIANT='b')
+            response_a = self.client.get('/testapp/variant_strings/', HTTP_X_VARIANT='a')
+            response_b = self.client.get('/testapp/variant_strings/', HTTP_X_VARIANT='b')
+        self.assertEqual(get_string.call_count, 200)
+        self.assertEqual(response_a.content.decode(), '\n'.join(100 * [10 * 'a']))
+        self.assertEqual(response_b.content.decode(), '\n'.join(100 * [10 * 'b']))
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_key_params(self, get_string):
+        get_string.return_value = 10 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            response = self.client.get('/testapp/paged_strings/?page=2&utm_source=mail')
+            self.client.get('/testapp/paged_strings/?utm_source=feed&page=2')
+            self.assertEqual(get_string.call_count, 100)
+            self.client.get('/testapp/paged_strings/?page=3')
+            self.assertEqual(get_string.call_count, 200)
+        self.assertIn('X-Tenant', response['Vary'])
+
+    @mock.patch.object(utils, 'get_random_string')
+    def test_key_headers(self, get_string):
+        get_string.return_value = 10 * 'a'
+
+        with freeze_time('2023-12-01T10:00:00Z'):
+            self.client.get('/testapp/paged_strings/', HTTP_X_TENANT='foo')
+            self.client.get('/testapp/paged_strings/', HTTP_X_TENANT='foo')
+            self.assertEqual(get_string.call_count, 100)
+            self.client.get('/testapp/paged_strings/', HTTP_X_TENANT='bar')
+            self.assertEqual(get_string.call_count, 200)
+
+    def test_make_view_cache_key(self):
+        request = RequestFactory().get('/testapp/paged_strings/?b=2&a=1&b=1&utm_source=mail')
+        other_request = RequestFactory().get('/testapp/paged_strings/?a=1&b=2&b=1')
+
+        # Without headers or parameters the key is the same as before
+        self.assertEqual(make_view_cache_key(request, 'GET').split(':')[2],
+                         hashlib.md5(request.build_absolute_uri().encode(), usedforsecurity=False).hexdigest())
+        self.assertEqual(make_view_cache_key(request, 'GET', params=('b', 'a')),
+                         make_view_cache_key(other_request, 'GET', params=('a', 'b')))
+        self.assertNotEqual(make_view_cache_key(request, 'GET', ['Accept']),
+                            make_view_cache_key(request, 'GET'))
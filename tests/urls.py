@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.urls import include, path
+from update_cache import views
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('testapp/', include('testapp.urls')),
+    path('metrics/', views.metrics),
 ]
@@ -1,6 +1,5 @@
-import sys
-
 from django.contrib import admin
+from django.contrib.admin import helpers
 from django.http import Http404
 from django.template.defaultfilters import truncatechars
 
@@ -9,41 +8,40 @@ from .models import CacheEntry
 
 class CacheEntryAdmin(admin.ModelAdmin):
     list_display = (
-        'cache_key', 'function', 'calling_args', 'truncated_value', 'expires', 'has_expired'
+        'cache_key', 'function', 'calling_args', 'truncated_value', 'result_type', 'size', 'expires', 'has_expired'
     )
-    list_per_page = sys.maxsize
+    list_per_page = 100
     sortable_by = ()
     actions = ('invalidate', 'delete')
 
     @admin.action(description='Invalidate cache entries')
     def invalidate(self, request, queryset):
         num_invalidated = 0
-        selected = request.POST.getlist('_selected_action')
-        for obj in queryset:
-            cached_function = obj.cached_function
-            if cached_function is not None and obj.cache_key in selected:
-                cached_function.invalidate(obj.cache_key)
-                num_invalidated += 1
+        for obj in self.get_selected_entries(request):
+            obj.cached_function.invalidate(obj.cache_key)
+            num_invalidated += 1
         entry_bit = 'cache entry' if num_invalidated == 1 else 'cache entries'
         self.message_user(request, f'Invalidated {num_invalidated} {entry_bit}')
 
     @admin.action(description='Delete cache entries')
     def delete(self, request, queryset):
         num_deleted = 0
-        selected = request.POST.getlist('_selected_action')
-        for obj in queryset:
-            cached_function = obj.cached_function
-            if cached_function is not None and obj.cache_key in selected:
-                cached_function.delete(obj.cache_key)
-                num_deleted += 1
+        for obj in self.get_selected_entries(request):
+            obj.cached_function.delete(obj.cache_key)
+            num_deleted += 1
         entry_bit = 'cache entry' if num_deleted == 1 else 'cache entries'
         self.message_user(request, f'Deleted {num_deleted} {entry_bit}')
 
+    def get_selected_entries(self, request):
+        # Only the selected entries are loaded, not the entries of the queryset
+        return CacheEntry.objects.get_entries(request.POST.getlist(helpers.ACTION_CHECKBOX_NAME))
+
     def get_object(self, request, object_id, from_field=None):
-        cache_entries = CacheEntry.objects.all()
-        obj = next(filter(lambda c: c.pk == object_id, cache_entries), None)
+        obj = next(iter(CacheEntry.objects.get_entries([object_id])), None)
         if obj is None:
             raise Http404()
+        # The list only shows a preview of the result
+        obj.load_value()
         return obj
 
     @admin.display(description='Value')
@@ -1,14 +1,28 @@
+import atexit
 import datetime
-from typing import Any, Callable, Dict, Optional, Protocol, Tuple, Union
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Protocol, Set, Tuple, Union
 
+import django
 from django_rq import enqueue
 from django.core.cache import DEFAULT_CACHE_ALIAS
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
 from django.utils.module_loading import import_string
 from django.utils.timezone import now
 
 from update_cache.cache.cache import CacheResult, make_cache_key
 from update_cache.settings import settings
-from update_cache.utils import get_func_name
+from update_cache.utils import call_function, get_func_name
+
+
+logger = logging.getLogger(__name__)
 
 
 default_broker = object()
@@ -35,35 +49,275 @@ class SyncBroker:
             args = ()
             kwargs = {}
         f = getattr(f, '__wrapped__', None) or f
-        live_result = f(*args, **kwargs)
-        result = CacheResult(
-            result=live_result,
-            expires=now() + datetime.timedelta(seconds=timeout),
-            calling_args=calling_args
-        )
         cache_key = make_cache_key(f, calling_args)
-        f.cache.set_active(cache_key, result)
+        try:
+            # Read before computing, a result computed during an invalidation must not be written as current
+            versions = f.cache.get_versions([(args, kwargs)])
+            started = time.perf_counter()
+            live_result = call_function(f, *args, **kwargs)
+            f.cache.set_active(cache_key, make_result(f, live_result, timeout, calling_args,
+                                                      time.perf_counter() - started), versions)
+        finally:
+            f.cache.clear_refresh_pending(cache_key)
+
+    def many(self, f: Union[Callable, str], timeout: int,
+             calling_args_list: List[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+             backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+        f = import_string(f) if isinstance(f, str) else f
+        f = getattr(f, '__wrapped__', None) or f
+        cache_keys = [make_cache_key(f, calling_args) for calling_args in calling_args_list]
+        try:
+            versions = f.cache.get_versions(calling_args_list)
+            results = {}
+            for cache_key, (args, kwargs) in zip(cache_keys, calling_args_list):
+                started = time.perf_counter()
+                live_result = call_function(f, *args, **kwargs)
+                results[cache_key] = make_result(f, live_result, timeout, (args, kwargs),
+                                                 time.perf_counter() - started)
+            f.cache.set_many_active(results, versions)
+        finally:
+            f.cache.clear_many_refresh_pending(cache_keys)
 
 
 sync_broker = SyncBroker()
 
 
+def make_result(f: Callable, result: Any, timeout: int, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                delta: Optional[float] = None) -> CacheResult:
+    # Decorated functions make their results like their update handler does, with the same expiry jitter
+    if (update_handler := getattr(f.cache, 'update_handler', None)) is not None:
+        return update_handler.make_result(result, calling_args, delta)
+    return CacheResult(
+        result=result,
+        expires=now() + datetime.timedelta(seconds=timeout),
+        calling_args=calling_args,
+        delta=delta
+    )
+
+
+class SyncViewBroker:
+    """
+    Refreshes a cached view with a request built from the data of the original request.
+    """
+
+    def __call__(self, f: Union[Callable, str], timeout: int,
+                 calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
+                 backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+        f = import_string(f) if isinstance(f, str) else f
+        try:
+            f.cache.update_handler.refresh(calling_args)
+        finally:
+            f.cache.clear_refresh_pending(make_cache_key(f, calling_args))
+
+
+sync_view_broker = SyncViewBroker()
+
+
 class AsyncBroker:
 
+    refresh_broker = sync_broker
+
     def __call__(self, f: Union[Callable, str], timeout: int,
                  calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
                  backend: Optional[str] = DEFAULT_CACHE_ALIAS):
-        enqueue(sync_broker, get_func_name(f), timeout, calling_args, backend)
+        f = import_string(f) if isinstance(f, str) else f
+        cache_key = make_cache_key(f, calling_args)
+        # Enqueue at most one refresh per cache key; the marker is cleared by the sync broker once the job has run
+        if not f.cache.mark_refresh_pending(cache_key, settings.REFRESH_PENDING_TIMEOUT):
+            return
+        try:
+            enqueue(self.refresh_broker, get_func_name(f), timeout, calling_args, backend)
+        except Exception:
+            f.cache.clear_refresh_pending(cache_key)
+            raise
+
+    def many(self, f: Union[Callable, str], timeout: int,
+             calling_args_list: List[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+             backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+        f = import_string(f) if isinstance(f, str) else f
+        pending = {}
+        for calling_args in calling_args_list:
+            cache_key = make_cache_key(f, calling_args)
+            if cache_key not in pending and f.cache.mark_refresh_pending(cache_key, settings.REFRESH_PENDING_TIMEOUT):
+                pending[cache_key] = calling_args
+        if not pending:
+            return
+        try:
+            enqueue(self.refresh_broker.many, get_func_name(f), timeout, list(pending.values()), backend)
+        except Exception:
+            f.cache.clear_many_refresh_pending(list(pending))
+            raise
 
 
 async_broker = AsyncBroker()
 
 
+class AsyncViewBroker(AsyncBroker):
+
+    refresh_broker = sync_view_broker
+
+
+async_view_broker = AsyncViewBroker()
+
+
+def refresh(broker: Broker, f: Union[Callable, str], timeout: int,
+            calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
+            backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+    try:
+        broker(f, timeout, calling_args, backend)
+    finally:
+        # Workers live longer than a request, clean up their database connections like a request would
+        close_old_connections()
+
+
+class PoolBroker:
+    """
+    Refreshes results on an executor in this process. At most one refresh per cache key is in flight, and at most
+    `max_queue` refreshes are queued or running; refreshes over that limit are dropped or run inline, depending on
+    `overflow`.
+    """
+
+    max_workers: int
+
+    max_queue: int
+
+    overflow: str
+
+    refresh_broker = sync_broker
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None,
+                 overflow: Optional[str] = None):
+        self.max_workers = max_workers or settings.BROKER_MAX_WORKERS
+        self.max_queue = max_queue or settings.BROKER_MAX_QUEUE
+        self.overflow = overflow or settings.BROKER_OVERFLOW
+        if self.overflow not in ('drop', 'inline'):
+            raise ValueError(f'Unknown overflow policy: {self.overflow}')
+        self._lock = threading.Lock()
+        self._in_flight: Set[str] = set()
+        self._executor: Optional[Executor] = None
+
+    def __call__(self, f: Union[Callable, str], timeout: int,
+                 calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
+                 backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+        f = import_string(f) if isinstance(f, str) else f
+        cache_key = make_cache_key(f, calling_args)
+        with self._lock:
+            if cache_key in self._in_flight:
+                return
+            full = len(self._in_flight) >= self.max_queue
+            if not full:
+                self._in_flight.add(cache_key)
+
+        if full:
+            if self.overflow == 'inline':
+                self.refresh_broker(f, timeout, calling_args, backend)
+            else:
+                logger.warning(f'Refresh queue is full, dropping refresh for {cache_key}')
+            return
+
+        try:
+            future = self.get_executor().submit(refresh, self.refresh_broker, self.get_task_function(f), timeout,
+                                                calling_args, backend)
+        except Exception:
+            self._done(cache_key)
+            raise
+        future.add_done_callback(lambda fut: self._done(cache_key, fut))
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self.create_executor()
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def create_executor(self) -> Executor:
+        raise NotImplementedError()
+
+    def get_task_function(self, f: Callable) -> Union[Callable, str]:
+        return f
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            # Queued refreshes are dropped, running refreshes are finished
+            executor.shutdown(wait=wait, cancel_futures=True)
+            atexit.unregister(self.shutdown)
+
+    def _done(self, cache_key: str, future: Optional[Future] = None):
+        with self._lock:
+            self._in_flight.discard(cache_key)
+        if future is not None and not future.cancelled() and future.exception() is not None:
+            logger.error(f'Refreshing {cache_key} failed', exc_info=future.exception())
+
+
+class ThreadPoolBroker(PoolBroker):
+
+    def create_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='update_cache')
+
+
+class ThreadPoolViewBroker(ThreadPoolBroker):
+
+    refresh_broker = sync_view_broker
+
+
+class ProcessPoolBroker(PoolBroker):
+    """
+    Refreshes results in worker processes, for CPU-bound functions. Workers are spawned and set up Django from
+    `DJANGO_SETTINGS_MODULE`; the functions and their arguments must be picklable.
+    """
+
+    def create_executor(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=django.setup)
+
+    def get_task_function(self, f: Callable) -> Union[Callable, str]:
+        # Workers import the function by name
+        return get_func_name(f)
+
+
+def call_many(broker: Broker, f: Union[Callable, str], timeout: int,
+              calling_args_list: List[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+              backend: Optional[str] = DEFAULT_CACHE_ALIAS):
+    # Brokers without batch support get one call per argument tuple
+    if (many := getattr(broker, 'many', None)) is not None:
+        many(f, timeout, calling_args_list, backend)
+        return
+    for calling_args in calling_args_list:
+        broker(f, timeout, calling_args, backend)
+
+
 def get_broker(broker: Broker = default_broker):
     if broker is default_broker:
         try:
-            broker_class = import_string(settings.DEFAULT_BROKER)
-            return broker_class()
+            return load_broker(settings.DEFAULT_BROKER)
         except ImportError:
             return sync_broker
     return broker
+
+
+def get_view_broker(broker: Broker = default_broker):
+    if broker is default_broker:
+        try:
+            return load_broker(settings.DEFAULT_VIEW_BROKER)
+        except ImportError:
+            return sync_view_broker
+    return broker
+
+
+@functools.lru_cache(maxsize=None)
+def load_broker(path: str) -> Broker:
+    # Brokers are shared, pool brokers keep their executor and in-flight keys between calls
+    return import_string(path)()
+
+
+@receiver(setting_changed)
+def reset_brokers(*, setting, **kwargs):
+    if setting in ('DUC_DEFAULT_BROKER', 'DUC_DEFAULT_VIEW_BROKER', 'DUC_BROKER_MAX_WORKERS', 'DUC_BROKER_MAX_QUEUE',
+                   'DUC_BROKER_OVERFLOW'):
+        load_broker.cache_clear()
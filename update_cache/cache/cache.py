@@ -1,44 +1,180 @@
 import datetime
 import hashlib
+import math
+import random
+import reprlib
 from dataclasses import dataclass
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple, Union
+from urllib.parse import urlencode
 
 from django.conf import settings
+from django.core.cache.backends.base import BaseCache
 from django.http import HttpRequest
 from django.utils.timezone import get_current_timezone_name, now
 from django.utils.translation import get_language
 
+from update_cache.cache.fingerprint import fingerprint
 from update_cache.utils import get_func_name
 
 
 CACHE_KEY_PREFIX = 'duc'
 
-ACTIVE_VERSION = 1
-EXPIRED_VERSION = 2
+# Versions of the entries written by previous versions, which kept active and expired results apart
+LEGACY_ACTIVE_VERSION = 1
+LEGACY_EXPIRED_VERSION = 2
+# Active and expired results share one entry, expiry is decided by the expiry time
+ENTRY_VERSION = 3
+
+# Length of the previews of results and calling arguments in entry metadata
+PREVIEW_LENGTH = 100
 
 
 missing = object()
 
+# Tags of the entries of a function: fixed, or computed from the calling arguments
+Tags = Union[Sequence[str], Callable[..., Iterable[str]]]
+
 
 @dataclass
 class CacheResult:
     result: Any
     expires: datetime.datetime
     calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None
+    # Seconds it took to compute the result
+    delta: Optional[float] = None
+    # Generation of the function the result was written in, see CachedFunction.invalidate_all
+    generation: int = 0
+    # Versions of the tags of the entry when the result was written, see FunctionCacheRegistry.invalidate_tag
+    tags: Optional[Dict[str, int]] = None
+
+    @property
+    def has_expired(self) -> bool:
+        return now() >= self.expires
+
+    def should_refresh_early(self, beta: float = 1.0) -> bool:
+        """
+        Probabilistic early expiration (XFetch): refresh with a chance that rises as the expiry gets closer, sooner
+        for results that take longer to compute. A higher `beta` refreshes earlier.
+        """
+        if not self.delta:
+            return False
+        gap = -self.delta * beta * math.log(1.0 - random.random())
+        return now() + datetime.timedelta(seconds=gap) >= self.expires
+
+
+@dataclass
+class EntryMeta:
+    """
+    Small record stored next to a cache entry, read without loading the result.
+    """
+    expires: datetime.datetime
+    etag: Optional[str] = None
+    # Timestamp
+    last_modified: Optional[int] = None
+    calling_args: str = ''
+    result_type: str = ''
+    preview: str = ''
+    # Bytes of the encoded payload, unknown for payloads pickled by the cache backend
+    size: Optional[int] = None
+    generation: int = 0
+    tags: Optional[Dict[str, int]] = None
 
     @property
     def has_expired(self) -> bool:
         return now() >= self.expires
 
+    @classmethod
+    def from_result(cls, value: CacheResult, size: Optional[int] = None, preview: bool = False) -> 'EntryMeta':
+        """
+        The metadata of the entry. The previews of the calling arguments and the result are only made when asked for,
+        since formatting them takes time on every write.
+        """
+        result_type = type(value.result)
+        return cls(
+            expires=value.expires,
+            etag=getattr(value.result, 'etag', None),
+            last_modified=getattr(value.result, 'last_modified', None),
+            calling_args=make_preview(value.calling_args) if preview and value.calling_args is not None else '',
+            result_type=f'{result_type.__module__}.{result_type.__qualname__}',
+            preview=make_preview(value.result) if preview else '',
+            size=size,
+            generation=value.generation,
+            tags=value.tags
+        )
+
+
+_preview_repr = reprlib.Repr()
+_preview_repr.maxstring = _preview_repr.maxother = PREVIEW_LENGTH
+
+
+def make_preview(value: Any, length: int = PREVIEW_LENGTH) -> str:
+    """
+    Short text of a value. Containers and strings are shortened before they are formatted, so large values are not
+    formatted in full.
+    """
+    if isinstance(value, str):
+        return value[:length]
+    if isinstance(value, (bytes, bytearray, tuple, list, dict, set, frozenset)):
+        return _preview_repr.repr(value)[:length]
+    return str(value)[:length]
+
 
 def make_cache_key(f: Callable, calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None) -> str:
-    func_name = get_func_name(f)
-    arg_part = hashlib.md5(str(calling_args).encode(), usedforsecurity=False).hexdigest()
-    return ':'.join([CACHE_KEY_PREFIX, func_name, arg_part])
+    # Decorated functions build their keys from a precomputed prefix and their own fingerprint and key function
+    if (cached_function := getattr(f, 'cache', None)) is not None:
+        return cached_function.make_key(calling_args)
+    return ':'.join([CACHE_KEY_PREFIX, get_func_name(f), fingerprint(calling_args)])
+
+
+def make_tag_key(tag: str) -> str:
+    return ':'.join([CACHE_KEY_PREFIX, 'tag', tag])
 
 
-def make_view_cache_key(request: HttpRequest, method: str) -> str:
-    url = hashlib.md5(request.build_absolute_uri().encode("ascii"), usedforsecurity=False)
+def increment_counter(cache: BaseCache, key: str, delta: int = 1, version: Optional[int] = None, start: int = 0):
+    """
+    Adds the delta to the counter, starting missing counters at `start`.
+    """
+    try:
+        cache.incr(key, delta, version=version)
+    except ValueError:
+        # Another process may have added the key in the meantime
+        if not cache.add(key, start + delta, timeout=None, version=version):
+            cache.incr(key, delta, version=version)
+
+
+def make_view_cache_key(request: HttpRequest, method: str, headers: Sequence[str] = (),
+                        params: Optional[Sequence[str]] = None) -> str:
+    """
+    Key of a view response for the request, keyed on the values of the request headers the response varies on. With
+    `params`, only those query parameters are part of the key.
+    """
+    url = hashlib.md5(get_view_url(request, params).encode("ascii"), usedforsecurity=False)
+    headers_part = get_headers_digest(request, headers) if headers else None
     language_part = getattr(request, "LANGUAGE_CODE", get_language()) if settings.USE_I18N else None
     timezone_part = get_current_timezone_name() if settings.USE_TZ else None
-    return ':'.join(filter(None, [CACHE_KEY_PREFIX, method, url.hexdigest(), language_part, timezone_part]))
+    return ':'.join(filter(None, [CACHE_KEY_PREFIX, method, url.hexdigest(), headers_part, language_part,
+                                  timezone_part]))
+
+
+def make_view_headers_key(request: HttpRequest, params: Optional[Sequence[str]] = None) -> str:
+    """
+    Key of the list of request headers the responses of the URL vary on.
+    """
+    url = hashlib.md5(get_view_url(request, params).encode("ascii"), usedforsecurity=False)
+    language_part = getattr(request, "LANGUAGE_CODE", get_language()) if settings.USE_I18N else None
+    return ':'.join(filter(None, [CACHE_KEY_PREFIX, 'headers', url.hexdigest(), language_part]))
+
+
+def get_view_url(request: HttpRequest, params: Optional[Sequence[str]] = None) -> str:
+    if params is None:
+        return request.build_absolute_uri()
+    # Other parameters are left out, the parameters are sorted by name; the order of the values of a parameter is kept
+    query = urlencode([(name, value) for name in sorted(set(params)) for value in request.GET.getlist(name)])
+    return request.build_absolute_uri(request.path) + (f'?{query}' if query else '')
+
+
+def get_headers_digest(request: HttpRequest, headers: Sequence[str]) -> str:
+    digest = hashlib.md5(usedforsecurity=False)
+    for header in sorted(set(header.lower() for header in headers)):
+        digest.update(f'{header}:{request.headers.get(header, "")}\n'.encode())
+    return digest.hexdigest()
@@ -0,0 +1,255 @@
+import datetime
+import decimal
+import enum
+import hashlib
+import marshal
+import operator
+import pickle
+import struct
+import uuid
+from typing import Any, Callable, Tuple
+
+
+def fingerprint(value: Any) -> str:
+    """
+    Digest of a canonical encoding of the value. Equal values give equal digests, regardless of dict and set ordering,
+    and without building the string representation of large arguments.
+
+    The marshal format may change between Python versions, and with it the digests and the cache keys built from
+    them: entries cached by another Python version are not read, and are computed again.
+    """
+    value = _canonical(value)
+    try:
+        # Marshal format version 2 has no references, so equal values encode the same regardless of object identity
+        data = marshal.dumps(value, 2)
+    except ValueError:
+        # Values of other types are encoded part by part
+        hasher = hashlib.blake2b(digest_size=16)
+        _encode(value, hasher.update)
+        return hasher.hexdigest()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def str_fingerprint(value: Any) -> str:
+    """
+    Digest of the string representation of the value, as used by previous versions.
+    """
+    return hashlib.md5(str(value).encode(), usedforsecurity=False).hexdigest()
+
+
+_scalar_types = frozenset([type(None), bool, int, float, str, bytes])
+
+# Sorted keys of small dicts with string keys and a getter of their values in that order, by the keys in insertion
+# order. Keyword arguments come in the order of their call sites, so there are few of them, and most dicts are not
+# sorted again.
+_key_orders = {}
+
+_MAX_KEY_ORDERS = 1024
+
+_MAX_ORDERED_KEYS = 16
+
+# Tags of the tuples replacing dicts, sets and model instances. Sets are always replaced, so frozensets don't otherwise
+# appear in canonical values.
+_DICT = frozenset([0])
+_SET = frozenset([1])
+_MODEL = frozenset([2])
+
+
+def _canonical(value: Any) -> Any:
+    """
+    Value with the same encoding for equal values: dicts, sets and model instances are replaced by tagged tuples, with
+    dict keys and set members in sorted order.
+    """
+    value_type = type(value)
+    if value_type in _scalar_types:
+        return value
+    if value_type is tuple or value_type is list:
+        if _scalar_types.issuperset(map(type, value)):
+            return value
+        return value_type(map(_canonical, value))
+    if value_type is dict:
+        if len(value) < 2:
+            # Dicts are encoded in insertion order, which only matters for more than one key
+            if _scalar_types.issuperset(map(type, value.values())):
+                return value
+            return {key: _canonical(item) for key, item in value.items()}
+        keys, get_values = _get_key_order(value)
+        values = get_values(value)
+        if _scalar_types.issuperset(map(type, values)):
+            return _DICT, keys, values
+        return _DICT, keys, tuple(map(_canonical, values))
+    if value_type is set or value_type is frozenset:
+        return _SET, sorted(map(fingerprint, value))
+    if hasattr(value, '_meta') and hasattr(value, 'pk'):
+        # Django model instance, unsaved instances are told apart by their field values
+        if value.pk is not None:
+            return _MODEL, value._meta.label, value.pk
+        return _MODEL, value._meta.label, None, _canonical(_get_field_values(value))
+    return value
+
+
+def _get_key_order(value: dict) -> Tuple[tuple, Callable[[dict], tuple]]:
+    """
+    Keys of the dict, with two or more keys, in sorted order, and a getter of its values in the same order.
+    """
+    keys = tuple(value)
+    try:
+        return _key_orders[keys]
+    except KeyError:
+        pass
+    try:
+        order = tuple(sorted(keys))
+    except TypeError:
+        # Keys that can't be compared to each other
+        order = tuple(sorted(keys, key=fingerprint))
+    key_order = order, operator.itemgetter(*order)
+    if len(keys) <= _MAX_ORDERED_KEYS and all(type(key) is str for key in keys):
+        if len(_key_orders) >= _MAX_KEY_ORDERS:
+            _key_orders.clear()
+        _key_orders[keys] = key_order
+    elif not _scalar_types.issuperset(map(type, keys)):
+        key_order = tuple(map(_canonical, order)), key_order[1]
+    return key_order
+
+
+def _get_field_values(instance) -> tuple:
+    return tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+def _encode(value: Any, update: Callable[[bytes], None]):
+    encoder = _encoders.get(type(value))
+    if encoder is not None:
+        encoder(value, update)
+        return
+
+    for value_type, encoder in _subclass_encoders:
+        if isinstance(value, value_type):
+            update(b'c' + _encode_str(type(value).__qualname__))
+            encoder(value, update)
+            return
+
+    if hasattr(value, '_meta') and hasattr(value, 'pk'):
+        # Django model instance
+        update(b'm' + _encode_str(value._meta.label))
+        _encode(value.pk if value.pk is not None else _get_field_values(value), update)
+        return
+
+    try:
+        data = pickle.dumps(value, protocol=4)
+    except Exception:
+        data = repr(value).encode()
+    update(b'p%d:' % len(data))
+    update(data)
+
+
+def _encode_str(value: str) -> bytes:
+    data = value.encode('utf-8', 'surrogatepass')
+    return b'%d:' % len(data) + data
+
+
+def _encode_none(value, update):
+    update(b'N')
+
+
+def _encode_bool(value, update):
+    update(b'T' if value else b'F')
+
+
+def _encode_int(value, update):
+    update(b'i%d;' % value)
+
+
+def _encode_float(value, update):
+    update(b'f' + struct.pack('!d', value))
+
+
+def _encode_string(value, update):
+    update(b's' + _encode_str(value))
+
+
+def _encode_bytes(value, update):
+    update(b'b%d:' % len(value))
+    update(bytes(value))
+
+
+def _encode_sequence(value, update):
+    update(b'l%d:' % len(value))
+    for item in value:
+        _encode(item, update)
+
+
+def _encode_tuple(value, update):
+    update(b't%d:' % len(value))
+    for item in value:
+        _encode(item, update)
+
+
+def _encode_dict(value, update):
+    update(b'd%d:' % len(value))
+    if all(type(key) is str for key in value):
+        items = sorted(value.items())
+    else:
+        items = sorted(value.items(), key=lambda item: fingerprint(item[0]))
+    for key, item in items:
+        _encode(key, update)
+        _encode(item, update)
+
+
+def _encode_set(value, update):
+    update(b'S%d:' % len(value))
+    for digest in sorted(map(fingerprint, value)):
+        update(digest.encode())
+
+
+def _encode_datetime(value, update):
+    update(b'D' + _encode_str(value.isoformat()))
+
+
+def _encode_decimal(value, update):
+    update(b'n' + _encode_str(str(value)))
+
+
+def _encode_uuid(value, update):
+    update(b'u' + value.bytes)
+
+
+def _encode_enum(value, update):
+    update(b'e' + _encode_str(type(value).__qualname__))
+    _encode(value.value, update)
+
+
+_encoders = {
+    type(None): _encode_none,
+    bool: _encode_bool,
+    int: _encode_int,
+    float: _encode_float,
+    str: _encode_string,
+    bytes: _encode_bytes,
+    bytearray: _encode_bytes,
+    memoryview: _encode_bytes,
+    list: _encode_sequence,
+    tuple: _encode_tuple,
+    dict: _encode_dict,
+    set: _encode_set,
+    frozenset: _encode_set,
+    datetime.datetime: _encode_datetime,
+    datetime.date: _encode_datetime,
+    datetime.time: _encode_datetime,
+    decimal.Decimal: _encode_decimal,
+    uuid.UUID: _encode_uuid,
+}
+
+
+# Checked in order, enums before their value types
+_subclass_encoders = [
+    (enum.Enum, _encode_enum),
+    (str, _encode_string),
+    (int, _encode_int),
+    (float, _encode_float),
+    (tuple, _encode_tuple),
+    (list, _encode_sequence),
+    (dict, _encode_dict),
+    ((set, frozenset), _encode_set),
+    (datetime.date, _encode_datetime),
+    (datetime.time, _encode_datetime),
+]
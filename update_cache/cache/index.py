@@ -0,0 +1,277 @@
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Protocol, Union
+
+from django.conf import settings as django_settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.redis import RedisCache, RedisCacheClient
+
+from update_cache.cache.locks import CacheLock, backoff_delays
+from update_cache.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Writes of a shard that are dropped by the backend are retried this many times, while holding the lock of the shard
+MAX_WRITE_ATTEMPTS = 3
+
+
+class KeyIndex(Protocol):
+
+    def add(self, key: str):
+        ...
+
+    def add_many(self, keys: Iterable[str]):
+        ...
+
+    def delete(self, key: str):
+        ...
+
+    def delete_many(self, keys: Iterable[str]):
+        ...
+
+    def __contains__(self, key: str) -> bool:
+        ...
+
+    def __iter__(self) -> Iterator[str]:
+        ...
+
+    def __len__(self) -> int:
+        ...
+
+    def slice(self, start: int, stop: Optional[int] = None) -> List[str]:
+        """
+        The keys from `start` to `stop`, in the order of the index, reading only the part of the index they are in.
+        """
+        ...
+
+
+class ShardedKeyIndex:
+    """
+    Index of cache keys, spread over a fixed number of sets by hash. A set is only updated while holding a lock on it,
+    so concurrent updates are not lost, and the size of an update is bounded by the size of one shard. Every indexed
+    key also has a small marker entry, so adding a key that is already indexed doesn't read its shard. The size of
+    every shard is stored next to it, so the index is counted and sliced without reading the shards.
+    """
+
+    cache: BaseCache
+
+    name: str
+
+    shards: int
+
+    def __init__(self, cache: BaseCache, name: str, shards: int = 64):
+        self.cache = cache
+        self.name = name
+        self.shards = shards
+
+    def add(self, key: str):
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable[str]):
+        markers = {self._make_marker_key(key): key for key in keys}
+        indexed = self.cache.get_many(list(markers))
+        new_keys = [key for marker_key, key in markers.items() if marker_key not in indexed]
+        for shard, shard_keys in self._group(new_keys).items():
+            if self._update(shard, lambda entries: entries | shard_keys):
+                # Markers are only written once the keys are in their shard
+                self.cache.set_many({self._make_marker_key(key): True for key in shard_keys}, timeout=None)
+
+    def delete(self, key: str):
+        self.delete_many([key])
+
+    def delete_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        self.cache.delete_many([self._make_marker_key(key) for key in keys])
+        for shard, shard_keys in self._group(keys).items():
+            if shard_keys & (self.cache.get(self._make_shard_key(shard)) or set()):
+                self._update(shard, lambda entries: entries - shard_keys)
+
+    def __contains__(self, key: str) -> bool:
+        return self.cache.get(self._make_marker_key(key)) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        # One shard at a time, so only one shard is held in memory
+        for shard in range(self.shards):
+            yield from self.cache.get(self._make_shard_key(shard)) or ()
+
+    def __len__(self) -> int:
+        return sum(self._get_sizes())
+
+    def slice(self, start: int, stop: Optional[int] = None) -> List[str]:
+        # Ordered by shard, then by key; shards outside the slice are skipped by their size
+        shards, position = [], 0
+        for shard, size in enumerate(self._get_sizes()):
+            if stop is not None and position >= stop:
+                break
+            if position + size > start and size:
+                shards.append((shard, position))
+            position += size
+        entries = self.cache.get_many([self._make_shard_key(shard) for shard, _ in shards])
+        keys = []
+        for shard, position in shards:
+            shard_keys = sorted(entries.get(self._make_shard_key(shard)) or ())
+            keys += shard_keys[max(start - position, 0):None if stop is None else max(stop - position, 0)]
+        return keys
+
+    def _get_sizes(self) -> List[int]:
+        size_keys = [self._make_size_key(shard) for shard in range(self.shards)]
+        sizes = self.cache.get_many(size_keys)
+        # Shards that were never written have no size
+        return [sizes.get(size_key, 0) for size_key in size_keys]
+
+    def _update(self, shard: int, update) -> bool:
+        """
+        Updates the shard under its lock. Gives up, leaving the shard as it is, when the lock isn't released within
+        `LOCK_WAIT_TIMEOUT` seconds or the cache drops `MAX_WRITE_ATTEMPTS` writes. Returns whether the shard was
+        updated.
+        """
+        shard_key = self._make_shard_key(shard)
+        lock = CacheLock(self.cache, ':'.join([shard_key, 'lock']), settings.LOCK_TIMEOUT)
+        for delay in backoff_delays(settings.LOCK_WAIT_TIMEOUT, 0.005, 0.1):
+            if lock.acquire():
+                break
+            time.sleep(delay)
+        else:
+            logger.warning('Gave up waiting for the lock on %s, the index is not updated', shard_key)
+            return False
+        try:
+            entries = update(self.cache.get(shard_key) or set())
+            # Some backends drop writes under contention without an error, like the database cache on SQLite; retry
+            # a few times, without stalling the request for the lifetime of the lock
+            values = {shard_key: entries, self._make_size_key(shard): len(entries)}
+            for attempt in range(MAX_WRITE_ATTEMPTS):
+                if attempt:
+                    time.sleep(0.005 * 2 ** attempt)
+                self.cache.set_many(values, timeout=None)
+                if self.cache.get_many(list(values)) == values:
+                    return True
+            logger.error('The cache dropped %d writes of %s, the index is not updated', MAX_WRITE_ATTEMPTS, shard_key)
+            return False
+        finally:
+            lock.release()
+
+    def _group(self, keys: Iterable[str]):
+        groups = {}
+        for key in keys:
+            groups.setdefault(self._get_shard(key), set()).add(key)
+        return groups
+
+    def _get_shard(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.shards
+
+    def _make_shard_key(self, shard: int) -> str:
+        return ':'.join([self.name, 'index', str(shard)])
+
+    def _make_size_key(self, shard: int) -> str:
+        return ':'.join([self.name, 'index', str(shard), 'size'])
+
+    def _make_marker_key(self, key: str) -> str:
+        return ':'.join([self.name, 'indexed', hashlib.blake2b(key.encode(), digest_size=16).hexdigest()])
+
+
+class RedisKeyIndex:
+    """
+    Index of cache keys in a native Redis sorted set, for the Redis cache backend. All keys have the same score, so they
+    are ordered by key and sliced by rank. The set is reached with a client of its own, made from the configuration of
+    the cache.
+    """
+
+    cache: BaseCache
+
+    name: str
+
+    def __init__(self, cache: BaseCache, name: str, location: Union[str, List[str]], options: Dict[str, Any]):
+        self.cache = cache
+        self.name = name
+        servers = location.split(';') if isinstance(location, str) else location
+        self._client = RedisCacheClient(servers, **options)
+
+    @property
+    def client(self):
+        return self._client.get_client(self._make_key(), write=True)
+
+    def add(self, key: str):
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable[str]):
+        if keys := list(keys):
+            self.client.zadd(self._make_key(), dict.fromkeys(keys, 0))
+
+    def delete(self, key: str):
+        self.client.zrem(self._make_key(), key)
+
+    def delete_many(self, keys: Iterable[str]):
+        if keys := list(keys):
+            self.client.zrem(self._make_key(), *keys)
+
+    def __contains__(self, key: str) -> bool:
+        return self.client.zscore(self._make_key(), key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for key, _ in self.client.zscan_iter(self._make_key()):
+            yield key.decode()
+
+    def __len__(self) -> int:
+        return self.client.zcard(self._make_key())
+
+    def slice(self, start: int, stop: Optional[int] = None) -> List[str]:
+        if stop is not None and stop <= start:
+            return []
+        keys = self.client.zrange(self._make_key(), start, -1 if stop is None else stop - 1)
+        return [key.decode() for key in keys]
+
+    def _make_key(self) -> str:
+        return self.cache.make_key(':'.join([self.name, 'index']))
+
+
+class NullKeyIndex:
+    """
+    Index for caches that store nothing, like the dummy cache.
+    """
+
+    def add(self, key: str):
+        pass
+
+    def add_many(self, keys: Iterable[str]):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def delete_many(self, keys: Iterable[str]):
+        pass
+
+    def __contains__(self, key: str) -> bool:
+        return False
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(())
+
+    def __len__(self) -> int:
+        return 0
+
+    def slice(self, start: int, stop: Optional[int] = None) -> List[str]:
+        return []
+
+
+def get_key_index(cache: BaseCache, name: str) -> KeyIndex:
+    if isinstance(cache, DummyCache):
+        return NullKeyIndex()
+    if isinstance(cache, RedisCache) and (config := get_cache_config(cache)) is not None:
+        return RedisKeyIndex(cache, name, config['LOCATION'], config.get('OPTIONS', {}))
+    return ShardedKeyIndex(cache, name, settings.INDEX_SHARDS)
+
+
+def get_cache_config(cache: BaseCache) -> Optional[Dict[str, Any]]:
+    """
+    The configuration of the cache in the CACHES setting, if it is one of the configured caches of this thread.
+    """
+    return next(
+        (config for alias, config in django_settings.CACHES.items() if caches[alias] is cache),
+        None
+    )
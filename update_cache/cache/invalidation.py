@@ -0,0 +1,126 @@
+import json
+from typing import List, Optional, Protocol, Tuple
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.utils.module_loading import import_string
+
+from update_cache.cache.cache import CACHE_KEY_PREFIX
+from update_cache.settings import settings
+
+
+# An invalidation is a (func_name, key) tuple, key is None for all keys of the function. (None, None) means that
+# invalidations may have been missed, and all local state should be dropped.
+Invalidation = Tuple[Optional[str], Optional[str]]
+
+INVALIDATE_ALL: Invalidation = (None, None)
+
+# Attempts to publish an invalidation under a generation no other invalidation has
+MAX_PUBLISH_ATTEMPTS = 5
+
+
+class InvalidationBroadcaster(Protocol):
+
+    def publish(self, func_name: str, key: Optional[str] = None):
+        ...
+
+    def poll(self) -> List[Invalidation]:
+        ...
+
+
+class CacheInvalidationBroadcaster:
+    """
+    Publishes invalidations through a cache backend: every invalidation increments a generation counter and is stored
+    under its generation. Processes poll the counter and read the invalidations they have not seen yet.
+
+    Backends without atomic increments, like the database cache, may give concurrent publishers the same generation.
+    Invalidations are added under their generation, so the publisher that finds it taken moves on to the next one.
+    This relies on an atomic `add`; the file based cache has neither and is not supported.
+    """
+
+    backend: str
+
+    timeout: int
+
+    max_events: int
+
+    def __init__(self, backend: str = DEFAULT_CACHE_ALIAS, timeout: int = 300, max_events: int = 1000):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_events = max_events
+        self._generation = None
+
+    @property
+    def cache(self):
+        return caches[self.backend]
+
+    def publish(self, func_name: str, key: Optional[str] = None):
+        for attempt in range(MAX_PUBLISH_ATTEMPTS):
+            if self.cache.add(self._make_key(self._next_generation()), (func_name, key), timeout=self.timeout):
+                return
+        # The generations kept being taken, other processes drop all local state instead of missing the invalidation
+        self.cache.set(self._make_key(self._next_generation()), INVALIDATE_ALL, timeout=self.timeout)
+
+    def _next_generation(self) -> int:
+        self.cache.add(self._make_key(), 0, timeout=None)
+        return self.cache.incr(self._make_key())
+
+    def poll(self) -> List[Invalidation]:
+        generation = self.cache.get(self._make_key(), 0)
+        last_generation, self._generation = self._generation, generation
+        if last_generation is None or generation == last_generation:
+            return []
+
+        # The counter was reset or we are too far behind, drop everything
+        if generation < last_generation or generation - last_generation > self.max_events:
+            return [INVALIDATE_ALL]
+
+        keys = [self._make_key(g) for g in range(last_generation + 1, generation + 1)]
+        values = self.cache.get_many(keys)
+        if len(values) != len(keys):
+            return [INVALIDATE_ALL]
+        return [values[key] for key in keys]
+
+    @staticmethod
+    def _make_key(generation: Optional[int] = None):
+        parts = [CACHE_KEY_PREFIX, 'invalidation']
+        if generation is not None:
+            parts.append(str(generation))
+        return ':'.join(parts)
+
+
+class RedisInvalidationBroadcaster:
+    """
+    Publishes invalidations through Redis pub/sub. Every process subscribes to the channel and drains its pending
+    messages when polling.
+    """
+
+    channel: str
+
+    def __init__(self, url: Optional[str] = None, channel: str = 'duc:invalidation', client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        self.client = client
+        self.channel = channel
+        self._pubsub = None
+
+    def publish(self, func_name: str, key: Optional[str] = None):
+        self.client.publish(self.channel, json.dumps([func_name, key]))
+
+    def poll(self) -> List[Invalidation]:
+        if self._pubsub is None:
+            self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(self.channel)
+
+        invalidations = []
+        while (message := self._pubsub.get_message(timeout=0)) is not None:
+            func_name, key = json.loads(message['data'])
+            invalidations.append((func_name, key))
+        return invalidations
+
+
+def get_broadcaster() -> Optional[InvalidationBroadcaster]:
+    if not settings.INVALIDATION_BROADCASTER:
+        return None
+    broadcaster_class = import_string(settings.INVALIDATION_BROADCASTER)
+    return broadcaster_class(**settings.INVALIDATION_OPTIONS)
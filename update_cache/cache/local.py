@@ -0,0 +1,68 @@
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from update_cache.cache.cache import missing
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache, used as a first tier in front of the configured cache backend. Entries are evicted
+    when there are more than `max_entries` entries, or when their approximate (pickled) size exceeds `max_bytes`.
+    """
+
+    max_entries: int
+
+    max_bytes: Optional[int]
+
+    def __init__(self, max_entries: int = 1000, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = missing) -> Any:
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        size = self._get_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            self.delete(key)
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self._size += size
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self._size > self.max_bytes):
+                self._size -= self._data.popitem(last=False)[1][1]
+
+    def delete(self, key: str):
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get_size(self, value: Any) -> int:
+        if self.max_bytes is None:
+            return 0
+        try:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return 0
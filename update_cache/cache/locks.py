@@ -0,0 +1,133 @@
+import asyncio
+import threading
+import uuid
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from django.core.cache.backends.base import BaseCache
+
+
+class CacheLock:
+    """
+    Lock taken through the cache backend with `cache.add`, so it is shared between processes. The lock is a lease:
+    it expires after `timeout` seconds, even if the holder never releases it.
+    """
+
+    cache: BaseCache
+
+    key: str
+
+    timeout: int
+
+    token: Optional[str]
+
+    def __init__(self, cache: BaseCache, key: str, timeout: int):
+        self.cache = cache
+        self.key = key
+        self.timeout = timeout
+        self.token = None
+
+    def acquire(self) -> bool:
+        token = uuid.uuid4().hex
+        if self.cache.add(self.key, token, timeout=self.timeout):
+            self.token = token
+            return True
+        return False
+
+    async def aacquire(self) -> bool:
+        token = uuid.uuid4().hex
+        if await self.cache.aadd(self.key, token, timeout=self.timeout):
+            self.token = token
+            return True
+        return False
+
+    def release(self):
+        if self.token is None:
+            return
+        # Only delete the lock if we still hold it; the lease may have expired and been taken by someone else
+        if self.cache.get(self.key) == self.token:
+            self.cache.delete(self.key)
+        self.token = None
+
+    async def arelease(self):
+        if self.token is None:
+            return
+        if await self.cache.aget(self.key) == self.token:
+            await self.cache.adelete(self.key)
+        self.token = None
+
+
+class SingleFlight:
+    """
+    Shares in-flight calls between threads in one process: the first caller for a key runs the function, other
+    callers for the same key wait for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """
+    Shares in-flight calls between tasks in one event loop: the first caller for a key awaits the coroutine function,
+    other callers for the same key await its result.
+    """
+
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key: str, fn: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        calls: Dict[str, asyncio.Future] = self._calls.setdefault(loop, {})
+        if (future := calls.get(key)) is not None:
+            return await asyncio.shield(future)
+
+        future = calls[key] = loop.create_future()
+        try:
+            result = await fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Don't warn about an exception that no other caller was waiting for
+            future.exception()
+            raise
+        finally:
+            del calls[key]
+
+
+def backoff_delays(total: float, initial: float = 0.05, maximum: float = 1.0) -> Iterator[float]:
+    """
+    Exponentially increasing delays, until they add up to `total` seconds.
+    """
+    delay, waited = initial, 0.0
+    while waited < total:
+        yield delay
+        waited += delay
+        delay = min(delay * 2, maximum)
@@ -0,0 +1,191 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from django.core.cache import caches, DEFAULT_CACHE_ALIAS
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from update_cache.cache.cache import CACHE_KEY_PREFIX, increment_counter
+from update_cache.settings import settings
+
+
+# Counters
+HITS = 'hits'
+STALE_HITS = 'stale_hits'
+MISSES = 'misses'
+REFRESHES = 'refreshes'
+
+COUNTERS = (HITS, STALE_HITS, MISSES, REFRESHES)
+
+# Histograms
+COMPUTE_SECONDS = 'compute_seconds'
+BACKEND_SECONDS = 'backend_seconds'
+PAYLOAD_BYTES = 'payload_bytes'
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    COMPUTE_SECONDS: SECONDS_BUCKETS,
+    BACKEND_SECONDS: SECONDS_BUCKETS,
+    PAYLOAD_BYTES: BYTES_BUCKETS,
+}
+
+# Counter values per (metric, function)
+Counters = Dict[Tuple[str, str], int]
+
+# Observations per bucket (the last bucket is +Inf) and the sum of the observations per (metric, function)
+Histograms = Dict[Tuple[str, str], Tuple[List[int], float]]
+
+
+class MetricsSink(Protocol):
+
+    def increment(self, name: str, function: str, value: int = 1):
+        ...
+
+    def observe(self, name: str, function: str, value: float):
+        ...
+
+
+class NullMetricsSink:
+    """
+    Drops all metrics, the default.
+    """
+
+    def increment(self, name: str, function: str, value: int = 1):
+        pass
+
+    def observe(self, name: str, function: str, value: float):
+        pass
+
+
+class InMemoryMetricsSink:
+    """
+    Keeps the metrics in this process, to be scraped from every process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Counters = {}
+        self._histograms: Dict[Tuple[str, str], Tuple[List[int], List[float]]] = {}
+
+    def increment(self, name: str, function: str, value: int = 1):
+        with self._lock:
+            self._counters[name, function] = self._counters.get((name, function), 0) + value
+
+    def observe(self, name: str, function: str, value: float):
+        buckets = HISTOGRAMS[name]
+        with self._lock:
+            if (histogram := self._histograms.get((name, function))) is None:
+                histogram = self._histograms[name, function] = ([0] * (len(buckets) + 1), [0.0])
+            counts, total = histogram
+            counts[bisect.bisect_left(buckets, value)] += 1
+            total[0] += value
+
+    def collect(self) -> Tuple[Counters, Histograms]:
+        with self._lock:
+            return dict(self._counters), {
+                key: (list(counts), total[0]) for key, (counts, total) in self._histograms.items()
+            }
+
+
+class CacheMetricsSink:
+    """
+    Keeps the metrics in a cache backend, shared by all processes. Every metric is an increment in the cache backend,
+    so this is meant for low traffic sites and for tuning timeouts, not for production traffic.
+    """
+
+    def __init__(self, backend: str = DEFAULT_CACHE_ALIAS):
+        self.cache = caches[backend]
+
+    def increment(self, name: str, function: str, value: int = 1):
+        increment_counter(self.cache, self._make_key(name, function), value)
+
+    def observe(self, name: str, function: str, value: float):
+        bucket = bisect.bisect_left(HISTOGRAMS[name], value)
+        increment_counter(self.cache, self._make_key(name, function, str(bucket)))
+        # Sums are stored as integers, seconds in microseconds
+        increment_counter(self.cache, self._make_key(name, function, 'sum'), round(value * _get_scale(name)))
+
+    def collect(self) -> Tuple[Counters, Histograms]:
+        from update_cache.cache.registry import function_cache_registry
+
+        functions = [cached_function.func_name for cached_function in function_cache_registry]
+        keys = {}
+        for function in functions:
+            keys.update({self._make_key(name, function): (name, function) for name in COUNTERS})
+            for name, buckets in HISTOGRAMS.items():
+                keys.update({self._make_key(name, function, str(bucket)): (name, function, bucket)
+                             for bucket in range(len(buckets) + 1)})
+                keys[self._make_key(name, function, 'sum')] = (name, function, 'sum')
+
+        counters, histograms = {}, {}
+        for key, value in self.cache.get_many(list(keys)).items():
+            name, function, *part = keys[key]
+            if not part:
+                counters[name, function] = value
+                continue
+            counts, total = histograms.get((name, function)) or ([0] * (len(HISTOGRAMS[name]) + 1), 0.0)
+            if part[0] == 'sum':
+                total = value / _get_scale(name)
+            else:
+                counts[part[0]] = value
+            histograms[name, function] = (counts, total)
+        return counters, histograms
+
+    @staticmethod
+    def _make_key(name: str, function: str, *parts: str) -> str:
+        return ':'.join([CACHE_KEY_PREFIX, 'metrics', name, function, *parts])
+
+
+def _get_scale(name: str) -> int:
+    return 1000000 if name.endswith('_seconds') else 1
+
+
+def format_metrics(counters: Counters, histograms: Histograms) -> str:
+    """
+    The metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for name in COUNTERS:
+        values = sorted((function, value) for (metric, function), value in counters.items() if metric == name)
+        if not values:
+            continue
+        lines.append(f'# TYPE duc_{name}_total counter')
+        lines.extend(f'duc_{name}_total{{function="{function}"}} {value}' for function, value in values)
+    for name, buckets in HISTOGRAMS.items():
+        values = sorted((function, value) for (metric, function), value in histograms.items() if metric == name)
+        if not values:
+            continue
+        lines.append(f'# TYPE duc_{name} histogram')
+        for function, (counts, total) in values:
+            cumulative = 0
+            for bucket, count in zip([*map(str, buckets), '+Inf'], counts):
+                cumulative += count
+                lines.append(f'duc_{name}_bucket{{function="{function}",le="{bucket}"}} {cumulative}')
+            lines.append(f'duc_{name}_sum{{function="{function}"}} {total}')
+            lines.append(f'duc_{name}_count{{function="{function}"}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+_sink: Optional[MetricsSink] = None
+
+
+def get_metrics_sink() -> MetricsSink:
+    global _sink
+    if _sink is None:
+        if settings.METRICS_SINK:
+            _sink = import_string(settings.METRICS_SINK)(**settings.METRICS_OPTIONS)
+        else:
+            _sink = NullMetricsSink()
+    return _sink
+
+
+@receiver(setting_changed)
+def reset_metrics_sink(*, setting, **kwargs):
+    global _sink
+    if setting in ('DUC_METRICS_SINK', 'DUC_METRICS_OPTIONS'):
+        _sink = None
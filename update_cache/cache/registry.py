@@ -1,11 +1,36 @@
-from typing import Callable, List
+import logging
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING, Union
 
+from asgiref.sync import sync_to_async
 from django.core.cache.backends.base import BaseCache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
 from django.utils.timezone import now
 
-from update_cache.cache.cache import ACTIVE_VERSION, CACHE_KEY_PREFIX, CacheResult, EXPIRED_VERSION, missing
+from update_cache.cache.cache import (
+    CACHE_KEY_PREFIX, CacheResult, ENTRY_VERSION, EntryMeta, LEGACY_ACTIVE_VERSION, LEGACY_EXPIRED_VERSION, Tags,
+    increment_counter, make_tag_key, missing
+)
+from update_cache.cache.fingerprint import str_fingerprint
+from update_cache.cache.index import KeyIndex, get_key_index
+from update_cache.cache.invalidation import INVALIDATE_ALL, Invalidation, InvalidationBroadcaster, get_broadcaster
+from update_cache.cache.local import LocalCache
+from update_cache.cache.locks import CacheLock
+from update_cache.cache.metrics import BACKEND_SECONDS, PAYLOAD_BYTES, get_metrics_sink
+from update_cache.cache.serializers import Codec, Compressor, Serializer, get_codec, loads
+from update_cache.settings import settings
 from update_cache.utils import get_func_name
 
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING:
+    from update_cache.cache.update import CacheUpdateHandler
+
 
 class CachedFunction:
 
@@ -15,69 +40,682 @@ class CachedFunction:
 
     cache: BaseCache
 
-    def __init__(self, f: Callable, cache: BaseCache):
+    local_cache: Optional[LocalCache]
+
+    index: KeyIndex
+
+    key_prefix: str
+
+    key_func: Optional[Callable]
+
+    codec: Optional[Codec]
+
+    sidecar: bool
+
+    tags: Tags
+
+    update_handler: Optional['CacheUpdateHandler']
+
+    def __init__(self, f: Callable, cache: BaseCache, local_cache: Optional[LocalCache] = None,
+                 key_func: Optional[Callable] = None, serializer: Union[str, Serializer, None] = None,
+                 compressor: Union[str, Compressor, None] = None, sidecar: bool = True, tags: Tags = ()):
         self.f = f
         self.func_name = get_func_name(f)
         self.cache = cache
+        self.local_cache = local_cache
+        self.key_prefix = self._make_key()
+        self.generation_key = self._make_generation_key()
+        self.key_func = key_func
+        self.fingerprint = import_string(settings.ARGS_FINGERPRINT)
+        self.index = get_key_index(cache, self._make_key())
+        self.codec = get_codec(serializer, compressor)
+        # Store an EntryMeta record next to every entry
+        self.sidecar = sidecar
+        self.tags = (tags,) if isinstance(tags, str) else tags
+        self.update_handler = None
+        self._stamp = None
+        self._stamp_checked = None
+
+    def make_key(self, calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None) -> str:
+        if self.key_func is not None:
+            args, kwargs = calling_args or ((), {})
+            calling_args = self.key_func(*args, **kwargs)
+        return self.key_prefix + ':' + self.fingerprint(calling_args)
+
+    def _make_legacy_key(self, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]) -> str:
+        # Previous versions fingerprinted the string representation of the arguments
+        if self.key_func is not None:
+            args, kwargs = calling_args
+            calling_args = self.key_func(*args, **kwargs)
+        return self.key_prefix + ':' + str_fingerprint(calling_args)
+
+    def get(self, key, default=missing,
+            calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
+            versions: Optional[Dict[str, int]] = None) -> CacheResult:
+        """
+        The entry for the key, whether it has expired or not. The tags of the calling arguments are read along with
+        the entry; other tags of the entry take another read. The generation and the versions of the tags read are
+        added to `versions`, to write a result computed after the read with them.
+        """
+        if self.local_cache is not None:
+            self._sync_local_cache()
+            if (value := self._get_local(key)) != missing:
+                return value
+        version_keys = self._get_version_keys([calling_args])
+        started = time.perf_counter()
+        # The generation and the versions of the tags are read in the same call as the entry
+        values = self.cache.get_many([key] + version_keys, version=ENTRY_VERSION)
+        self._observe_backend(started)
+        read_versions = self._pop_versions(values, version_keys)
+        if versions is not None:
+            versions.update(read_versions)
+        if (value := loads(values.get(key, missing))) != missing:
+            self._check_versions({key: value}, read_versions)
+        if value == missing and settings.READ_LEGACY_ENTRIES:
+            value = self._get_legacy(key, calling_args)
+        if self.local_cache is not None:
+            return self._set_local(key, value, default)
+        return default if value == missing else value
+
+    async def aget(self, key, default=missing,
+                   calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None,
+                   versions: Optional[Dict[str, int]] = None) -> CacheResult:
+        if self.local_cache is not None:
+            await self._async_sync_local_cache()
+            if (value := self._get_local(key)) != missing:
+                return value
+        version_keys = self._get_version_keys([calling_args])
+        started = time.perf_counter()
+        values = await self.cache.aget_many([key] + version_keys, version=ENTRY_VERSION)
+        self._observe_backend(started)
+        read_versions = self._pop_versions(values, version_keys)
+        if versions is not None:
+            versions.update(read_versions)
+        if (value := loads(values.get(key, missing))) != missing:
+            await self._acheck_versions({key: value}, read_versions)
+        if value == missing and settings.READ_LEGACY_ENTRIES:
+            value = await sync_to_async(self._get_legacy)(key, calling_args)
+        if self.local_cache is not None:
+            return self._set_local(key, value, default)
+        return default if value == missing else value
+
+    def get_many(self, keys: List[str],
+                 calling_args_list: Optional[List[Tuple[Tuple[Any, ...], Dict[str, Any]]]] = None,
+                 versions: Optional[Dict[str, int]] = None) -> Dict[str, CacheResult]:
+        values = {}
+        if self.local_cache is not None:
+            self._sync_local_cache()
+            for key in keys:
+                if (value := self._get_local(key)) != missing:
+                    values[key] = value
+        version_keys = self._get_version_keys(calling_args_list or [])
+        started = time.perf_counter()
+        remote_values = self.cache.get_many([key for key in keys if key not in values] + version_keys,
+                                            version=ENTRY_VERSION)
+        self._observe_backend(started)
+        read_versions = self._pop_versions(remote_values, version_keys)
+        if versions is not None:
+            versions.update(read_versions)
+        remote_values = {key: loads(value) for key, value in remote_values.items()}
+        self._check_versions(remote_values, read_versions)
+        if settings.READ_LEGACY_ENTRIES:
+            missing_keys = {key for key in keys if key not in values and key not in remote_values}
+            legacy_keys = list(missing_keys)
+            if calling_args_list:
+                legacy_keys += [
+                    self._make_legacy_key(calling_args)
+                    for key, calling_args in zip(keys, calling_args_list) if key in missing_keys
+                ]
+            remote_values.update({
+                key: value for key, value in self._get_many_legacy(legacy_keys).items() if key in missing_keys
+            })
+        if self.local_cache is not None:
+            for key, value in remote_values.items():
+                self._set_local(key, value)
+        return {**values, **remote_values}
 
     def get_active(self, key, default=missing) -> CacheResult:
-        return self.cache.get(key, default, version=ACTIVE_VERSION)
+        value = self.get(key, missing)
+        return default if value == missing or value.has_expired else value
+
+    async def aget_active(self, key, default=missing) -> CacheResult:
+        value = await self.aget(key, missing)
+        return default if value == missing or value.has_expired else value
 
-    def set_active(self, key, value: CacheResult):
-        self.cache.set(key, value, timeout=None, version=ACTIVE_VERSION)
-        self._add_entry(key)
-        self.cache.delete(key, version=EXPIRED_VERSION)
+    def get_many_active(self, keys: List[str]) -> Dict[str, CacheResult]:
+        return {key: value for key, value in self.get_many(keys).items() if not value.has_expired}
 
     def get_expired(self, key, default=missing) -> CacheResult:
-        return self.cache.get(key, default, version=EXPIRED_VERSION)
+        value = self.get(key, missing)
+        return default if value == missing or not value.has_expired else value
+
+    async def aget_expired(self, key, default=missing) -> CacheResult:
+        value = await self.aget(key, missing)
+        return default if value == missing or not value.has_expired else value
+
+    def get_many_expired(self, keys: List[str]) -> Dict[str, CacheResult]:
+        return {key: value for key, value in self.get_many(keys).items() if value.has_expired}
+
+    def get_meta(self, key, default=missing) -> EntryMeta:
+        return self.get_many_meta([key]).get(key, default)
+
+    async def aget_meta(self, key, default=missing) -> EntryMeta:
+        meta_key = self._make_meta_key(key)
+        version_keys = self._get_version_keys([])
+        values = await self.cache.aget_many([meta_key] + version_keys, version=ENTRY_VERSION)
+        versions = self._pop_versions(values, version_keys)
+        await self._acheck_versions(values, versions)
+        return values.get(meta_key, default)
+
+    def get_many_meta(self, keys: List[str]) -> Dict[str, EntryMeta]:
+        meta_keys = {self._make_meta_key(key): key for key in keys}
+        version_keys = self._get_version_keys([])
+        values = self.cache.get_many(list(meta_keys) + version_keys, version=ENTRY_VERSION)
+        versions = self._pop_versions(values, version_keys)
+        self._check_versions(values, versions)
+        return {meta_keys[meta_key]: meta for meta_key, meta in values.items()}
+
+    def get_vary_headers(self, key, default=()) -> Tuple[str, ...]:
+        return self.cache.get(key, default, version=ENTRY_VERSION)
+
+    async def aget_vary_headers(self, key, default=()) -> Tuple[str, ...]:
+        return await self.cache.aget(key, default, version=ENTRY_VERSION)
+
+    def set_vary_headers(self, key, headers: Tuple[str, ...]):
+        self.cache.set(key, headers, timeout=None, version=ENTRY_VERSION)
+
+    async def aset_vary_headers(self, key, headers: Tuple[str, ...]):
+        await self.cache.aset(key, headers, timeout=None, version=ENTRY_VERSION)
+
+    def get_versions(self, calling_args_list: Iterable[Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]]]
+                     ) -> Dict[str, int]:
+        """
+        The generation and the versions of the tags of the calling arguments. Results are written with the versions
+        read before they were computed, so results computed during an invalidation are not written as current.
+        """
+        version_keys = self._get_version_keys(calling_args_list)
+        return self._pop_versions(self.cache.get_many(version_keys, version=ENTRY_VERSION), version_keys)
+
+    async def aget_versions(self, calling_args_list: Iterable[Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]]]
+                            ) -> Dict[str, int]:
+        version_keys = self._get_version_keys(calling_args_list)
+        return self._pop_versions(await self.cache.aget_many(version_keys, version=ENTRY_VERSION), version_keys)
+
+    def set_active(self, key, value: CacheResult, versions: Optional[Dict[str, int]] = None):
+        self._write(key, value, versions)
+        self.index.add(key)
+        if self.local_cache is not None:
+            self.local_cache.set(key, value)
+
+    async def aset_active(self, key, value: CacheResult, versions: Optional[Dict[str, int]] = None):
+        await self._awrite(key, value, versions)
+        await sync_to_async(self.index.add)(key)
+        if self.local_cache is not None:
+            self.local_cache.set(key, value)
+
+    def set_many_active(self, values: Dict[str, CacheResult], versions: Optional[Dict[str, int]] = None):
+        self._set_versions(list(values.values()), versions)
+        entries = self._make_entries(values)
+        started = time.perf_counter()
+        self.cache.set_many(entries, timeout=None, version=ENTRY_VERSION)
+        self._observe_backend(started)
+        self.index.add_many(values)
+        if self.local_cache is not None:
+            for key, value in values.items():
+                self.local_cache.set(key, value)
 
     def set_expired(self, key, value: CacheResult):
+        # Entries expire by their expiry time, expiring one now only needs a new expiry time
+        value.expires = now()
+        self._write(key, value)
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
+
+    async def aset_expired(self, key, value: CacheResult):
         value.expires = now()
-        self.cache.set(key, value, timeout=None, version=EXPIRED_VERSION)
-        self.cache.delete(key, version=ACTIVE_VERSION)
+        await self._awrite(key, value)
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
 
     def invalidate(self, key):
         value = self.get_active(key, missing)
         if value != missing:
             self.set_expired(key, value)
+        self._publish_invalidation(key)
 
     def delete(self, key):
-        self.cache.delete(key, version=ACTIVE_VERSION)
-        self.cache.delete(key, version=EXPIRED_VERSION)
-        self._delete_entry(key)
+        if self.sidecar:
+            self.cache.delete_many([key, self._make_meta_key(key)], version=ENTRY_VERSION)
+        else:
+            self.cache.delete(key, version=ENTRY_VERSION)
+        if settings.READ_LEGACY_ENTRIES:
+            self._delete_legacy([key])
+        self.index.delete(key)
+        if self.local_cache is not None:
+            self.local_cache.delete(key)
+        self._publish_invalidation(key)
+
+    def invalidate_all(self):
+        """
+        Invalidates all entries of the function at once, by moving the function to the next generation. Entries of
+        earlier generations are served as expired, and refreshed when they are requested. Entries that are not
+        requested again are removed by `cleanup`.
+        """
+        increment_version(self.cache, self.generation_key)
+        self.clear_local_cache()
+
+    def clear_local_cache(self):
+        if self.local_cache is not None:
+            self.local_cache.clear()
+            self._publish_invalidation(None)
+
+    def get_tags(self, calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None) -> Tuple[str, ...]:
+        """
+        The tags of the entry for the calling arguments. Tags computed from the calling arguments are unknown without
+        them.
+        """
+        if not callable(self.tags):
+            return tuple(self.tags)
+        if calling_args is None:
+            return ()
+        args, kwargs = calling_args
+        return tuple(self.tags(*args, **kwargs))
+
+    def cleanup(self, batch_size: int = 1000) -> int:
+        """
+        Deletes the entries of earlier generations, and removes the keys of entries that are gone from the index.
+        Returns the number of entries deleted.
+        """
+        generation = self._get_generation()
+        num_deleted = 0
+        keys = list(self)
+        for start in range(0, len(keys), batch_size):
+            batch = keys[start:start + batch_size]
+            # The metadata has the generation of the entry, only entries without metadata are loaded
+            values = self.get_many_meta(batch) if self.sidecar else {}
+            values.update(self.get_many([key for key in batch if key not in values]))
+            old_keys = [key for key, value in values.items() if value.generation != generation]
+            if old_keys:
+                self.cache.delete_many(old_keys + list(map(self._make_meta_key, old_keys)), version=ENTRY_VERSION)
+                num_deleted += len(old_keys)
+            self.index.delete_many(old_keys + [key for key in batch if key not in values])
+        return num_deleted
+
+    def mark_refresh_pending(self, key, timeout: int) -> bool:
+        return self.cache.add(self._make_refresh_key(key), True, timeout=timeout)
+
+    def clear_refresh_pending(self, key):
+        self.cache.delete(self._make_refresh_key(key))
+
+    def clear_many_refresh_pending(self, keys: List[str]):
+        self.cache.delete_many(list(map(self._make_refresh_key, keys)))
+
+    def lock(self, key, timeout: int) -> CacheLock:
+        return CacheLock(self.cache, ':'.join([key, 'lock']), timeout)
 
     def __iter__(self):
-        return iter(self._get_entries())
+        self._migrate_index()
+        return iter(self.index)
+
+    def count(self) -> int:
+        """
+        The number of keys in the index, without listing them where the index can count.
+        """
+        self._migrate_index()
+        return len(self.index)
+
+    def get_keys(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """
+        The keys from `start` to `stop` in the order of the index, without listing the other keys where the index can
+        slice.
+        """
+        self._migrate_index()
+        return self.index.slice(start, stop)
 
-    def _add_entry(self, key):
-        self.cache.set(self._make_key(), self._get_entries() | {key}, timeout=None)
+    def _migrate_index(self):
+        # Move keys from the index written by previous versions, which held all keys in a single set
+        if legacy_entries := self.cache.get(self._make_key()):
+            self.index.add_many(legacy_entries)
+            self.cache.delete(self._make_key())
 
-    def _delete_entry(self, key):
-        self.cache.set(self._make_key(), self._get_entries() - {key})
+    def migrate_legacy_entries(self) -> int:
+        """
+        Moves the entries written by previous versions, with separate active and expired versions and keys built from
+        the string representation of the arguments, to the current layout and keys. Returns the number of entries
+        moved.
+        """
+        keys = list(self)
+        existing = self.cache.get_many(keys, version=ENTRY_VERSION)
+        return len(self._get_many_legacy([key for key in keys if key not in existing]))
 
-    def _get_entries(self):
-        return self.cache.get(self._make_key()) or set()
+    def _get_legacy(self, key, calling_args: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None):
+        # Entries written by previous versions are moved to the current layout when they are read
+        keys = [key]
+        if calling_args is not None and (legacy_key := self._make_legacy_key(calling_args)) != key:
+            keys.append(legacy_key)
+        return self._get_many_legacy(keys).get(key, missing)
+
+    def _get_many_legacy(self, keys: List[str]) -> Dict[str, CacheResult]:
+        """
+        Moves the entries of previous versions under the given keys to the current layout, under the keys made from
+        their calling arguments. Returns the moved entries by their current keys.
+        """
+        if not keys:
+            return {}
+        values = self.cache.get_many(keys, version=LEGACY_ACTIVE_VERSION)
+        if expired_keys := [key for key in keys if key not in values]:
+            for key, value in self.cache.get_many(expired_keys, version=LEGACY_EXPIRED_VERSION).items():
+                value.expires = now()
+                values[key] = value
+        if not values:
+            return {}
+        legacy_keys = list(values)
+        values = {
+            (self.make_key(value.calling_args) if value.calling_args is not None else key): value
+            for key, value in values.items()
+        }
+        if rekeyed := [key for key in legacy_keys if key not in values]:
+            self.index.delete_many(rekeyed)
+        # Entries already written under the current keys are newer
+        for key in self.cache.get_many(list(values), version=ENTRY_VERSION):
+            del values[key]
+        if values:
+            self._set_versions(list(values.values()))
+            self.cache.set_many(self._make_entries(values), timeout=None, version=ENTRY_VERSION)
+            self.index.add_many(list(values))
+        self._delete_legacy(legacy_keys)
+        return values
+
+    def _delete_legacy(self, keys: List[str]):
+        self.cache.delete_many(keys, version=LEGACY_ACTIVE_VERSION)
+        self.cache.delete_many(keys, version=LEGACY_EXPIRED_VERSION)
+
+    def _dumps(self, value: CacheResult):
+        if self.codec is None:
+            return value
+        data = self.codec.dumps(value)
+        # The size is only known for encoded payloads, other values are pickled by the cache backend
+        get_metrics_sink().observe(PAYLOAD_BYTES, self.func_name, len(data))
+        return data
+
+    def _write(self, key, value: CacheResult, versions: Optional[Dict[str, int]] = None):
+        self._set_versions([value], versions)
+        if self.sidecar:
+            entries = self._make_entries({key: value})
+            started = time.perf_counter()
+            self.cache.set_many(entries, timeout=None, version=ENTRY_VERSION)
+        else:
+            data = self._dumps(value)
+            started = time.perf_counter()
+            self.cache.set(key, data, timeout=None, version=ENTRY_VERSION)
+        self._observe_backend(started)
+
+    async def _awrite(self, key, value: CacheResult, versions: Optional[Dict[str, int]] = None):
+        await self._aset_versions([value], versions)
+        if self.sidecar:
+            entries = self._make_entries({key: value})
+            started = time.perf_counter()
+            await self.cache.aset_many(entries, timeout=None, version=ENTRY_VERSION)
+        else:
+            data = self._dumps(value)
+            started = time.perf_counter()
+            await self.cache.aset(key, data, timeout=None, version=ENTRY_VERSION)
+        self._observe_backend(started)
+
+    def _observe_backend(self, started: float):
+        get_metrics_sink().observe(BACKEND_SECONDS, self.func_name, time.perf_counter() - started)
+
+    def _make_entries(self, values: Dict[str, CacheResult]) -> Dict[str, Any]:
+        # The metadata is written in the same call as the entry
+        entries = {key: self._dumps(value) for key, value in values.items()}
+        if self.sidecar:
+            entries.update({
+                self._make_meta_key(key): EntryMeta.from_result(
+                    value, len(entries[key]) if isinstance(entries[key], bytes) else None, settings.ENTRY_PREVIEWS
+                )
+                for key, value in values.items()
+            })
+        return entries
+
+    def _get_local(self, key):
+        value = self.local_cache.get(key, missing)
+        if value != missing and value.has_expired:
+            self.local_cache.delete(key)
+            return missing
+        return value
+
+    def _set_local(self, key, value, default=missing):
+        if value == missing:
+            return default
+        # Only entries that haven't expired are kept locally, expired entries are refreshed through the cache backend
+        if not value.has_expired:
+            self.local_cache.set(key, value)
+        return value
+
+    def _sync_local_cache(self):
+        if function_cache_registry.broadcaster is not None:
+            function_cache_registry.poll_invalidations()
+        elif self._stamp_due():
+            self._apply_stamp(self.cache.get(self._make_stamp_key()))
+
+    async def _async_sync_local_cache(self):
+        if function_cache_registry.broadcaster is not None:
+            if function_cache_registry.poll_due():
+                await sync_to_async(function_cache_registry.poll_invalidations)()
+        elif self._stamp_due():
+            self._apply_stamp(await self.cache.aget(self._make_stamp_key()))
+
+    def _stamp_due(self) -> bool:
+        checked = time.monotonic()
+        if self._stamp_checked is not None and checked - self._stamp_checked < settings.LOCAL_CACHE_CHECK_INTERVAL:
+            return False
+        self._stamp_checked = checked
+        return True
+
+    def _apply_stamp(self, stamp):
+        # Other processes change the stamp when they invalidate or delete entries, drop our local entries when
+        # it has changed
+        if stamp != self._stamp:
+            self.local_cache.clear()
+            self._stamp = stamp
+
+    def _publish_invalidation(self, key):
+        if self.local_cache is None:
+            return
+        if function_cache_registry.broadcaster is not None:
+            function_cache_registry.broadcaster.publish(self.func_name, key)
+            return
+        self._stamp = uuid.uuid4().hex
+        self.cache.set(self._make_stamp_key(), self._stamp, timeout=None)
 
     def _make_key(self):
         return ':'.join([CACHE_KEY_PREFIX, self.func_name])
 
+    def _get_generation(self) -> int:
+        return self.cache.get(self.generation_key, 0, version=ENTRY_VERSION)
+
+    def _get_version_keys(self, calling_args_list: Iterable[Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]]]
+                          ) -> List[str]:
+        if not self.tags:
+            return [self.generation_key]
+        tags = {tag for calling_args in calling_args_list for tag in self.get_tags(calling_args)}
+        return [self.generation_key] + sorted(map(make_tag_key, tags))
+
+    @staticmethod
+    def _pop_versions(values: Dict[str, Any], version_keys: List[str]) -> Dict[str, int]:
+        # Versions that are not stored are 0
+        return {key: values.pop(key, 0) for key in version_keys}
+
+    def _check_versions(self, values: Dict[str, Any], versions: Dict[str, int]):
+        if unread_keys := self._get_unread_version_keys(values, versions):
+            versions.update(self._pop_versions(self.cache.get_many(unread_keys, version=ENTRY_VERSION), unread_keys))
+        self._expire_outdated(values, versions)
+
+    async def _acheck_versions(self, values: Dict[str, Any], versions: Dict[str, int]):
+        if unread_keys := self._get_unread_version_keys(values, versions):
+            versions.update(self._pop_versions(await self.cache.aget_many(unread_keys, version=ENTRY_VERSION),
+                                               unread_keys))
+        self._expire_outdated(values, versions)
+
+    @staticmethod
+    def _get_unread_version_keys(values: Dict[str, Any], versions: Dict[str, int]) -> List[str]:
+        tag_keys = {make_tag_key(tag) for value in values.values() for tag in (value.tags or ())}
+        return sorted(tag_keys - versions.keys())
+
+    def _expire_outdated(self, values: Dict[str, Any], versions: Dict[str, int]):
+        # Entries of another generation were invalidated by invalidate_all, entries with other versions of their tags
+        # by invalidate_tag. Versions that are lost, like evicted counters, also invalidate the entries
+        for value in values.values():
+            if value.has_expired:
+                continue
+            if value.generation != versions[self.generation_key] or any(
+                versions[make_tag_key(tag)] != version for tag, version in (value.tags or {}).items()
+            ):
+                value.expires = now()
+
+    def _set_versions(self, values: List[CacheResult], versions: Optional[Dict[str, int]] = None):
+        # Versions that were not read before the values were computed are read now
+        versions = dict(versions or {})
+        version_keys = self._get_version_keys(value.calling_args for value in values)
+        if unread_keys := [key for key in version_keys if key not in versions]:
+            versions.update(self._pop_versions(self.cache.get_many(unread_keys, version=ENTRY_VERSION), unread_keys))
+        self._stamp_versions(values, versions)
+
+    async def _aset_versions(self, values: List[CacheResult], versions: Optional[Dict[str, int]] = None):
+        versions = dict(versions or {})
+        version_keys = self._get_version_keys(value.calling_args for value in values)
+        if unread_keys := [key for key in version_keys if key not in versions]:
+            versions.update(self._pop_versions(await self.cache.aget_many(unread_keys, version=ENTRY_VERSION),
+                                               unread_keys))
+        self._stamp_versions(values, versions)
+
+    def _stamp_versions(self, values: List[CacheResult], versions: Dict[str, int]):
+        for value in values:
+            value.generation = versions[self.generation_key]
+            value.tags = {tag: versions[make_tag_key(tag)] for tag in self.get_tags(value.calling_args)} or None
+
+    def _make_generation_key(self):
+        return ':'.join([CACHE_KEY_PREFIX, self.func_name, 'generation'])
+
+    def _make_stamp_key(self):
+        return ':'.join([CACHE_KEY_PREFIX, self.func_name, 'stamp'])
+
+    @staticmethod
+    def _make_meta_key(key):
+        return ':'.join([key, 'meta'])
+
+    @staticmethod
+    def _make_refresh_key(key):
+        return ':'.join([key, 'refresh'])
+
+
+def increment_version(cache: BaseCache, key: str):
+    # Versions that were lost start over at a random value, not at a version entries may already have been written with
+    increment_counter(cache, key, version=ENTRY_VERSION, start=random.getrandbits(62))
+
 
 class FunctionCacheRegistry:
 
-    cached_functions: List[CachedFunction]
+    # By function name
+    cached_functions: Dict[str, CachedFunction]
 
     def __init__(self):
-        self.cached_functions = []
+        self.cached_functions = {}
+        self._broadcaster = missing
+        self._polled = None
+        self._poll_lock = threading.Lock()
 
-    def add(self, f: Callable, cache: BaseCache) -> CachedFunction:
-        if not (cached_function := next(filter(lambda c: c.func_name == get_func_name(f),
-                                               self.cached_functions), None)):
-            cached_function = CachedFunction(f, cache)
-            self.cached_functions.append(cached_function)
+    def add(self, f: Callable, cache: BaseCache, local_cache: Optional[LocalCache] = None,
+            key_func: Optional[Callable] = None, serializer: Union[str, Serializer, None] = None,
+            compressor: Union[str, Compressor, None] = None, sidecar: bool = True, tags: Tags = ()) -> CachedFunction:
+        func_name = get_func_name(f)
+        if (cached_function := self.cached_functions.get(func_name)) is None:
+            cached_function = CachedFunction(f, cache, local_cache, key_func, serializer, compressor, sidecar, tags)
+            self.cached_functions[func_name] = cached_function
         return cached_function
 
+    def get(self, func_name: str) -> Optional[CachedFunction]:
+        return self.cached_functions.get(func_name)
+
+    def resolve(self, key: str) -> Optional[CachedFunction]:
+        """
+        The cached function the cache key belongs to. Keys of functions hold the name of the function; keys of views
+        don't, those are looked up in the indexes of the functions.
+        """
+        prefix, _, rest = key.partition(':')
+        if prefix == CACHE_KEY_PREFIX and (cached_function := self.get(rest.split(':', 1)[0])) is not None:
+            return cached_function
+        return next((cached_function for cached_function in self if key in cached_function.index), None)
+
+    def invalidate_tag(self, tag: str) -> int:
+        """
+        Invalidates the entries of all cached functions with the tag, by moving the tag to its next version in every
+        cache backend of a function with tags. Entries with an earlier version of the tag are served as expired, and
+        refreshed when they are requested. Only functions registered in this process are known, the modules of tagged
+        functions must be imported. Returns the number of cache backends the tag was moved in.
+        """
+        tagged_functions = [cached_function for cached_function in self if cached_function.tags]
+        if not tagged_functions:
+            logger.warning(f'No cached functions with tags are registered, tag {tag} is not invalidated')
+        caches = {id(cached_function.cache): cached_function.cache for cached_function in tagged_functions}
+        for cache in caches.values():
+            increment_version(cache, make_tag_key(tag))
+        for cached_function in tagged_functions:
+            cached_function.clear_local_cache()
+        return len(caches)
+
+    @property
+    def broadcaster(self) -> Optional[InvalidationBroadcaster]:
+        if self._broadcaster is missing:
+            self._broadcaster = get_broadcaster()
+        return self._broadcaster
+
+    def reset_broadcaster(self):
+        self._broadcaster = missing
+        self._polled = None
+
+    def poll_due(self) -> bool:
+        return self._polled is None or time.monotonic() - self._polled >= settings.LOCAL_CACHE_CHECK_INTERVAL
+
+    def poll_invalidations(self):
+        if not self.poll_due():
+            return
+        # Another thread is already polling
+        if not self._poll_lock.acquire(blocking=False):
+            return
+        try:
+            self._polled = time.monotonic()
+            self.apply_invalidations(self.broadcaster.poll())
+        finally:
+            self._poll_lock.release()
+
+    def apply_invalidations(self, invalidations: List[Invalidation]):
+        for func_name, key in invalidations:
+            if (func_name, key) == INVALIDATE_ALL:
+                for cached_function in self:
+                    if cached_function.local_cache is not None:
+                        cached_function.local_cache.clear()
+                continue
+            cached_function = self.get(func_name)
+            if cached_function is None or cached_function.local_cache is None:
+                continue
+            if key is None:
+                cached_function.local_cache.clear()
+            else:
+                cached_function.local_cache.delete(key)
+
     def __iter__(self):
-        return iter(self.cached_functions)
+        return iter(list(self.cached_functions.values()))
 
 
 function_cache_registry = FunctionCacheRegistry()
+
+
+def invalidate_tag(tag: str) -> int:
+    return function_cache_registry.invalidate_tag(tag)
+
+
+@receiver(setting_changed)
+def reset_broadcaster(*, setting, **kwargs):
+    if setting in ('DUC_INVALIDATION_BROADCASTER', 'DUC_INVALIDATION_OPTIONS'):
+        function_cache_registry.reset_broadcaster()
@@ -0,0 +1,240 @@
+import base64
+import datetime
+import json
+import pickle
+import zlib
+from typing import Any, Callable, Dict, Optional, Protocol, Union
+
+from django.conf import settings as django_settings
+from update_cache.cache.cache import CacheResult
+from update_cache.cache.views import CachedResponse
+from update_cache.settings import settings
+
+
+class Serializer(Protocol):
+
+    # Stored in the header byte of a payload, so payloads are decoded by the serializer that encoded them. The
+    # built-in serializers use 1 to 3, custom serializers can use 4 to 15.
+    id: int
+
+    def dumps(self, value: CacheResult) -> bytes:
+        ...
+
+    def loads(self, data: bytes) -> CacheResult:
+        ...
+
+
+class Compressor(Protocol):
+
+    id: int
+
+    # Payloads smaller than this are not compressed
+    min_size: int
+
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    def decompress(self, data: bytes) -> bytes:
+        ...
+
+
+class PickleSerializer:
+
+    id = 1
+
+    def __init__(self, protocol: int = 5):
+        self.protocol = protocol
+
+    def dumps(self, value: CacheResult) -> bytes:
+        return pickle.dumps(value, protocol=self.protocol)
+
+    def loads(self, data: bytes) -> CacheResult:
+        return pickle.loads(data)
+
+
+# Last field of the records, the kind of result
+RESULT_RECORD = 0
+RESPONSE_RECORD = 1
+
+
+def _to_record(value: CacheResult, encode_bytes: Optional[Callable[[bytes], Any]] = None) -> list:
+    if isinstance(value.result, CachedResponse):
+        # Responses of cached views are encoded as plain data
+        result, kind = value.result.to_record(encode_bytes), RESPONSE_RECORD
+    else:
+        result, kind = value.result, RESULT_RECORD
+    return [result, value.expires.timestamp(), value.calling_args, value.delta, value.generation, value.tags, kind]
+
+
+def _from_record(record: list, decode_bytes: Optional[Callable[[Any], bytes]] = None) -> CacheResult:
+    result, expires, calling_args, delta, generation, tags, kind = record
+    if kind == RESPONSE_RECORD:
+        result = CachedResponse.from_record(result, decode_bytes)
+    return CacheResult(
+        result=result,
+        # Expiry times are naive local times without time zone support, like the times they are compared with
+        expires=datetime.datetime.fromtimestamp(expires, tz=datetime.timezone.utc if django_settings.USE_TZ else None),
+        calling_args=calling_args,
+        delta=delta,
+        generation=generation,
+        tags=tags
+    )
+
+
+class MsgpackSerializer:
+    """
+    Compact binary encoding; results are limited to the types msgpack supports, and tuples are decoded as lists.
+    """
+
+    id = 2
+
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def dumps(self, value: CacheResult) -> bytes:
+        return self.msgpack.packb(_to_record(value))
+
+    def loads(self, data: bytes) -> CacheResult:
+        return _from_record(self.msgpack.unpackb(data))
+
+
+class JSONSerializer:
+    """
+    JSON encoding, with orjson when it is installed; results are limited to JSON types, and tuples are decoded as
+    lists.
+    """
+
+    id = 3
+
+    def __init__(self):
+        try:
+            import orjson
+            self.dumps_json, self.loads_json = orjson.dumps, orjson.loads
+        except ImportError:
+            self.dumps_json = lambda value: json.dumps(value, separators=(',', ':')).encode()
+            self.loads_json = json.loads
+
+    def dumps(self, value: CacheResult) -> bytes:
+        return self.dumps_json(_to_record(value, _encode_base64))
+
+    def loads(self, data: bytes) -> CacheResult:
+        return _from_record(self.loads_json(data), base64.b64decode)
+
+
+def _encode_base64(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii')
+
+
+class ZlibCompressor:
+
+    id = 1
+
+    def __init__(self, level: int = 6, min_size: int = 1024):
+        self.level = level
+        self.min_size = min_size
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class LZ4Compressor:
+
+    id = 2
+
+    def __init__(self, min_size: int = 1024):
+        import lz4.frame
+        self.lz4 = lz4.frame
+        self.min_size = min_size
+
+    def compress(self, data: bytes) -> bytes:
+        return self.lz4.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.lz4.decompress(data)
+
+
+SERIALIZERS = {
+    'pickle': PickleSerializer,
+    'msgpack': MsgpackSerializer,
+    'json': JSONSerializer,
+}
+
+COMPRESSORS = {
+    'zlib': ZlibCompressor,
+    'lz4': LZ4Compressor,
+}
+
+
+class Codec:
+    """
+    Encodes cache results as a header byte followed by the serialized, optionally compressed, result. The header holds
+    the ids of the serializer (high four bits) and the compressor (low four bits, 0 for none).
+    """
+
+    serializer: Serializer
+
+    compressor: Optional[Compressor]
+
+    def __init__(self, serializer: Serializer, compressor: Optional[Compressor] = None):
+        self.serializer = serializer
+        self.compressor = compressor
+
+    def dumps(self, value: CacheResult) -> bytes:
+        data = self.serializer.dumps(value)
+        if self.compressor is not None and len(data) >= self.compressor.min_size:
+            return bytes([self.serializer.id << 4 | self.compressor.id]) + self.compressor.compress(data)
+        return bytes([self.serializer.id << 4]) + data
+
+
+_serializers: Dict[int, Serializer] = {}
+
+_compressors: Dict[int, Compressor] = {}
+
+
+def loads(value: Any) -> CacheResult:
+    """
+    Decodes a payload written by any codec; values stored without a codec are returned as is.
+    """
+    if not isinstance(value, bytes):
+        return value
+    serializer_id, compressor_id = value[0] >> 4, value[0] & 0x0f
+    data = value[1:]
+    if compressor_id:
+        data = _get_compressor(compressor_id).decompress(data)
+    return _get_serializer(serializer_id).loads(data)
+
+
+def _get_serializer(serializer_id: int) -> Serializer:
+    if (serializer := _serializers.get(serializer_id)) is None:
+        serializer_class = next(c for c in SERIALIZERS.values() if c.id == serializer_id)
+        serializer = _serializers[serializer_id] = serializer_class()
+    return serializer
+
+
+def _get_compressor(compressor_id: int) -> Compressor:
+    if (compressor := _compressors.get(compressor_id)) is None:
+        compressor_class = next(c for c in COMPRESSORS.values() if c.id == compressor_id)
+        compressor = _compressors[compressor_id] = compressor_class()
+    return compressor
+
+
+def get_codec(serializer: Union[str, Serializer, None] = None,
+              compressor: Union[str, Compressor, None] = None) -> Optional[Codec]:
+    serializer = serializer or settings.SERIALIZER
+    compressor = compressor or settings.COMPRESSOR
+    if serializer is None and compressor is None:
+        # Cache results are handed to the cache backend as they are
+        return None
+    if serializer is None or isinstance(serializer, str):
+        serializer = SERIALIZERS[serializer or 'pickle']()
+    if isinstance(compressor, str):
+        compressor = COMPRESSORS[compressor]()
+    # Custom serializers and compressors decode their own payloads
+    _serializers.setdefault(serializer.id, serializer)
+    if compressor is not None:
+        _compressors.setdefault(compressor.id, compressor)
+    return Codec(serializer, compressor)
@@ -0,0 +1,88 @@
+import logging
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from update_cache.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+# Events
+HIT = 'hit'
+STALE_HIT = 'stale_hit'
+EARLY_REFRESH = 'early_refresh'
+MISS = 'miss'
+WAIT = 'wait'
+WAIT_TIMEOUT = 'wait_timeout'
+
+MESSAGES = {
+    HIT: 'Cache hit for %s',
+    STALE_HIT: 'Cache for %s has expired, delegating refresh',
+    EARLY_REFRESH: 'Delegating early function call for %s',
+    MISS: 'Getting live result for %s',
+    WAIT: 'Waiting for live result for %s',
+    WAIT_TIMEOUT: 'Getting live result for %s after waiting',
+}
+
+
+@dataclass
+class TraceEvent:
+
+    name: str
+    function: str
+    # None for events about several keys
+    key: Optional[str] = None
+    fields: Dict[str, Any] = field(default_factory=dict)
+
+
+TraceHook = Callable[[TraceEvent], None]
+
+
+def log_event(event: TraceEvent):
+    """
+    The default trace hook, logs the event at INFO level.
+    """
+    message = MESSAGES.get(event.name, event.name + ' for %s')
+    logger.info(message, event.key if event.key is not None else f'{event.fields.get("count")} keys')
+
+
+class Tracer:
+    """
+    Hands a sample of the events of cached calls to the trace hook. Callers check `rate` before building an event, so
+    calls that are not traced only pay for an attribute lookup.
+    """
+
+    rate: float
+
+    hook: Optional[TraceHook]
+
+    def __init__(self):
+        # Configured on the first event, the settings may not be loaded yet
+        self.rate = -1
+        self.hook = None
+
+    def configure(self):
+        self.rate = float(settings.TRACE_SAMPLE_RATE or 0)
+        self.hook = import_string(settings.TRACE_HOOK) if self.rate else None
+
+    def emit(self, name: str, function: str, key: Optional[str] = None, **fields):
+        if self.rate < 0:
+            self.configure()
+        if self.rate < 1 and random.random() >= self.rate:
+            return
+        self.hook(TraceEvent(name, function, key, fields))
+
+
+tracer = Tracer()
+
+
+@receiver(setting_changed)
+def reset_tracer(*, setting, **kwargs):
+    if setting in ('DUC_TRACE_SAMPLE_RATE', 'DUC_TRACE_HOOK'):
+        tracer.configure()
@@ -1,15 +1,31 @@
+import asyncio
 import datetime
+import inspect
 import logging
-from typing import Any, Optional
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.core.cache import DEFAULT_CACHE_ALIAS
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone, translation
 from django.utils.timezone import now
 
-from update_cache.brokers import Broker, default_broker, get_broker
-from update_cache.cache.cache import CacheResult, missing
+from update_cache.brokers import Broker, SyncBroker, call_many, default_broker, get_broker, get_view_broker
+from update_cache.cache.cache import CacheResult, make_view_cache_key, make_view_headers_key, missing
+from update_cache.cache.locks import AsyncSingleFlight, SingleFlight, backoff_delays
+from update_cache.cache.metrics import COMPUTE_SECONDS, HITS, MISSES, REFRESHES, STALE_HITS, get_metrics_sink
 from update_cache.cache.registry import CachedFunction
-from update_cache.cache.views import should_cache_view
+from update_cache.cache.tracing import EARLY_REFRESH, HIT, MISS, STALE_HIT, WAIT, WAIT_TIMEOUT, tracer
+from update_cache.cache.views import (
+    USER_HEADERS, CachedResponse, ViewRequest, conditional_request, get_not_modified_response, get_vary_headers,
+    set_validators, should_cache_view
+)
+from update_cache.settings import settings
 
 
 logger = logging.getLogger(__name__)
@@ -25,30 +41,110 @@ class CacheUpdateHandler:
 
     cache_args: bool
 
+    single_flight: bool
+
+    early_refresh: Optional[float]
+
+    jitter: float
+
     def __init__(self, cached_function: CachedFunction, timeout: int = DEFAULT_TIMEOUT,
-                 backend: str = DEFAULT_CACHE_ALIAS, broker: Optional[Broker] = None):
+                 backend: str = DEFAULT_CACHE_ALIAS, broker: Optional[Broker] = None, single_flight: bool = False,
+                 early_refresh: Union[bool, float] = False, jitter: float = 0):
         self.cached_function = cached_function
         self.timeout = 300 if timeout == DEFAULT_TIMEOUT else timeout
         self.backend = backend
         self.broker = broker
+        self.single_flight = single_flight
+        # The beta of early expiration, True is the default of 1
+        self.early_refresh = float(early_refresh) if early_refresh else None
+        self.jitter = jitter
+        self._in_flight = SingleFlight()
+        self._async_in_flight = AsyncSingleFlight()
+        self._refreshing = set()
+        # The event loop only keeps weak references to tasks, keep the refresh tasks until they are done
+        self._refresh_tasks = set()
 
     def get_result(self, key: str, *args, **kwargs) -> Any:
         raise NotImplementedError()
 
+    async def aget_result(self, key: str, *args, **kwargs) -> Any:
+        raise NotImplementedError()
+
     def execute(self, *args, **kwargs):
         return self.cached_function.f(*args, **kwargs)
 
-    def save_result(self, key: str, result: Any, *args, **kwargs):
-        result = CacheResult(
+    async def aexecute(self, *args, **kwargs):
+        return await self.cached_function.f(*args, **kwargs)
+
+    def compute(self, key: str, versions: Optional[Dict[str, int]], *args, **kwargs) -> Any:
+        """
+        Computes and saves the result. The result is saved with the versions read before, by the lookup that missed;
+        without them they are read before computing, so a result computed during an invalidation is saved as stale.
+        """
+        if versions is None:
+            versions = self.cached_function.get_versions([(args, kwargs)])
+        started = time.perf_counter()
+        live_result = self.execute(*args, **kwargs)
+        self.save_result(key, live_result, (args, kwargs), time.perf_counter() - started, versions)
+        return live_result
+
+    async def acompute(self, key: str, versions: Optional[Dict[str, int]], *args, **kwargs) -> Any:
+        if versions is None:
+            versions = await self.cached_function.aget_versions([(args, kwargs)])
+        started = time.perf_counter()
+        live_result = await self.aexecute(*args, **kwargs)
+        await self.asave_result(key, live_result, (args, kwargs), time.perf_counter() - started, versions)
+        return live_result
+
+    def make_result(self, result: Any, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                    delta: Optional[float] = None) -> CacheResult:
+        if delta is not None:
+            get_metrics_sink().observe(COMPUTE_SECONDS, self.cached_function.func_name, delta)
+        timeout = self.timeout
+        if self.jitter:
+            # Shorten the timeout by a random part, so results computed together don't expire together
+            timeout *= 1 - self.jitter * random.random()
+        return CacheResult(
             result=result,
-            expires=now() + datetime.timedelta(seconds=self.timeout),
-            calling_args=(args, kwargs) if self.cache_args else None
+            expires=now() + datetime.timedelta(seconds=timeout),
+            calling_args=calling_args if self.cache_args else None,
+            delta=delta
         )
-        self.cached_function.set_active(key, result)
+
+    def save_result(self, key: str, result: Any, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                    delta: Optional[float] = None, versions: Optional[Dict[str, int]] = None):
+        self.cached_function.set_active(key, self.make_result(result, calling_args, delta), versions)
+
+    async def asave_result(self, key: str, result: Any, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                           delta: Optional[float] = None, versions: Optional[Dict[str, int]] = None):
+        await self.cached_function.aset_active(key, self.make_result(result, calling_args, delta), versions)
+
+    def dispatch_refresh_task(self, key: str, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]):
+        """
+        Refreshes the result in a task on the event loop, one refresh per key at a time.
+        """
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self.arefresh(key, calling_args))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(lambda t: self._refresh_done(key, t))
+
+    async def arefresh(self, key: str, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]):
+        await sync_to_async(self.get_broker())(self.cached_function.f, self.timeout, calling_args, self.backend)
+
+    def _refresh_done(self, key: str, task: asyncio.Task):
+        self._refreshing.discard(key)
+        self._refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f'Refreshing {key} failed', exc_info=task.exception())
 
     def get_broker(self) -> Any:
         raise NotImplementedError()
 
+    def record(self, name: str, value: int = 1):
+        get_metrics_sink().increment(name, self.cached_function.func_name, value)
+
 
 class DefaultUpdateHandler(CacheUpdateHandler):
 
@@ -57,30 +153,197 @@ class DefaultUpdateHandler(CacheUpdateHandler):
     cache_args = True
 
     def get_result(self, key: str, *args, **kwargs) -> Any:
-        logger.info(f'Retrieving active cache for {key}')
-        result = self.cached_function.get_active(key, missing)
+        versions = {}
+        result = self.cached_function.get(key, missing, (args, kwargs), versions)
         if result != missing:
-            # See if the result has expired
-            if result.has_expired:
-                logger.info(f'Active cache for {key} has expired')
-                # Make it the expired version
-                self.cached_function.set_expired(key, result)
-            return result.result
+            if not result.has_expired:
+                if self.early_refresh and result.should_refresh_early(self.early_refresh):
+                    # Refresh before the result expires, so refreshes of hot keys are spread over time
+                    if tracer.rate:
+                        tracer.emit(EARLY_REFRESH, self.cached_function.func_name, key)
+                    self.record(REFRESHES)
+                    self.get_broker()(self.cached_function.f, self.timeout, (args, kwargs), self.backend)
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return result.result
 
-        # Next, see if there is an expired version
-        logger.info(f'Retrieving expired cache for {key}')
-        result = self.cached_function.get_expired(key, missing)
-        if result != missing:
-            # Delegate the function call, delete and then return the expired version
-            logger.info(f'Delegating function call for {key}')
+            # Delegate the function call and return the expired version
+            if tracer.rate:
+                tracer.emit(STALE_HIT, self.cached_function.func_name, key)
+            self.record(STALE_HITS)
+            self.record(REFRESHES)
             self.get_broker()(self.cached_function.f, self.timeout, (args, kwargs), self.backend)
             return result.result
 
         # No version found in cache, get live result and cache it
-        logger.info(f'Getting live result for {key}')
-        live_result = self.execute(*args, **kwargs)
-        self.save_result(key, live_result, *args, **kwargs)
-        return live_result
+        self.record(MISSES)
+        if self.single_flight:
+            return self._in_flight.do(key, self.get_single_flight_result, key, versions, *args, **kwargs)
+        if tracer.rate:
+            tracer.emit(MISS, self.cached_function.func_name, key)
+        return self.compute(key, versions, *args, **kwargs)
+
+    def get_single_flight_result(self, key: str, versions: Dict[str, int], *args, **kwargs) -> Any:
+        lock = self.cached_function.lock(key, settings.LOCK_TIMEOUT)
+        if lock.acquire():
+            try:
+                # The previous lock holder may have stored the result just before we got the lock
+                versions = {}
+                result = self.cached_function.get(key, missing, (args, kwargs), versions)
+                if result != missing:
+                    return result.result
+                if tracer.rate:
+                    tracer.emit(MISS, self.cached_function.func_name, key)
+                return self.compute(key, versions, *args, **kwargs)
+            finally:
+                lock.release()
+
+        # Another process is computing the result, wait for it to show up
+        if tracer.rate:
+            tracer.emit(WAIT, self.cached_function.func_name, key)
+        result = self.wait_for_result(key)
+        if result != missing:
+            return result.result
+
+        # The lock holder did not finish in time, get live result ourselves
+        if tracer.rate:
+            tracer.emit(WAIT_TIMEOUT, self.cached_function.func_name, key)
+        return self.compute(key, versions, *args, **kwargs)
+
+    def wait_for_result(self, key: str) -> Any:
+        for delay in backoff_delays(settings.LOCK_WAIT_TIMEOUT):
+            time.sleep(delay)
+            result = self.cached_function.get(key, missing)
+            if result != missing:
+                return result
+        return missing
+
+    async def aget_result(self, key: str, *args, **kwargs) -> Any:
+        versions = {}
+        result = await self.cached_function.aget(key, missing, (args, kwargs), versions)
+        if result != missing:
+            if not result.has_expired:
+                if self.early_refresh and result.should_refresh_early(self.early_refresh):
+                    if tracer.rate:
+                        tracer.emit(EARLY_REFRESH, self.cached_function.func_name, key)
+                    self.record(REFRESHES)
+                    self.dispatch_refresh_task(key, (args, kwargs))
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return result.result
+
+            # Refresh in the background and return the expired version
+            if tracer.rate:
+                tracer.emit(STALE_HIT, self.cached_function.func_name, key)
+            self.record(STALE_HITS)
+            self.record(REFRESHES)
+            self.dispatch_refresh_task(key, (args, kwargs))
+            return result.result
+
+        # No version found in cache, get live result (shared by all tasks asking for it) and cache it
+        self.record(MISSES)
+        return await self._async_in_flight.do(key, self.aget_live_result, key, versions, *args, **kwargs)
+
+    async def aget_live_result(self, key: str, versions: Dict[str, int], *args, **kwargs) -> Any:
+        if not self.single_flight:
+            if tracer.rate:
+                tracer.emit(MISS, self.cached_function.func_name, key)
+            return await self.acompute(key, versions, *args, **kwargs)
+
+        lock = self.cached_function.lock(key, settings.LOCK_TIMEOUT)
+        if await lock.aacquire():
+            try:
+                versions = {}
+                result = await self.cached_function.aget(key, missing, (args, kwargs), versions)
+                if result != missing:
+                    return result.result
+                if tracer.rate:
+                    tracer.emit(MISS, self.cached_function.func_name, key)
+                return await self.acompute(key, versions, *args, **kwargs)
+            finally:
+                await lock.arelease()
+
+        # Another process is computing the result, wait for it to show up
+        if tracer.rate:
+            tracer.emit(WAIT, self.cached_function.func_name, key)
+        for delay in backoff_delays(settings.LOCK_WAIT_TIMEOUT):
+            await asyncio.sleep(delay)
+            result = await self.cached_function.aget(key, missing)
+            if result != missing:
+                return result.result
+
+        # The lock holder did not finish in time, get live result ourselves
+        if tracer.rate:
+            tracer.emit(WAIT_TIMEOUT, self.cached_function.func_name, key)
+        return await self.acompute(key, versions, *args, **kwargs)
+
+    async def arefresh(self, key: str, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]):
+        if isinstance(self.get_broker(), SyncBroker):
+            # Refresh on the event loop instead of blocking the request
+            args, kwargs = calling_args
+            await self.acompute(key, None, *args, **kwargs)
+        else:
+            await super().arefresh(key, calling_args)
+
+    def get_many_results(self, calling_args_list: List[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+                         max_workers: Optional[int] = None) -> List[Any]:
+        keys = [self.cached_function.make_key(calling_args) for calling_args in calling_args_list]
+        calling_args_by_key = dict(zip(keys, calling_args_list))
+        results = {}
+
+        expired_keys = []
+        versions = {}
+        for key, result in self.cached_function.get_many(list(calling_args_by_key),
+                                                         list(calling_args_by_key.values()), versions).items():
+            results[key] = result.result
+            if result.has_expired:
+                expired_keys.append(key)
+
+        if tracer.rate:
+            tracer.emit(HIT, self.cached_function.func_name, count=len(results) - len(expired_keys))
+        self.record(HITS, len(results) - len(expired_keys))
+        self.record(STALE_HITS, len(expired_keys))
+
+        # Delegate one refresh for all expired results
+        if expired_keys:
+            self.record(REFRESHES, len(expired_keys))
+            if tracer.rate:
+                tracer.emit(STALE_HIT, self.cached_function.func_name, count=len(expired_keys))
+            call_many(self.get_broker(), self.cached_function.f, self.timeout,
+                      [calling_args_by_key[key] for key in expired_keys], self.backend)
+
+        # Get live results for the keys without any version and cache them
+        missing_keys = [key for key in calling_args_by_key if key not in results]
+        if missing_keys:
+            self.record(MISSES, len(missing_keys))
+            if tracer.rate:
+                tracer.emit(MISS, self.cached_function.func_name, count=len(missing_keys))
+            live_results = self.execute_many([calling_args_by_key[key] for key in missing_keys], max_workers)
+            self.cached_function.set_many_active({
+                key: self.make_result(live_result, calling_args_by_key[key], delta)
+                for key, (live_result, delta) in zip(missing_keys, live_results)
+            }, versions)
+            results.update((key, live_result) for key, (live_result, delta) in zip(missing_keys, live_results))
+
+        return [results[key] for key in keys]
+
+    def execute_many(self, calling_args_list: List[Tuple[Tuple[Any, ...], Dict[str, Any]]],
+                     max_workers: Optional[int] = None) -> List[Tuple[Any, float]]:
+        """
+        Results for the argument tuples, with the time each took to compute.
+        """
+        if not max_workers or len(calling_args_list) == 1:
+            return list(map(self._timed_execute, calling_args_list))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self._timed_execute, calling_args_list))
+
+    def _timed_execute(self, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]) -> Tuple[Any, float]:
+        args, kwargs = calling_args
+        started = time.perf_counter()
+        result = self.execute(*args, **kwargs)
+        return result, time.perf_counter() - started
 
     def get_broker(self) -> Any:
         return get_broker(self.broker or default_broker)
@@ -90,27 +353,195 @@ class ViewUpdateHandler(CacheUpdateHandler):
 
     cache_args = False
 
+    stale_ttl: Optional[int]
+
+    encodings: Sequence[str]
+
+    key_headers: Tuple[str, ...]
+
+    key_params: Optional[Sequence[str]]
+
+    def __init__(self, cached_function: CachedFunction, timeout: int = DEFAULT_TIMEOUT,
+                 backend: str = DEFAULT_CACHE_ALIAS, broker: Optional[Broker] = None,
+                 stale_ttl: Optional[int] = None, encodings: Sequence[str] = (), key_headers: Sequence[str] = (),
+                 key_params: Optional[Sequence[str]] = None):
+        super().__init__(cached_function, timeout, backend, broker)
+        # Seconds an expired response is served while it is refreshed, None to never serve expired responses
+        self.stale_ttl = stale_ttl
+        self.encodings = encodings
+        self.key_headers = tuple(key_headers)
+        # The query parameters the response depends on, None for all
+        self.key_params = key_params
+
+    def make_key(self, request: HttpRequest) -> str:
+        return make_view_cache_key(request, request.method, self.get_key_headers(request), self.key_params)
+
+    async def amake_key(self, request: HttpRequest) -> str:
+        return make_view_cache_key(request, request.method, await self.aget_key_headers(request), self.key_params)
+
+    def get_key_headers(self, request: HttpRequest) -> Tuple[str, ...]:
+        # The headers learned from the Vary header of the last response for the URL
+        return self.cached_function.get_vary_headers(make_view_headers_key(request, self.key_params))
+
+    async def aget_key_headers(self, request: HttpRequest) -> Tuple[str, ...]:
+        return await self.cached_function.aget_vary_headers(make_view_headers_key(request, self.key_params))
+
+    def learn_key(self, request: HttpRequest, response: HttpResponse) -> str:
+        """
+        Stores the headers the response varies on for the URL, and returns the key of the response.
+        """
+        headers = get_vary_headers(response)
+        headers_key = make_view_headers_key(request, self.key_params)
+        if self.cached_function.get_vary_headers(headers_key) != headers:
+            self.cached_function.set_vary_headers(headers_key, headers)
+        return make_view_cache_key(request, request.method, headers, self.key_params)
+
+    async def alearn_key(self, request: HttpRequest, response: HttpResponse) -> str:
+        headers = get_vary_headers(response)
+        headers_key = make_view_headers_key(request, self.key_params)
+        if await self.cached_function.aget_vary_headers(headers_key) != headers:
+            await self.cached_function.aset_vary_headers(headers_key, headers)
+        return make_view_cache_key(request, request.method, headers, self.key_params)
+
     def get_result(self, key: str, *args, **kwargs) -> Any:
-        logger.info(f'Retrieving active cache for {key}')
-        result = self.cached_function.get_active(key, missing)
-        if result != missing and not result.has_expired:
-            return result.result
+        if conditional_request(args[0]):
+            # Answer conditional requests from the validators, without loading the response
+            meta = self.cached_function.get_meta(key, missing)
+            if meta != missing and not meta.has_expired and (response := get_not_modified_response(args[0], meta)):
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return response
 
-        # No active version found in cache, get live result and cache it
-        logger.info(f'Getting live result for {key}')
-        live_result = self.execute(*args, **kwargs)
-        self.save_result(key, live_result, *args, **kwargs)
-        return live_result
+        versions = {}
+        result = self.cached_function.get(key, missing, versions=versions)
+        if result != missing:
+            if not result.has_expired:
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return self.make_response(result.result, args[0])
+            if self.is_servable_stale(result) and USER_HEADERS.isdisjoint(
+                    key_headers := self.get_key_headers(args[0])):
+                self.record(STALE_HITS)
+                self.record(REFRESHES)
+                # Delegate the refresh and return the expired version
+                if tracer.rate:
+                    tracer.emit(STALE_HIT, self.cached_function.func_name, key)
+                refresh_args = self.make_refresh_args(args, kwargs, key_headers)
+                self.get_broker()(self.cached_function.f, self.timeout, refresh_args, self.backend)
+                return self.make_response(result.result, args[0])
+
+        # No servable version found in cache, or the response is specific to the user: get live result and cache it
+        self.record(MISSES)
+        if tracer.rate:
+            tracer.emit(MISS, self.cached_function.func_name, key)
+        return self.compute(key, versions, *args, **kwargs)
+
+    async def aget_result(self, key: str, *args, **kwargs) -> Any:
+        if conditional_request(args[0]):
+            meta = await self.cached_function.aget_meta(key, missing)
+            if meta != missing and not meta.has_expired and (response := get_not_modified_response(args[0], meta)):
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return response
+
+        versions = {}
+        result = await self.cached_function.aget(key, missing, versions=versions)
+        if result != missing:
+            if not result.has_expired:
+                if tracer.rate:
+                    tracer.emit(HIT, self.cached_function.func_name, key)
+                self.record(HITS)
+                return self.make_response(result.result, args[0])
+            if self.is_servable_stale(result) and USER_HEADERS.isdisjoint(
+                    key_headers := await self.aget_key_headers(args[0])):
+                self.record(STALE_HITS)
+                self.record(REFRESHES)
+                if tracer.rate:
+                    tracer.emit(STALE_HIT, self.cached_function.func_name, key)
+                refresh_args = self.make_refresh_args(args, kwargs, key_headers)
+                self.dispatch_refresh_task(key, refresh_args)
+                return self.make_response(result.result, args[0])
+
+        # No servable version found in cache, get live result and cache it
+        self.record(MISSES)
+        if tracer.rate:
+            tracer.emit(MISS, self.cached_function.func_name, key)
+        return await self.acompute(key, versions, *args, **kwargs)
+
+    def is_servable_stale(self, result: CacheResult) -> bool:
+        return self.stale_ttl is not None and now() < result.expires + datetime.timedelta(seconds=self.stale_ttl)
+
+    @staticmethod
+    def make_refresh_args(args: Tuple[Any, ...], kwargs: Dict[str, Any],
+                          headers: Sequence[str] = ()) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+        # Brokers may run the refresh in another process, pass the request as plain data
+        request, *args = args
+        return (ViewRequest.from_request(request, headers), *args), kwargs
 
-    def save_result(self, key: str, result: Any, *args, **kwargs):
+    def refresh(self, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]]):
+        """
+        Renders the view again for a request built from the refresh arguments and caches the response.
+        """
+        (view_request, *args), kwargs = calling_args
+        request = view_request.to_request()
+        with translation.override(view_request.language), timezone.override(view_request.timezone):
+            key = self.make_key(request)
+            if inspect.iscoroutinefunction(self.cached_function.f):
+                async_to_sync(self.acompute)(key, None, request, *args, **kwargs)
+                return
+            response = self.compute(key, None, request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                # Saved by the post render callback
+                response.render()
+
+    def get_broker(self) -> Any:
+        return get_view_broker(self.broker or default_broker)
+
+    @staticmethod
+    def make_response(result: Any, request: HttpRequest) -> HttpResponse:
+        # Entries written by previous versions hold the response itself
+        if isinstance(result, CachedResponse):
+            return result.to_response(request)
+        return result
+
+    def save_result(self, key: str, result: Any, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                    delta: Optional[float] = None, versions: Optional[Dict[str, int]] = None):
         # First arg should be request
-        request = list(args).pop(0)
+        request = calling_args[0][0]
         if not should_cache_view(request, result):
             return
 
-        _save_result = lambda r: super(ViewUpdateHandler, self).save_result(key, r, *args, **kwargs)
+        def _save_result(r):
+            set_validators(r)
+            if self.key_headers:
+                patch_vary_headers(r, self.key_headers)
+            # The response may vary on other headers than the key was made for
+            super(ViewUpdateHandler, self).save_result(
+                self.learn_key(request, r), CachedResponse.from_response(r, self.encodings), calling_args, delta,
+                versions
+            )
 
         if hasattr(result, "render") and callable(result.render):
             result.add_post_render_callback(_save_result)
         else:
-            super().save_result(key, result,  *args, **kwargs)
+            _save_result(result)
+
+    async def asave_result(self, key: str, result: Any, calling_args: Tuple[Tuple[Any, ...], Dict[str, Any]],
+                           delta: Optional[float] = None, versions: Optional[Dict[str, int]] = None):
+        request = calling_args[0][0]
+        if not should_cache_view(request, result):
+            return
+
+        if hasattr(result, "render") and callable(result.render):
+            # Post render callbacks can't be awaited, render the response here instead
+            await sync_to_async(result.render)()
+        set_validators(result)
+        if self.key_headers:
+            patch_vary_headers(result, self.key_headers)
+        await super().asave_result(
+            await self.alearn_key(request, result), CachedResponse.from_response(result, self.encodings), calling_args,
+            delta, versions
+        )
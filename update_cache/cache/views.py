@@ -1,6 +1,52 @@
-from django.http import HttpRequest
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.conf import settings as django_settings
+from django.http import HttpRequest, QueryDict
+from django.http.cookie import parse_cookie
 from django.http.response import HttpResponse
-from django.utils.cache import has_vary_header
+from django.utils.cache import (
+    cc_delim_re, get_conditional_response, has_vary_header, patch_vary_headers, set_response_etag
+)
+from django.utils.http import http_date, parse_http_date_safe
+from django.utils.text import compress_string
+from django.utils.timezone import get_current_timezone_name
+from django.utils.translation import get_language
+
+from update_cache.cache.cache import EntryMeta
+from update_cache.settings import settings
+
+
+# Content codings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 200
+
+# Response headers not stored with cached responses: hop-by-hop headers, headers of the single response and cookies.
+# Cookies are never stored, so a session or CSRF cookie isn't handed to other users.
+UNCACHED_HEADERS = frozenset([
+    'connection',
+    'content-length',
+    'date',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'set-cookie',
+    'te',
+    'trailer',
+    'transfer-encoding',
+    'upgrade',
+    'x-request-id',
+])
+
+
+# Request headers that identify the user. Responses that vary on them are not refreshed outside of the request, the
+# refresh can't act as the user
+USER_HEADERS = frozenset(['authorization', 'cookie'])
 
 
 def should_cache_view(request: HttpRequest, response: HttpResponse):
@@ -23,4 +69,212 @@ def should_cache_view(request: HttpRequest, response: HttpResponse):
     if "private" in response.get("Cache-Control", ()):
         return False
 
+    # Don't cache a response that varies on more than request headers
+    if has_vary_header(response, "*"):
+        return False
+
     return True
+
+
+def get_vary_headers(response: HttpResponse) -> Tuple[str, ...]:
+    """
+    The request headers the response varies on, lowercased and sorted.
+    """
+    if not response.has_header('Vary'):
+        return ()
+    return tuple(sorted(set(header.lower() for header in cc_delim_re.split(response['Vary']) if header)))
+
+
+@dataclass
+class CachedResponse:
+    """
+    The parts of a response needed to rebuild it, with the content compressed ahead for the given content codings.
+    The headers in `UNCACHED_HEADERS` and `DUC_UNCACHED_HEADERS` are left out.
+    """
+
+    status_code: int
+    headers: List[Tuple[str, str]]
+    content: bytes
+    # Content per content coding
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @classmethod
+    def from_response(cls, response: HttpResponse, encodings: Sequence[str] = ()) -> 'CachedResponse':
+        content = response.content
+        encoded = {}
+        if len(content) >= MIN_COMPRESS_SIZE and not response.has_header('Content-Encoding'):
+            for encoding in encodings:
+                compressed = compress_content(content, encoding)
+                if len(compressed) < len(content):
+                    encoded[encoding] = compressed
+        uncached_headers = UNCACHED_HEADERS.union(header.lower() for header in settings.UNCACHED_HEADERS)
+        return cls(
+            status_code=response.status_code,
+            headers=[(header, value) for header, value in response.items() if header.lower() not in uncached_headers],
+            content=content,
+            encoded=encoded
+        )
+
+    def to_record(self, encode_bytes: Optional[Callable[[bytes], Any]] = None) -> list:
+        """
+        The response as plain data, for serializers that only encode basic types. Serializers without a binary type
+        pass a function to encode the content.
+        """
+        encode_bytes = encode_bytes or bytes
+        return [
+            self.status_code,
+            [[header, value] for header, value in self.headers],
+            encode_bytes(self.content),
+            {encoding: encode_bytes(content) for encoding, content in self.encoded.items()}
+        ]
+
+    @classmethod
+    def from_record(cls, record: list, decode_bytes: Optional[Callable[[Any], bytes]] = None) -> 'CachedResponse':
+        decode_bytes = decode_bytes or bytes
+        status_code, headers, content, encoded = record
+        return cls(
+            status_code=status_code,
+            headers=[(header, value) for header, value in headers],
+            content=decode_bytes(content),
+            encoded={encoding: decode_bytes(data) for encoding, data in encoded.items()}
+        )
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self._get_header('ETag')
+
+    @property
+    def last_modified(self) -> Optional[int]:
+        if (last_modified := self._get_header('Last-Modified')) is not None:
+            return parse_http_date_safe(last_modified)
+        return None
+
+    def _get_header(self, name: str) -> Optional[str]:
+        return next((value for header, value in self.headers if header.lower() == name.lower()), None)
+
+    def to_response(self, request: HttpRequest) -> HttpResponse:
+        response = HttpResponse(status=self.status_code)
+        for header, value in self.headers:
+            response[header] = value
+
+        if self.encoded:
+            patch_vary_headers(response, ('Accept-Encoding',))
+            encoding = next(filter(lambda e: e in self.encoded and accepts_encoding(request, e), ENCODINGS), None)
+            if encoding is not None:
+                response.content = self.encoded[encoding]
+                response['Content-Encoding'] = encoding
+                response['Content-Length'] = str(len(response.content))
+                # The compressed content is not byte for byte the same as the original content
+                if (etag := response.get('ETag')) and not etag.startswith('W/'):
+                    response['ETag'] = 'W/' + etag
+                return response
+
+        response.content = self.content
+        return response
+
+
+@dataclass
+class ViewRequest:
+    """
+    The parts of a request a cached view is keyed on, to build a request for refreshing the view outside of the
+    original request.
+    """
+
+    url: str
+    path_info: str
+    method: str
+    language: Optional[str] = None
+    timezone: Optional[str] = None
+    # The request headers the view is keyed on
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_request(cls, request: HttpRequest, headers: Sequence[str] = ()) -> 'ViewRequest':
+        return cls(
+            url=request.build_absolute_uri(),
+            path_info=request.path_info,
+            method=request.method,
+            language=getattr(request, 'LANGUAGE_CODE', get_language()) if django_settings.USE_I18N else None,
+            timezone=get_current_timezone_name() if django_settings.USE_TZ else None,
+            headers={header: request.headers[header] for header in headers if header in request.headers}
+        )
+
+    def to_request(self) -> HttpRequest:
+        parts = urlsplit(self.url)
+        request = RefreshRequest(parts.scheme)
+        request.method = self.method
+        request.path = parts.path
+        request.path_info = self.path_info
+        request.META = {
+            'HTTP_HOST': parts.netloc,
+            'QUERY_STRING': parts.query,
+            'REQUEST_METHOD': self.method,
+            'SERVER_NAME': parts.hostname,
+            'SERVER_PORT': str(parts.port or (443 if parts.scheme == 'https' else 80)),
+        }
+        for header, value in self.headers.items():
+            name = header.upper().replace('-', '_')
+            request.META[name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name] = value
+        request.GET = QueryDict(parts.query)
+        request.COOKIES = parse_cookie(self.headers.get('cookie', ''))
+        if self.language:
+            request.LANGUAGE_CODE = self.language
+        if apps.is_installed('django.contrib.auth'):
+            from django.contrib.auth.models import AnonymousUser
+
+            # Refreshed responses are served to everyone
+            request.user = AnonymousUser()
+        return request
+
+
+class RefreshRequest(HttpRequest):
+    """
+    Request without a client, used to refresh cached views.
+    """
+
+    def __init__(self, scheme: str = 'http'):
+        super().__init__()
+        self._scheme = scheme
+
+    def _get_scheme(self) -> str:
+        return self._scheme
+
+
+def set_validators(response: HttpResponse):
+    """
+    Sets a strong ETag and Last-Modified on the response, unless the view has set them.
+    """
+    if not response.has_header('ETag'):
+        set_response_etag(response)
+    if not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date()
+
+
+def conditional_request(request: HttpRequest) -> bool:
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def get_not_modified_response(request: HttpRequest, meta: EntryMeta) -> Optional[HttpResponse]:
+    """
+    A 304 response when the request's validators match the entry's, None otherwise.
+    """
+    response = HttpResponse()
+    if meta.etag:
+        response['ETag'] = meta.etag
+    if meta.last_modified:
+        response['Last-Modified'] = http_date(meta.last_modified)
+    response = get_conditional_response(request, etag=meta.etag, last_modified=meta.last_modified, response=response)
+    return response if response.status_code == 304 else None
+
+
+def compress_content(content: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return compress_string(content)
+    if encoding == 'br':
+        import brotli
+        return brotli.compress(content)
+    raise ValueError(f'Unsupported content coding: {encoding}')
+
+
+def accepts_encoding(request: HttpRequest, encoding: str) -> bool:
+    return bool(re.search(r'\b%s\b' % encoding, request.META.get('HTTP_ACCEPT_ENCODING', '')))
@@ -1,49 +1,93 @@
+import inspect
 import logging
 from functools import wraps
+from typing import Callable, Optional, Sequence, Union
 
 from django.core.cache import caches, DEFAULT_CACHE_ALIAS
 from django.core.cache.backends.base import DEFAULT_TIMEOUT
 
 from update_cache.brokers import Broker, default_broker
-from update_cache.cache.cache import make_cache_key, make_view_cache_key
+from update_cache.cache.cache import Tags
+from update_cache.cache.local import LocalCache
 from update_cache.cache.registry import function_cache_registry
+from update_cache.cache.serializers import Compressor, Serializer
 from update_cache.cache.update import DefaultUpdateHandler, ViewUpdateHandler
 
 
 logger = logging.getLogger(__name__)
 
 
-def cache_function(timeout: int = DEFAULT_TIMEOUT, backend: str = DEFAULT_CACHE_ALIAS, broker: Broker = default_broker):
+def cache_function(timeout: int = DEFAULT_TIMEOUT, backend: str = DEFAULT_CACHE_ALIAS, broker: Broker = default_broker,
+                   single_flight: bool = False, local_cache: Union[bool, LocalCache] = False,
+                   key_func: Optional[Callable] = None, early_refresh: Union[bool, float] = False,
+                   jitter: float = 0, serializer: Union[str, Serializer, None] = None,
+                   compressor: Union[str, Compressor, None] = None, sidecar: bool = True, tags: Tags = ()):
 
     cache = caches[backend]
 
     def decorator(f):
 
-        f.cache = function_cache_registry.add(f, cache)
-        update_handler = DefaultUpdateHandler(f.cache, timeout, backend, broker)
+        f.cache = function_cache_registry.add(f, cache, get_local_cache(local_cache), key_func, serializer, compressor,
+                                              sidecar, tags)
+        update_handler = DefaultUpdateHandler(f.cache, timeout, backend, broker, single_flight, early_refresh, jitter)
+        f.cache.update_handler = update_handler
+
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def wrapped_func(*args, **kwargs):
+                cache_key = f.cache.make_key((args, kwargs))
+                return await update_handler.aget_result(cache_key, *args, **kwargs)
+
+            return wrapped_func
 
         @wraps(f)
         def wrapped_func(*args, **kwargs):
-            cache_key = make_cache_key(f, (args, kwargs))
+            cache_key = f.cache.make_key((args, kwargs))
             return update_handler.get_result(cache_key, *args, **kwargs)
 
+        def many(calling_args_list, max_workers=None):
+            return update_handler.get_many_results(list(calling_args_list), max_workers)
+
+        wrapped_func.many = many
         return wrapped_func
 
     return decorator
 
 
-def cache_view(timeout: int = DEFAULT_TIMEOUT, backend: str = DEFAULT_CACHE_ALIAS):
+def get_local_cache(local_cache: Union[bool, LocalCache]):
+    if local_cache is True:
+        return LocalCache()
+    if local_cache is False:
+        return None
+    return local_cache
+
+
+def cache_view(timeout: int = DEFAULT_TIMEOUT, backend: str = DEFAULT_CACHE_ALIAS, broker: Broker = default_broker,
+               stale_ttl: Optional[int] = None, serializer: Union[str, Serializer, None] = None,
+               compressor: Union[str, Compressor, None] = None, encodings: Sequence[str] = (),
+               key_headers: Sequence[str] = (), key_params: Optional[Sequence[str]] = None):
 
     cache = caches[backend]
 
     def decorator(view):
 
-        view.cache = function_cache_registry.add(view, cache)
-        update_handler = ViewUpdateHandler(view.cache, timeout, backend)
+        view.cache = function_cache_registry.add(view, cache, serializer=serializer, compressor=compressor,
+                                                 sidecar=True)
+        update_handler = ViewUpdateHandler(view.cache, timeout, backend, broker, stale_ttl, encodings, key_headers,
+                                           key_params)
+        view.cache.update_handler = update_handler
+
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped_view(request, *args, **kwargs):
+                cache_key = await update_handler.amake_key(request)
+                return await update_handler.aget_result(cache_key, request, *args, **kwargs)
+
+            return wrapped_view
 
         @wraps(view)
         def wrapped_view(request, *args, **kwargs):
-            cache_key = make_view_cache_key(request, request.method)
+            cache_key = update_handler.make_key(request)
             return update_handler.get_result(cache_key, request, *args, **kwargs)
 
         return wrapped_view
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from update_cache.cache.registry import function_cache_registry
+
+
+class Command(BaseCommand):
+    help = 'Delete the cache entries invalidated by invalidate_all, and drop the keys of deleted entries from the index'
+
+    def handle(self, *args, **options):
+        num_deleted = 0
+        for cached_function in function_cache_registry:
+            num_deleted += cached_function.cleanup()
+        entry_bit = 'cache entry' if num_deleted == 1 else 'cache entries'
+        self.stdout.write(f'Deleted {num_deleted} {entry_bit}')
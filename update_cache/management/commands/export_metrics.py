@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from update_cache.cache.metrics import format_metrics, get_metrics_sink
+
+
+class Command(BaseCommand):
+    help = 'Print the metrics of the metrics sink in the Prometheus text format'
+
+    def handle(self, *args, **options):
+        if (collect := getattr(get_metrics_sink(), 'collect', None)) is None:
+            raise CommandError('The metrics sink does not collect metrics')
+        self.stdout.write(format_metrics(*collect()), ending='')
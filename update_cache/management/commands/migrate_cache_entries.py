@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from update_cache.cache.registry import function_cache_registry
+
+
+class Command(BaseCommand):
+    help = 'Move the cache entries written by previous versions to the current layout'
+
+    def handle(self, *args, **options):
+        num_migrated = 0
+        for cached_function in function_cache_registry:
+            num_migrated += cached_function.migrate_legacy_entries()
+        entry_bit = 'cache entry' if num_migrated == 1 else 'cache entries'
+        self.stdout.write(f'Migrated {num_migrated} {entry_bit}')
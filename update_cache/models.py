@@ -1,44 +1,61 @@
 import operator
+from typing import Iterable, List
 
 from django.db import models
 from django.db.models.query import BaseIterable
 
-from update_cache.cache.cache import missing
+from update_cache.cache.cache import EntryMeta, make_preview, missing
 from update_cache.cache.registry import function_cache_registry
 
 
 class CacheEntryIterable(BaseIterable):
+    """
+    Cache entries sorted by function, then in the order of their index. Only the entries within the limits of the
+    query are listed and loaded, functions before the offset are skipped by the size of their index.
+    """
 
     def __iter__(self):
-        for cached_function in list(sorted(function_cache_registry, key=operator.attrgetter('func_name'))):
-            for key in list(sorted(cached_function)):
-                active_value = cached_function.get_active(key, missing)
-                expired_value = cached_function.get_expired(key, missing)
-                if active_value != missing:
-                    value = str(active_value.result)
-                    calling_args = str(active_value.calling_args)
-                    expires = active_value.expires
-                    has_expired = active_value.has_expired
-                elif expired_value != missing:
-                    value = str(expired_value.result)
-                    calling_args = str(expired_value.calling_args)
-                    expires = expired_value.expires
-                    has_expired = True
-                else:
-                    value = ''
-                    calling_args = ''
-                    expires = None
-                    has_expired = False
-                cache_entry = CacheEntry(
-                    cache_key=key,
-                    function=cached_function.func_name,
-                    calling_args=calling_args,
-                    value=value,
-                    expires=expires,
-                    has_expired=has_expired
-                )
-                cache_entry._cached_function = cached_function
-                yield cache_entry
+        query = self.queryset.query
+        start, stop = query.low_mark, query.high_mark
+        position = 0
+        for cached_function in sorted(function_cache_registry, key=operator.attrgetter('func_name')):
+            if stop is not None and position >= stop:
+                break
+            if position + (size := cached_function.count()) <= start:
+                position += size
+                continue
+            keys = cached_function.get_keys(max(start - position, 0), None if stop is None else stop - position)
+            position += size
+            yield from self.load_entries(cached_function, keys)
+
+    @classmethod
+    def load_entries(cls, cached_function, keys):
+        metas = cached_function.get_many_meta(keys)
+        # Entries without metadata, written by previous versions or by functions without a sidecar, are loaded
+        if missing_keys := [key for key in keys if key not in metas]:
+            metas.update({
+                key: EntryMeta.from_result(value, preview=True)
+                for key, value in cached_function.get_many(missing_keys).items()
+            })
+        return [cls.make_entry(cached_function, key, metas.get(key, missing)) for key in keys]
+
+    @staticmethod
+    def make_entry(cached_function, key, meta):
+        if meta != missing:
+            cache_entry = CacheEntry(
+                cache_key=key,
+                function=cached_function.func_name,
+                calling_args=meta.calling_args,
+                value=meta.preview,
+                result_type=meta.result_type,
+                size=meta.size,
+                expires=meta.expires,
+                has_expired=meta.has_expired
+            )
+        else:
+            cache_entry = CacheEntry(cache_key=key, function=cached_function.func_name)
+        cache_entry._cached_function = cached_function
+        return cache_entry
 
 
 class CacheEntryQuerySet(models.QuerySet):
@@ -51,7 +68,29 @@ class CacheEntryQuerySet(models.QuerySet):
         if self._result_cache is not None:
             return len(self._result_cache)
 
-        return len(list(self._iterable_class(self)))
+        # Counted from the indexes, without loading the entries
+        total = sum(cached_function.count() for cached_function in function_cache_registry)
+        if self.query.high_mark is not None:
+            total = min(total, self.query.high_mark)
+        return max(total - self.query.low_mark, 0)
+
+    def exists(self):
+        return self.count() > 0
+
+    def get_entries(self, cache_keys: Iterable[str]) -> List['CacheEntry']:
+        """
+        The entries for the cache keys, without listing other entries. Keys that are not in the index of a cached
+        function are left out.
+        """
+        keys_by_function = {}
+        for key in dict.fromkeys(cache_keys):
+            if (cached_function := function_cache_registry.resolve(key)) is not None and key in cached_function.index:
+                keys_by_function.setdefault(cached_function, []).append(key)
+        return [
+            entry
+            for cached_function, keys in keys_by_function.items()
+            for entry in self._iterable_class.load_entries(cached_function, keys)
+        ]
 
 
 class CacheEntry(models.Model):
@@ -64,6 +103,10 @@ class CacheEntry(models.Model):
 
     value = models.TextField()
 
+    result_type = models.CharField(max_length=255, blank=True)
+
+    size = models.PositiveIntegerField(null=True)
+
     expires = models.DateTimeField(null=True)
 
     has_expired = models.BooleanField(default=False)
@@ -85,3 +128,16 @@ class CacheEntry(models.Model):
     @property
     def cached_function(self):
         return self._cached_function
+
+    def load_value(self):
+        """
+        Replaces the preview of the result by the full result, loaded from the cache, and fills in the calling arguments
+        when no preview of them was stored.
+        """
+        if self._cached_function is None:
+            return
+        cached_value = self._cached_function.get(self.cache_key, missing)
+        if cached_value != missing:
+            self.value = str(cached_value.result)
+            if not self.calling_args and cached_value.calling_args is not None:
+                self.calling_args = make_preview(cached_value.calling_args)
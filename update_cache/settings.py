@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from django.conf import settings as django_settings
 
@@ -6,7 +6,27 @@ from django.conf import settings as django_settings
 default_settings = {
     "DEFAULT_BROKER": 'update_cache.brokers.SyncBroker',
     "DEFAULT_VIEW_BROKER": 'update_cache.brokers.SyncViewBroker',
-    "CACHE_MODULES": []
+    "CACHE_MODULES": [],
+    "LOCK_TIMEOUT": 30,
+    "LOCK_WAIT_TIMEOUT": 10,
+    "REFRESH_PENDING_TIMEOUT": 360,
+    "BROKER_MAX_WORKERS": 4,
+    "BROKER_MAX_QUEUE": 1000,
+    "BROKER_OVERFLOW": 'drop',
+    "LOCAL_CACHE_CHECK_INTERVAL": 1,
+    "INVALIDATION_BROADCASTER": None,
+    "INVALIDATION_OPTIONS": {},
+    "INDEX_SHARDS": 64,
+    "ARGS_FINGERPRINT": 'update_cache.cache.fingerprint.fingerprint',
+    "READ_LEGACY_ENTRIES": False,
+    "SERIALIZER": None,
+    "COMPRESSOR": None,
+    "UNCACHED_HEADERS": [],
+    "ENTRY_PREVIEWS": False,
+    "METRICS_SINK": None,
+    "METRICS_OPTIONS": {},
+    "TRACE_SAMPLE_RATE": 0,
+    "TRACE_HOOK": 'update_cache.cache.tracing.log_event'
 }
 
 
@@ -18,6 +38,46 @@ class Settings:
 
     CACHE_MODULES: List[str]
 
+    LOCK_TIMEOUT: int
+
+    LOCK_WAIT_TIMEOUT: int
+
+    REFRESH_PENDING_TIMEOUT: int
+
+    BROKER_MAX_WORKERS: int
+
+    BROKER_MAX_QUEUE: int
+
+    BROKER_OVERFLOW: str
+
+    LOCAL_CACHE_CHECK_INTERVAL: float
+
+    INVALIDATION_BROADCASTER: Optional[str]
+
+    INVALIDATION_OPTIONS: Dict[str, Any]
+
+    INDEX_SHARDS: int
+
+    ARGS_FINGERPRINT: str
+
+    READ_LEGACY_ENTRIES: bool
+
+    SERIALIZER: Optional[str]
+
+    COMPRESSOR: Optional[str]
+
+    UNCACHED_HEADERS: List[str]
+
+    ENTRY_PREVIEWS: bool
+
+    METRICS_SINK: Optional[str]
+
+    METRICS_OPTIONS: Dict[str, Any]
+
+    TRACE_SAMPLE_RATE: float
+
+    TRACE_HOOK: str
+
     def __getattr__(self, item):
         return getattr(django_settings, 'DUC_' + item, default_settings.get(item))
 
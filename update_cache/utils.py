@@ -1,6 +1,14 @@
 import inspect
-from typing import Callable
+from typing import Any, Callable
+
+from asgiref.sync import async_to_sync
 
 
 def get_func_name(f: Callable) -> str:
     return '{}.{}'.format(inspect.getmodule(f).__name__, f.__qualname__)
+
+
+def call_function(f: Callable, *args, **kwargs) -> Any:
+    if inspect.iscoroutinefunction(f):
+        return async_to_sync(f)(*args, **kwargs)
+    return f(*args, **kwargs)
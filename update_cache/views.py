@@ -0,0 +1,12 @@
+from django.http import Http404, HttpRequest, HttpResponse
+
+from update_cache.cache.metrics import format_metrics, get_metrics_sink
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    The metrics of the metrics sink in the Prometheus text format, for sinks that collect metrics.
+    """
+    if (collect := getattr(get_metrics_sink(), 'collect', None)) is None:
+        raise Http404('The metrics sink does not collect metrics')
+    return HttpResponse(format_metrics(*collect()), content_type='text/plain; version=0.0.4; charset=utf-8')